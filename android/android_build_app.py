@@ -12,27 +12,42 @@ And the build result will be copied to ../out/android.
 import optparse
 import os
 import shutil
-import subprocess
 import sys
-
-def MoveApkToOut(apk_path, base_dir, app_name):
-  destination = os.path.join(base_dir, 'out', 'android')
-  apk_destination = os.path.join(destination, app_name + '.apk')
-
-  if not os.path.exists(destination):
-    os.makedirs(destination)
-
-  # Remove previous Build result.
-  if os.path.exists(apk_destination):
-    os.remove(apk_destination)
-
-  # Move the apk in xwalk_app_template to out.
-  shutil.move(apk_path, apk_destination)
-  return 0
-
-
-def BuildApp(base_dir, app_name):
-  xwalk_app_template_path = os.path.join(base_dir, 'android', 'xwalk_app_template')
+import tempfile
+
+import android.build_cache
+import android.build_output
+import android.build_telemetry
+import android.process_runner
+
+def MoveApkToOut(apks, base_dir, app_name, version=None):
+  """Publishes apks, a dict of APK paths by architecture, to out/android and
+  removes them from the template dir.
+  """
+  output = android.build_output.BuildOutput(
+      os.path.join(base_dir, 'out', 'android'))
+  published = output.Publish(app_name, apks, version)
+  for apk_path in apks.values():
+    os.remove(apk_path)
+  return published
+
+
+def BuildApp(base_dir, app_name, xwalk_app_template_path=None, cache=None,
+             telemetry=None, src_dir=None, arch=None, runner=None):
+  """Builds app_name with the template at xwalk_app_template_path, and
+  publishes its APKs to out/android. arch is the architecture of the
+  template if several are built, APKs of other architectures are left out.
+  make_apk.py is run by runner, a ProcessRunner, and logged as
+  <app_name>_<arch>.
+  Returns 0 on success.
+  """
+  if not telemetry:
+    telemetry = android.build_telemetry.BuildTelemetry()
+  if not runner:
+    runner = android.process_runner.ProcessRunner()
+  # Parallel builds pass their own copy of the template.
+  if not xwalk_app_template_path:
+    xwalk_app_template_path = os.path.join(base_dir, 'android', 'xwalk_app_template')
   make_apk_script = os.path.join(xwalk_app_template_path, 'make_apk.py')
 
   # Check xwalk_app_template.
@@ -40,38 +55,67 @@ def BuildApp(base_dir, app_name):
     print ('Please install xwalk_app_template')
     return 1
 
+  # Apps with patches are built from their patched worktree.
+  if not src_dir:
+    src_dir = os.path.join(base_dir, app_name, 'src')
+
   # Check manifest.json file.
-  jsonfile = os.path.join(base_dir, app_name, 'src', 'manifest.json')
+  jsonfile = os.path.join(src_dir, 'manifest.json')
   if not os.path.exists(jsonfile):
     print ('No manifest.json found at ' + jsonfile)
     return 2
 
+  # Restore the APK from the build cache if nothing changed since the
+  # last build.
+  if cache:
+    with telemetry.Phase(app_name, 'cache_lookup'):
+      cache_key = android.build_cache.ComputeBuildKey(base_dir, app_name,
+                                                      xwalk_app_template_path,
+                                                      src_dir)
+      restore_dir = tempfile.mkdtemp(prefix=app_name + '-')
+      try:
+        restored = cache.Restore(cache_key, restore_dir)
+        if restored:
+          MoveApkToOut(android.build_output.FindApks(restore_dir, app_name),
+                       base_dir, app_name,
+                       android.build_output.ReadManifestVersion(jsonfile))
+      finally:
+        shutil.rmtree(restore_dir, ignore_errors=True)
+    if restored:
+      print ('[' + app_name + ']: Restored APK from build cache.')
+      return 0
+
   manifest = "--manifest=" + jsonfile
 
   # Enable embedded mode by default.
   build_mode = "--mode=embedded"
-  previous_cwd = os.getcwd()
-  os.chdir(xwalk_app_template_path)
-  proc = subprocess.Popen(['python', make_apk_script, manifest, build_mode],
-                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-  out, _ = proc.communicate()
-  print (out)
-  os.chdir(previous_cwd)
+  # make_apk.py runs in the template dir, with cwd instead of chdir so that
+  # the architectures of an app can be built from threads.
+  with telemetry.Phase(app_name, 'make_apk'):
+    process = runner.Run(['python', make_apk_script, manifest, build_mode],
+                         cwd=xwalk_app_template_path,
+                         app=arch and app_name + '_' + arch or app_name)
+  if process.timed_out or process.cancelled:
+    print ('[Error]: make_apk.py ' + process.Status() + '.')
+    return 3
 
   # Move result to out.
   # From v3.32.51.0, the apk name is different, there is a tail after app name.
-  # We need to check all.
-  apk_path = os.path.join(xwalk_app_template_path, app_name)
-  apk_path_arm = apk_path + '_arm'
-  apk_path_x86 = apk_path + '_x86'
-
-  if os.path.exists(apk_path + '.apk'):
-    return MoveApkToOut(apk_path + '.apk', base_dir, app_name)
-  elif os.path.exists(apk_path_x86 + '.apk'):
-    return MoveApkToOut(apk_path_x86 + '.apk', base_dir, app_name + '_x86')
-  elif os.path.exists(apk_path_arm + '.apk'):
-    return MoveApkToOut(apk_path_arm + '.apk', base_dir, app_name + '_arm')
-  else:
+  # All architectures the template built are published together.
+  apks = android.build_output.FindApks(xwalk_app_template_path, app_name)
+  if arch:
+    # Templates before v3.32.51.0 do not name the architecture.
+    apks = dict((apk_arch or arch, apk_path)
+                for apk_arch, apk_path in apks.items()
+                if apk_arch in ('', arch))
+  if not apks:
     print ('[Error]: Can\'t find the web application APK, Failed to build.')
     return 3
-
+  with telemetry.Phase(app_name, 'move_apk'):
+    published = MoveApkToOut(
+        apks, base_dir, app_name,
+        android.build_output.ReadManifestVersion(jsonfile))
+  if cache:
+    with telemetry.Phase(app_name, 'cache_store'):
+      cache.Store(cache_key, published)
+  return 0
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Content-addressed cache of the APKs built by make_apk.py.
+
+The key of an app build is a hash of everything the build reads: the app's
+src tree, its manifest.json, its patch files and the xwalk_app_template
+version. Every cache entry is a directory named by the key which holds the
+APKs with their names under out/android. Entries are evicted in least
+recently used order once the cache grows over its size limit.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'crosswalk-demos', 'apks')
+# 2GB is enough to hold several builds of every app in the tree.
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def _HashFile(sha, path):
+  input_file = open(path, 'rb')
+  try:
+    while True:
+      chunk = input_file.read(_CHUNK_SIZE)
+      if not chunk:
+        break
+      sha.update(chunk)
+  finally:
+    input_file.close()
+
+
+def _HashTree(sha, root):
+  """Hashes the relative names and contents of all files under root in a
+  stable order. Git metadata is skipped, links are followed like the build
+  does.
+  """
+  for dirname, dirs, files in os.walk(root, followlinks=True):
+    dirs[:] = sorted(d for d in dirs if d != '.git')
+    for filename in sorted(files):
+      if filename == '.git':
+        continue
+      path = os.path.join(dirname, filename)
+      relative_name = os.path.relpath(path, root).replace(os.sep, '/')
+      sha.update(('file:' + relative_name + '\n').encode('utf-8'))
+      _HashFile(sha, path)
+
+
+def _HashTemplate(sha, template_path):
+  """Hashes the version of xwalk_app_template.
+
+  Hashing the whole template is slow, so only make_apk.py, the VERSION file
+  and the names and sizes of the other files are taken. That is enough to
+  tell template versions and architectures apart.
+  """
+  for name in ('make_apk.py', 'VERSION'):
+    path = os.path.join(template_path, name)
+    if os.path.isfile(path):
+      sha.update(('template:' + name + '\n').encode('utf-8'))
+      _HashFile(sha, path)
+  for dirname, dirs, files in os.walk(template_path):
+    dirs.sort()
+    for filename in sorted(files):
+      # APKs are the build outputs, not part of the template.
+      if filename.endswith('.apk'):
+        continue
+      path = os.path.join(dirname, filename)
+      relative_name = os.path.relpath(path, template_path).replace(os.sep, '/')
+      sha.update(('template:%s:%d\n' % (relative_name,
+                                        os.path.getsize(path))).encode('utf-8'))
+
+
+def ComputeBuildKey(base_dir, app_name, template_path, src_dir=None):
+  """Returns the cache key of building app_name from src_dir, the app's src
+  dir by default, with the given template.
+  """
+  sha = hashlib.sha1()
+  _HashTemplate(sha, template_path)
+  app_path = os.path.join(base_dir, app_name)
+  for name in sorted(os.listdir(app_path)):
+    path = os.path.join(app_path, name)
+    if not os.path.isfile(path):
+      continue
+    if name == 'manifest.json' or name.lower().endswith('.patch'):
+      sha.update(('app:' + name + '\n').encode('utf-8'))
+      _HashFile(sha, path)
+  _HashTree(sha, src_dir or os.path.join(app_path, 'src'))
+  return sha.hexdigest()
+
+
+class BuildCache(object):
+  """ Stores and restores built APKs by build key.
+
+  Args:
+    cache_dir: The directory holding the cache entries.
+    max_size: The total size in bytes the cache is trimmed to.
+  """
+  def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+    self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    self.max_size = max_size
+
+  def _EntryPath(self, key):
+    return os.path.join(self.cache_dir, key)
+
+  def Restore(self, key, destination):
+    """Copies the APKs cached under key to destination.
+
+    Returns the list of restored file names, or None on a cache miss.
+    """
+    entry = self._EntryPath(key)
+    if not os.path.isdir(entry):
+      return None
+    names = sorted(os.listdir(entry))
+    if not names:
+      return None
+    if not os.path.exists(destination):
+      try:
+        os.makedirs(destination)
+      except OSError:
+        if not os.path.isdir(destination):
+          raise
+    for name in names:
+      target = os.path.join(destination, name)
+      if os.path.exists(target):
+        os.remove(target)
+      shutil.copy2(os.path.join(entry, name), target)
+    # Mark the entry as recently used.
+    os.utime(entry, None)
+    return names
+
+  def Store(self, key, apk_paths):
+    """Caches apk_paths under key and trims the cache to its size limit."""
+    if not os.path.exists(self.cache_dir):
+      try:
+        os.makedirs(self.cache_dir)
+      except OSError:
+        if not os.path.isdir(self.cache_dir):
+          raise
+    entry = self._EntryPath(key)
+    # Fill a temp dir first and rename it, so that concurrent builds never
+    # see a half written entry.
+    temp_entry = tempfile.mkdtemp(prefix='.tmp-' + key + '-',
+                                  dir=self.cache_dir)
+    try:
+      for apk_path in apk_paths:
+        shutil.copy2(apk_path, os.path.join(temp_entry,
+                                            os.path.basename(apk_path)))
+      if os.path.exists(entry):
+        shutil.rmtree(entry)
+      os.rename(temp_entry, entry)
+    finally:
+      if os.path.exists(temp_entry):
+        shutil.rmtree(temp_entry, ignore_errors=True)
+    self.Evict()
+
+  def Evict(self):
+    """Removes least recently used entries until the cache fits max_size."""
+    if not os.path.isdir(self.cache_dir):
+      return
+    entries = []
+    total_size = 0
+    for name in os.listdir(self.cache_dir):
+      entry = os.path.join(self.cache_dir, name)
+      if name.startswith('.tmp-') or not os.path.isdir(entry):
+        continue
+      size = 0
+      for filename in os.listdir(entry):
+        size += os.path.getsize(os.path.join(entry, filename))
+      entries.append((os.path.getmtime(entry), size, entry))
+      total_size += size
+    entries.sort()
+    for _, size, entry in entries:
+      if total_size <= self.max_size:
+        break
+      shutil.rmtree(entry, ignore_errors=True)
+      total_size -= size
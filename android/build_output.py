@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Publishes built APKs into out/android.
+
+make_apk.py leaves one APK per architecture in the template dir, named
+<app>.apk, <app>_x86.apk or <app>_arm.apk depending on the template
+version. FindApks picks up all of them at once, and BuildOutput copies each
+one to a temp file next to its destination and renames it into place, so
+that readers of out/android never see a missing or half written APK, even
+with several builds running.
+
+Every published APK is recorded in out/android/index.json with its app,
+architecture, version, size, SHA-256 and build time, so that deploy tools
+can find new APKs without scanning the directory.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+  import fcntl
+except ImportError:
+  # No fcntl on Windows, the index is updated without a lock there.
+  fcntl = None
+
+# The architecture suffixes make_apk.py appends to APK names.
+APK_ARCHES = ('arm', 'arm64', 'x86', 'x86_64')
+INDEX_FILE_NAME = 'index.json'
+_LOCK_FILE_NAME = '.index.lock'
+_CHUNK_SIZE = 1024 * 1024
+
+
+def FindApks(apk_dir, app_name):
+  """Returns a dict of the APKs of app_name in apk_dir by architecture. The
+  architecture of an APK without an arch suffix is ''.
+  """
+  pattern = re.compile(re.escape(app_name) + '(?:_(' + '|'.join(APK_ARCHES) +
+                       r'))?\.apk$')
+  apks = {}
+  for name in os.listdir(apk_dir):
+    match = pattern.match(name)
+    if match:
+      apks[match.group(1) or ''] = os.path.join(apk_dir, name)
+  return apks
+
+
+def ReadManifestVersion(manifest_path):
+  """Returns the version in the manifest.json at manifest_path, or None."""
+  try:
+    manifest_file = open(manifest_path, 'r')
+  except IOError:
+    return None
+  try:
+    return json.load(manifest_file).get('version')
+  except ValueError:
+    return None
+  finally:
+    manifest_file.close()
+
+
+def _Replace(source, destination):
+  if sys.platform == 'win32' and os.path.exists(destination):
+    # rename does not overwrite on Windows.
+    os.remove(destination)
+  os.rename(source, destination)
+
+
+class BuildOutput(object):
+  """ Publishes APKs atomically and keeps the index of out/android.
+
+  Args:
+    out_dir: The directory the APKs are published to.
+  """
+  def __init__(self, out_dir):
+    self.out_dir = out_dir
+
+  def _MakeOutDir(self):
+    if not os.path.exists(self.out_dir):
+      try:
+        os.makedirs(self.out_dir)
+      except OSError:
+        # Another build may have created it in the meantime.
+        if not os.path.isdir(self.out_dir):
+          raise
+
+  def _CopyIn(self, source, destination):
+    """Copies source to a temp file in out_dir, hashing it on the way, and
+    renames the temp file to destination. Returns the SHA-256 and size.
+    """
+    sha = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.apk',
+                                     dir=self.out_dir)
+    try:
+      output_file = os.fdopen(fd, 'wb')
+      input_file = open(source, 'rb')
+      try:
+        while True:
+          chunk = input_file.read(_CHUNK_SIZE)
+          if not chunk:
+            break
+          sha.update(chunk)
+          output_file.write(chunk)
+          size += len(chunk)
+      finally:
+        input_file.close()
+        output_file.close()
+      shutil.copystat(source, temp_path)
+      _Replace(temp_path, destination)
+    finally:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+    return sha.hexdigest(), size
+
+  def Publish(self, app_name, apks, version=None):
+    """Publishes apks, a dict of APK paths by architecture like FindApks
+    returns, as <app_name>_<arch>.apk, and records them in the index.
+
+    Returns the list of published paths.
+    """
+    self._MakeOutDir()
+    entries = []
+    published = []
+    build_time = time.time()
+    for arch in sorted(apks):
+      file_name = app_name + (arch and '_' + arch) + '.apk'
+      destination = os.path.join(self.out_dir, file_name)
+      digest, size = self._CopyIn(apks[arch], destination)
+      published.append(destination)
+      entries.append({'app': app_name,
+                      'arch': arch,
+                      'version': version,
+                      'file': file_name,
+                      'size': size,
+                      'sha256': digest,
+                      'build_time': build_time})
+    self.UpdateIndex(entries)
+    return published
+
+  def ReadIndex(self):
+    """Returns the list of index entries, sorted by file name."""
+    try:
+      index_file = open(os.path.join(self.out_dir, INDEX_FILE_NAME), 'r')
+    except IOError:
+      return []
+    try:
+      return json.load(index_file).get('apks', [])
+    except ValueError:
+      # A corrupt index is rebuilt by the next publishes.
+      return []
+    finally:
+      index_file.close()
+
+  def UpdateIndex(self, entries):
+    """Adds entries to the index, replacing the ones for the same files.
+    Entries of files which are gone are dropped.
+    """
+    self._MakeOutDir()
+    lock_file = open(os.path.join(self.out_dir, _LOCK_FILE_NAME), 'a')
+    try:
+      if fcntl:
+        # Builds in other processes update the index too.
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+      index = dict((entry['file'], entry) for entry in self.ReadIndex()
+                   if os.path.exists(os.path.join(self.out_dir,
+                                                  entry['file'])))
+      for entry in entries:
+        index[entry['file']] = entry
+      fd, temp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.json',
+                                       dir=self.out_dir)
+      try:
+        index_file = os.fdopen(fd, 'w')
+        try:
+          json.dump({'apks': [index[name] for name in sorted(index)]},
+                    index_file, indent=2, sort_keys=True)
+        finally:
+          index_file.close()
+        _Replace(temp_path, os.path.join(self.out_dir, INDEX_FILE_NAME))
+      finally:
+        if os.path.exists(temp_path):
+          os.remove(temp_path)
+    finally:
+      # Closing the file releases the lock.
+      lock_file.close()
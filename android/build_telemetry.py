@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Records how long every phase of a webapp build takes.
+
+Each phase gets its wall time and the CPU time and peak memory of the build
+process and of the subprocesses it waited for, like git and make_apk.py.
+The phases can be written as a JSON lines report, one phase per line, or as
+a Chrome trace (chrome://tracing) showing the whole build as a timeline.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+  import resource
+except ImportError:
+  # No resource module on Windows, only wall times are recorded there.
+  resource = None
+
+
+def _GetUsage():
+  if not resource:
+    return None
+  own = resource.getrusage(resource.RUSAGE_SELF)
+  children = resource.getrusage(resource.RUSAGE_CHILDREN)
+  return (own.ru_utime, own.ru_stime, own.ru_maxrss,
+          children.ru_utime, children.ru_stime, children.ru_maxrss)
+
+
+class BuildTelemetry(object):
+  """ Collects the phases of a build.
+
+  Every process of a parallel build has its own BuildTelemetry, the phases
+  of the workers are merged into the main one with Extend.
+  """
+  def __init__(self):
+    self.start_time = time.time()
+    self.events = []
+
+  @contextlib.contextmanager
+  def Phase(self, app, phase):
+    """Records the code run in the with block as phase of app."""
+    start = time.time()
+    usage_before = _GetUsage()
+    try:
+      yield
+    finally:
+      end = time.time()
+      event = {
+        'app': app,
+        'phase': phase,
+        'pid': os.getpid(),
+        # Phases of the threads of a process, like the builds of several
+        # architectures, run at the same time.
+        'tid': threading.current_thread().ident,
+        'start': start,
+        'wall': end - start,
+      }
+      usage_after = _GetUsage()
+      if usage_before and usage_after:
+        event.update({
+          'user_cpu': usage_after[0] - usage_before[0],
+          'sys_cpu': usage_after[1] - usage_before[1],
+          'child_user_cpu': usage_after[3] - usage_before[3],
+          'child_sys_cpu': usage_after[4] - usage_before[4],
+          # ru_maxrss is a high-water mark in KB, not a per-phase value.
+          'max_rss_kb': usage_after[2],
+          'child_max_rss_kb': usage_after[5],
+        })
+      self.events.append(event)
+
+  def Extend(self, events):
+    self.events.extend(events)
+
+  def WriteReport(self, path):
+    """Writes one JSON object per phase to path."""
+    report = open(path, 'w')
+    for event in sorted(self.events, key=lambda event: event['start']):
+      report.write(json.dumps(event, sort_keys=True) + '\n')
+    report.close()
+
+  def WriteTrace(self, path):
+    """Writes the phases as Chrome trace events to path. Every thread of a
+    build process gets its own track.
+    """
+    trace_events = []
+    for event in self.events:
+      args = dict((key, value) for key, value in event.items()
+                  if key not in ('app', 'phase', 'pid', 'tid', 'start',
+                                 'wall'))
+      trace_events.append({
+        'name': event['phase'],
+        'cat': event['app'] or 'build',
+        'ph': 'X',
+        'ts': int((event['start'] - self.start_time) * 1000000),
+        'dur': int(event['wall'] * 1000000),
+        'pid': event['pid'],
+        'tid': event['tid'],
+        'args': dict(args, app=event['app']),
+      })
+    trace = open(path, 'w')
+    json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace)
+    trace.close()
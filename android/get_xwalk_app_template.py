@@ -12,17 +12,37 @@ destination directory.
 
 Sample usage from shell script:
 python get_xwalk_app_template.py --version=1.29.7.0
+Keep the crosswalk package apart from the extracted template
+python get_xwalk_app_template.py --version=1.29.7.0 --download-dir=downloads
 """
+import hashlib
 import optparse
 import os
 import shutil
 import sys
 import tarfile
+import time
 import urllib2
 import zipfile
 
 from urllib2 import urlopen
 
+CHUNK_SIZE = 64 * 1024
+# Seconds between two download progress reports.
+PROGRESS_INTERVAL = 2
+
+
+def _PrintProgress(downloaded, total_size, transferred, elapsed):
+  mb = 1024.0 * 1024.0
+  speed = transferred / mb / max(elapsed, 0.001)
+  if total_size:
+    print ('Downloaded %.1f MB of %.1f MB (%d%%), %.2f MB/s'
+           % (downloaded / mb, total_size / mb,
+              downloaded * 100 / total_size, speed))
+  else:
+    print ('Downloaded %.1f MB, %.2f MB/s' % (downloaded / mb, speed))
+  sys.stdout.flush()
+
 
 class GetXWalkAppTemplate(object):
   """ Retrieves the xwalk application template build version and provides
@@ -35,18 +55,31 @@ class GetXWalkAppTemplate(object):
     version: The version number of crosswalk package name.
     file_name: The file name of the xwalk application template package.
     dest_dir: The destination directory.
+    sha256: The expected SHA-256 hex digest of the crosswalk package. If it
+            is not given, the digest is read from the '.sha256' file next to
+            the package on the server, if there is one.
+    download_dir: The directory the crosswalk package is downloaded to,
+                  dest_dir by default.
   """
-  def __init__(self, url, package_prefix, version, file_name, dest_dir):
+  def __init__(self, url, package_prefix, version, file_name, dest_dir,
+               sha256=None, download_dir=None):
     self.url = url
     self.package_prefix = package_prefix
     self.version = version
     self.file_name = file_name
     self.dest_dir = dest_dir
+    self.sha256 = sha256 and sha256.lower()
+    self.download_dir = download_dir or dest_dir
     self.arch = ''
 
   def DownloadCrosswalkPackage(self):
     """Downloads the crosswalk package to the destination path based on the
     package url address, package prefix and package version number.
+
+    The package is streamed in chunks to a '.part' file, which is renamed to
+    the package name only after it is complete and its SHA-256 digest
+    matched. An interrupted download is resumed from the '.part' file with
+    an HTTP Range request the next time.
     """
     if 'arm' in self.url:
       self.arch = '-arm'
@@ -56,18 +89,27 @@ class GetXWalkAppTemplate(object):
       print '[Error]: Invalid url ' + self.url
       return False
     package_name = self.package_prefix + self.version + self.arch + '.zip'
-    file_path = os.path.join(self.dest_dir, package_name)
+    file_path = os.path.join(self.download_dir, package_name)
+    part_path = file_path + '.part'
     # We have previously downloaded, skip download.
+    # Only complete packages are renamed to file_path, but check the digest
+    # if one is given, the file may come from somewhere else.
     if os.path.isfile(file_path):
-      return True
+      if not self.sha256 or self.__file_sha256(file_path) == self.sha256:
+        return True
+      print ('[Error]: Checksum mismatch of ' + file_path + ', download again.')
+      os.remove(file_path)
+    offset = 0
+    if os.path.isfile(part_path):
+      offset = os.path.getsize(part_path)
     succeed = False
     error_str = ''
     package_url = self.url + '/' + self.package_prefix + self.version + self.arch + '.zip'
     print ('Try with url ' + package_url)
     try:
-      input_file = urllib2.urlopen(package_url)
+      input_file = self.__open_package_url(package_url, offset)
       succeed = True
-    except urllib2.HTTPError, e:
+    except urllib2.HTTPError as e:
       error_str += ('[Error]: Failed to open ' + package_url + ' with error HTTP %s.\n' % e.code)
     except:
       error_str += ('[Error]: Failed to download, ' + package_url + '\n')
@@ -75,8 +117,8 @@ class GetXWalkAppTemplate(object):
       package_url = self.url+ '/' + self.package_prefix + self.version + '.zip'
       print ('Retry with url: ' + package_url)
       try:
-        input_file = urllib2.urlopen(package_url)
-      except urllib2.HTTPError, e:
+        input_file = self.__open_package_url(package_url, offset)
+      except urllib2.HTTPError as e:
         error_str += ('[Error]: Failed to open ' + package_url + ' with error HTTP %s.' % e.code)
         print error_str
         return False
@@ -84,24 +126,126 @@ class GetXWalkAppTemplate(object):
         error_str += ('[Error]: Failed to download, ' + package_url + '\n')
         print error_str
         return False
+    expected_sha256 = self.sha256 or self.__get_sidecar_sha256(package_url)
+    if not expected_sha256:
+      print ('No checksum found for ' + package_url + ', skip verification.')
+    # The server may ignore the Range header and send the whole file.
+    if offset and input_file.getcode() != 206:
+      offset = 0
+    if offset:
+      print ('Resume download from byte %d' % offset)
     try:
-      contents = input_file.read()
-      input_file.close()
-      output_file = open(file_path, 'wb')
-      output_file.write(contents)
+      sha256 = hashlib.sha256()
+      if offset:
+        output_file = open(part_path, 'ab')
+        self.__update_sha256(sha256, part_path)
+      else:
+        output_file = open(part_path, 'wb')
+      self.__stream_to_file(input_file, output_file, sha256, offset)
       output_file.close()
+      input_file.close()
     except:
-      print ("[Error]: The downloaded file is broken.")
+      print ('[Error]: Download of ' + package_url + ' was interrupted, '
+             'run again to resume it.')
       return False
+    if expected_sha256 and sha256.hexdigest() != expected_sha256:
+      print ('[Error]: The downloaded file is broken, SHA-256 %s, expected %s.'
+             % (sha256.hexdigest(), expected_sha256))
+      os.remove(part_path)
+      return False
+    os.rename(part_path, file_path)
     return True
 
 
+  @staticmethod
+  def __open_package_url(package_url, offset):
+    """ Opens package_url, asking for the bytes from offset on. If the
+    partial file is already complete, the server answers 416, in which case
+    the whole file is requested again.
+    """
+    request = urllib2.Request(package_url)
+    if offset:
+      request.add_header('Range', 'bytes=%d-' % offset)
+    try:
+      return urlopen(request)
+    except urllib2.HTTPError as e:
+      if not offset or e.code != 416:
+        raise
+    return urlopen(package_url)
+
+
+  @staticmethod
+  def __get_sidecar_sha256(package_url):
+    """ Returns the digest published in the '.sha256' file next to the
+    package, or None if there is no such file.
+    """
+    try:
+      sidecar = urlopen(package_url + '.sha256')
+      content = sidecar.read(1024)
+      sidecar.close()
+    except:
+      return None
+    fields = content.split()
+    if not fields or len(fields[0]) != 64:
+      return None
+    return fields[0].lower()
+
+
+  @staticmethod
+  def __update_sha256(sha256, file_path):
+    input_file = open(file_path, 'rb')
+    while True:
+      chunk = input_file.read(CHUNK_SIZE)
+      if not chunk:
+        break
+      sha256.update(chunk)
+    input_file.close()
+
+
+  def __file_sha256(self, file_path):
+    sha256 = hashlib.sha256()
+    self.__update_sha256(sha256, file_path)
+    return sha256.hexdigest()
+
+
+  @staticmethod
+  def __stream_to_file(input_file, output_file, sha256, offset):
+    """ Copies input_file to output_file chunk by chunk and reports the
+    progress and throughput every PROGRESS_INTERVAL seconds.
+    """
+    total_size = None
+    content_length = input_file.info().getheader('Content-Length')
+    if content_length:
+      total_size = offset + int(content_length)
+    downloaded = offset
+    start_time = time.time()
+    last_report = start_time
+    while True:
+      chunk = input_file.read(CHUNK_SIZE)
+      if not chunk:
+        break
+      output_file.write(chunk)
+      sha256.update(chunk)
+      downloaded += len(chunk)
+      now = time.time()
+      if now - last_report >= PROGRESS_INTERVAL:
+        last_report = now
+        _PrintProgress(downloaded, total_size, downloaded - offset,
+                       now - start_time)
+    _PrintProgress(downloaded, total_size, downloaded - offset,
+                   time.time() - start_time)
+    # The connection may be closed early without any error.
+    if total_size and downloaded < total_size:
+      raise IOError('Connection closed after %d of %d bytes'
+                    % (downloaded, total_size))
+
+
   def __extract_crosswalk_package(self):
     """ Extracts the specific crosswalk package file to the destination
     directory. It is an internally used function.
     """
     package_name = self.package_prefix + self.version + self.arch + '.zip'
-    zip_file_name = os.path.join(self.dest_dir, package_name)
+    zip_file_name = os.path.join(self.download_dir, package_name)
     file_dir = os.path.join(self.dest_dir, self.package_prefix + self.version + self.arch)
     if os.path.exists(file_dir):
       shutil.rmtree(file_dir)
@@ -129,11 +273,67 @@ class GetXWalkAppTemplate(object):
     return True
 
 
-  def ExtractAppTemplate(self):
+  def __stream_app_template(self):
+    """ Extracts the xwalk app template straight out of the crosswalk
+    package, without extracting the package to disk first. The tar.gz member
+    is decompressed from the zip and untarred in one streaming pass.
+    It is an internally used function.
+
+    Returns None if the package has no app template member.
+    """
+    package_name = self.package_prefix + self.version + self.arch + '.zip'
+    zip_file_name = os.path.join(self.download_dir, package_name)
+    try:
+      crosswalk_zip = zipfile.ZipFile(zip_file_name, 'r')
+    except zipfile.BadZipfile:
+      print ('[Error]: There is something wrong with ' + zip_file_name)
+      return False
+    except:
+      print ('[Error]: Failed to open ' + zip_file_name)
+      return False
+    try:
+      template_member = None
+      for member in crosswalk_zip.namelist():
+        if member.split('/')[-1] == self.file_name:
+          template_member = member
+          break
+      if not template_member:
+        return None
+      file_dir = os.path.join(self.dest_dir, self.file_name.split('.tar.gz')[0])
+      if os.path.exists(file_dir):
+        shutil.rmtree(file_dir)
+      try:
+        template_file = crosswalk_zip.open(template_member)
+        tar = tarfile.open(fileobj=template_file, mode='r|gz')
+        tar.extractall(self.dest_dir)
+        tar.close()
+        template_file.close()
+      except:
+        print ('[Error]: Failed to extract ' + template_member + ' from ' +
+               zip_file_name)
+        return False
+    finally:
+      crosswalk_zip.close()
+    return True
+
+
+  def ExtractAppTemplate(self, extract_all=False):
     """ Extracts the specific xwalk app template to the destination directory.
+
+    Only the app template is streamed out of the crosswalk package, unless
+    extract_all is set, in which case the whole package is extracted next to
+    the template as well.
+
+    Returns whether the template was extracted.
     """
+    if not extract_all:
+      streamed = self.__stream_app_template()
+      if streamed is not None:
+        return streamed
+      print ('No ' + self.file_name + ' found in the package, '
+             'extract the whole package.')
     if not self.__extract_crosswalk_package():
-      return
+      return False
     file_dir = os.path.join(self.dest_dir, self.file_name.split('.tar.gz')[0])
     if os.path.exists(file_dir):
       shutil.rmtree(file_dir)
@@ -145,6 +345,8 @@ class GetXWalkAppTemplate(object):
       tar.close()
     except:
       print ('[Error]: Failed to extract ' + file_path)
+      return False
+    return True
 
 def main():
   parser = optparse.OptionParser()
@@ -164,6 +366,18 @@ def main():
   info = ('not to download package')
   parser.add_option('-n', '--no-downloading', action='store_true',
                     dest='no_downloading', help=info)
+  info = ('extract the whole crosswalk package, not only the xwalk '
+          'application template')
+  parser.add_option('--extract-all', action='store_true',
+                    dest='extract_all', help=info)
+  info = ('The expected SHA-256 digest of the crosswalk package. By default '
+          'the digest is read from the .sha256 file next to the package.')
+  parser.add_option('--sha256', action='store', dest='sha256', help=info)
+  info = ('The directory the crosswalk package is downloaded to, and an '
+          'interrupted download is resumed from. Such as: '
+          '--download-dir=downloads. The destination directory by default.')
+  parser.add_option('--download-dir', action='store', dest='download_dir',
+                    help=info)
   opts, _ = parser.parse_args()
   if not opts.version:
     parser.error('Version number is required! please use "--version" option.')
@@ -171,25 +385,31 @@ def main():
   if not os.path.exists(opts.dest_dir):
     os.mkdir(opts.dest_dir)
   dest_dir = opts.dest_dir
+  download_dir = opts.download_dir or dest_dir
+  if not os.path.exists(download_dir):
+    os.makedirs(download_dir)
   url = opts.url
   version = opts.version
   crosswalk_package_prefix = 'crosswalk-'
   file_name = 'xwalk_app_template.tar.gz'
   if opts.no_downloading:
-    if not os.path.exists(os.path.join(dest_dir, crosswalk_package_prefix +
+    if not os.path.exists(os.path.join(download_dir, crosswalk_package_prefix +
                           version + '.zip')):
       print (crosswalk_package_prefix + version + '.zip' +
-             ' does not exist in %s' % dest_dir)
+             ' does not exist in %s' % download_dir)
       return 2
     else:
       app_template_handler = GetXWalkAppTemplate(url, crosswalk_package_prefix,
-                                                 version, file_name, dest_dir)
+                                                 version, file_name, dest_dir,
+                                                 download_dir=download_dir)
   else:
     app_template_handler = GetXWalkAppTemplate(url, crosswalk_package_prefix,
-                                               version, file_name, dest_dir)
+                                               version, file_name, dest_dir,
+                                               opts.sha256, download_dir)
     if not app_template_handler.DownloadCrosswalkPackage():
       return 3
-  app_template_handler.ExtractAppTemplate()
+  if not app_template_handler.ExtractAppTemplate(opts.extract_all):
+    return 4
   return 0
 
 
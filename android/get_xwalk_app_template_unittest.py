@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Tests the streamed and resumed downloads of get_xwalk_app_template.py
+against a local SimpleHTTPServer.
+
+Sample usage from shell script:
+python -m unittest android.get_xwalk_app_template_unittest
+"""
+import BaseHTTPServer
+import hashlib
+import os
+import shutil
+import SimpleHTTPServer
+import StringIO
+import tempfile
+import threading
+import unittest
+
+from android.get_xwalk_app_template import GetXWalkAppTemplate
+
+VERSION = '1.0.0.0'
+PACKAGE_NAME = 'crosswalk-' + VERSION + '-x86.zip'
+
+
+class RangeRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+  """ Serves the files of server.root, answering Range requests unless
+  server.accept_ranges is False. Full responses are cut after
+  server.truncate_at bytes, if it is set, like a dropped connection.
+  """
+  def translate_path(self, path):
+    return os.path.join(self.server.root, path.lstrip('/'))
+
+  def send_head(self):
+    path = self.translate_path(self.path)
+    if not os.path.isfile(path):
+      self.send_error(404)
+      return None
+    data = open(path, 'rb').read()
+    range_header = self.headers.getheader('Range')
+    if path.endswith('.zip'):
+      self.server.ranges.append(range_header)
+    start = 0
+    if range_header and self.server.accept_ranges:
+      start = int(range_header.split('=')[1].rstrip('-'))
+      if start >= len(data):
+        self.send_error(416)
+        return None
+      self.send_response(206)
+      self.send_header('Content-Range', 'bytes %d-%d/%d'
+                       % (start, len(data) - 1, len(data)))
+    else:
+      self.send_response(200)
+    self.send_header('Content-Length', str(len(data) - start))
+    self.end_headers()
+    end = len(data)
+    if not start and self.server.truncate_at:
+      end = self.server.truncate_at
+    return StringIO.StringIO(data[start:end])
+
+  def log_message(self, *args):
+    pass
+
+
+class GetXWalkAppTemplateTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.serve_dir = os.path.join(self.temp_dir, 'serve', 'android-x86')
+    self.dest_dir = os.path.join(self.temp_dir, 'dest')
+    os.makedirs(self.serve_dir)
+    os.makedirs(self.dest_dir)
+    self.package = os.urandom(300 * 1024)
+    self.WriteServed(PACKAGE_NAME, self.package)
+    self.WriteServed(PACKAGE_NAME + '.sha256',
+                     hashlib.sha256(self.package).hexdigest() + '  ' +
+                     PACKAGE_NAME + '\n')
+    self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                            RangeRequestHandler)
+    self.server.root = os.path.dirname(self.serve_dir)
+    self.server.accept_ranges = True
+    self.server.truncate_at = None
+    self.server.ranges = []
+    self.server_thread = threading.Thread(target=self.server.serve_forever)
+    self.server_thread.start()
+    self.url = 'http://127.0.0.1:%d/android-x86' % self.server.server_port
+    self.file_path = os.path.join(self.dest_dir, PACKAGE_NAME)
+    self.part_path = self.file_path + '.part'
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server_thread.join()
+    self.server.server_close()
+    shutil.rmtree(self.temp_dir)
+
+  def WriteServed(self, name, data):
+    served_file = open(os.path.join(self.serve_dir, name), 'wb')
+    served_file.write(data)
+    served_file.close()
+
+  def WritePart(self, data):
+    part_file = open(self.part_path, 'wb')
+    part_file.write(data)
+    part_file.close()
+
+  def Download(self):
+    return GetXWalkAppTemplate(self.url, 'crosswalk-', VERSION,
+                               'xwalk_app_template.tar.gz',
+                               self.dest_dir).DownloadCrosswalkPackage()
+
+  def AssertDownloaded(self):
+    self.assertFalse(os.path.exists(self.part_path))
+    self.assertEqual(open(self.file_path, 'rb').read(), self.package)
+
+  def testResumesDroppedDownload(self):
+    half = len(self.package) // 2
+    self.server.truncate_at = half
+    self.assertFalse(self.Download())
+    self.assertFalse(os.path.exists(self.file_path))
+    self.assertEqual(os.path.getsize(self.part_path), half)
+
+    self.server.truncate_at = None
+    self.assertTrue(self.Download())
+    self.assertEqual(self.server.ranges, [None, 'bytes=%d-' % half])
+    self.AssertDownloaded()
+
+  def testRestartsWhenRangeIsIgnored(self):
+    self.server.accept_ranges = False
+    self.WritePart(b'x' * 1000)
+    self.assertTrue(self.Download())
+    self.assertEqual(self.server.ranges, ['bytes=1000-'])
+    self.AssertDownloaded()
+
+  def testRefetchesCompletePart(self):
+    # The server answers 416 to a range past the end of the package.
+    self.WritePart(self.package)
+    self.assertTrue(self.Download())
+    self.assertEqual(self.server.ranges,
+                     ['bytes=%d-' % len(self.package), None])
+    self.AssertDownloaded()
+
+  def testRejectsBrokenDownload(self):
+    self.WriteServed(PACKAGE_NAME + '.sha256', '0' * 64 + '\n')
+    self.assertFalse(self.Download())
+    self.assertFalse(os.path.exists(self.file_path))
+    self.assertFalse(os.path.exists(self.part_path))
+
+  def testSkipsDownloadedPackage(self):
+    self.assertTrue(self.Download())
+    self.assertTrue(self.Download())
+    self.assertEqual(self.server.ranges, [None])
+    self.AssertDownloaded()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Runs the commands of a build and streams their output.
+
+The output of a command is read line by line while it runs, instead of all
+at once by communicate() when it exits. Every line is printed tagged with
+its app as soon as it is read, appended to the log file of the app, and
+kept in a ring buffer of the last lines, so memory stays bounded however
+much git, make_apk.py or ant print.
+
+Commands can have a timeout and be cancelled. Every command runs in its own
+process group, so stopping it stops what it started too, like the ant of
+make_apk.py. Python 2 has no asyncio, every running command has a reader
+thread instead, so any number of them can run at the same time.
+"""
+
+import collections
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+DEFAULT_TAIL_LINES = 200
+# How long a stopped command gets to exit before it is killed.
+_KILL_GRACE_SECONDS = 5
+# Longer lines are split, so a command without newlines can't fill memory.
+_MAX_LINE_LENGTH = 64 * 1024
+# Waits wake up this often, so that KeyboardInterrupt gets through.
+_POLL_SECONDS = 0.5
+
+_print_lock = threading.Lock()
+# Commands are started one at a time, see Process.
+_popen_lock = threading.Lock()
+_running_lock = threading.Lock()
+_running = set()
+
+
+def _Print(text):
+  # print is not atomic, lines of commands run from threads would mix.
+  with _print_lock:
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def CancelAll():
+  """Cancels every command still running in this process."""
+  with _running_lock:
+    processes = list(_running)
+  for process in processes:
+    process.Cancel()
+
+
+def GetResult(async_result):
+  """Returns the result of async_result, of a thread pool running commands.
+  The commands don't get the ctrl-c of the terminal, being in their own
+  process groups, so they are cancelled if the wait is interrupted.
+  """
+  try:
+    while not async_result.ready():
+      async_result.wait(_POLL_SECONDS)
+  except KeyboardInterrupt:
+    CancelAll()
+    raise
+  return async_result.get()
+
+
+class Process(object):
+  """ A running command, see ProcessRunner.Start.
+
+  Args:
+    command: The command, a list of arguments.
+    cwd: The dir the command runs in, the current one if None.
+    env: The environment of the command, the current one if None.
+    app: The app the command runs for, its output is tagged with it.
+    log_file: The file the output is written to, or None.
+    timeout: The seconds after which the command is stopped, or None.
+    tail_lines: The number of output lines kept in tail.
+    echo: Whether the output is printed as it is read.
+  """
+  def __init__(self, command, cwd=None, env=None, app='', log_file=None,
+               timeout=None, tail_lines=DEFAULT_TAIL_LINES, echo=True):
+    self.command = command
+    self.app = app
+    self.timeout = timeout
+    self.tail = collections.deque(maxlen=tail_lines)
+    self.returncode = None
+    self.timed_out = False
+    self.cancelled = False
+    self.log_file_ = log_file
+    self.echo_ = echo
+    self.done_ = threading.Event()
+    self.timer_ = None
+    self.killer_ = None
+    if log_file:
+      log_file.write('$ ' + subprocess.list2cmdline(command) + '\n')
+    # Python commands, like make_apk.py, would only print once their
+    # buffers are full.
+    env = dict(env or os.environ)
+    env.setdefault('PYTHONUNBUFFERED', '1')
+    kwargs = {}
+    if hasattr(os, 'setsid'):
+      kwargs['preexec_fn'] = os.setsid
+    # Commands started from other threads must not inherit the pipes of
+    # this one, or its output would not end before theirs. Windows can't
+    # close the fds when the output is redirected. preexec_fn is not safe
+    # with threads forking at the same time on python 2, which runs it and
+    # the rest of the child setup as python code after fork.
+    with _popen_lock:
+      self.proc_ = subprocess.Popen(command, cwd=cwd, env=env,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT,
+                                    close_fds=(os.name == 'posix'), **kwargs)
+    with _running_lock:
+      _running.add(self)
+    if timeout:
+      self.timer_ = threading.Timer(timeout, self.__TimeOut)
+      self.timer_.daemon = True
+      self.timer_.start()
+    reader = threading.Thread(target=self.__Read)
+    reader.daemon = True
+    reader.start()
+
+  def __Read(self):
+    tag = self.app and '[' + self.app + ']: ' or ''
+    try:
+      while True:
+        line = self.proc_.stdout.readline(_MAX_LINE_LENGTH)
+        if not line:
+          break
+        if not line.endswith('\n'):
+          line += '\n'
+        self.tail.append(line)
+        if self.log_file_:
+          self.log_file_.write(line)
+        if self.echo_:
+          _Print(tag + line)
+      self.proc_.stdout.close()
+      self.returncode = self.proc_.wait()
+    finally:
+      for timer in (self.timer_, self.killer_):
+        if timer:
+          timer.cancel()
+      if self.log_file_:
+        self.log_file_.write('$ ' + self.Status() + '\n')
+      with _running_lock:
+        _running.discard(self)
+      self.done_.set()
+
+  def __Signal(self, kill):
+    if self.done_.is_set():
+      return
+    try:
+      if hasattr(os, 'killpg'):
+        os.killpg(self.proc_.pid, kill and signal.SIGKILL or signal.SIGTERM)
+      elif kill:
+        self.proc_.kill()
+      else:
+        self.proc_.terminate()
+    except OSError:
+      # It exited in the meantime.
+      pass
+
+  def __Stop(self):
+    """Terminates the command, and kills it if it is still running
+    _KILL_GRACE_SECONDS later.
+    """
+    self.__Signal(False)
+    self.killer_ = threading.Timer(_KILL_GRACE_SECONDS, self.__Signal, (True,))
+    self.killer_.daemon = True
+    self.killer_.start()
+
+  def __TimeOut(self):
+    self.timed_out = True
+    self.__Stop()
+
+  def Cancel(self):
+    """Stops the command if it is still running."""
+    if not self.done_.is_set():
+      self.cancelled = True
+      self.__Stop()
+
+  def Wait(self):
+    """Waits for the command to exit and returns its exit status. The command
+    is cancelled if the wait is interrupted.
+    """
+    try:
+      while not self.done_.wait(_POLL_SECONDS):
+        pass
+    except KeyboardInterrupt:
+      self.Cancel()
+      raise
+    return self.returncode
+
+  def Succeeded(self):
+    return self.returncode == 0 and not self.timed_out and not self.cancelled
+
+  def Output(self):
+    """Returns the last tail_lines lines of the output."""
+    return ''.join(self.tail)
+
+  def Status(self):
+    """Returns how the command ended, such as 'exited with 1'."""
+    if self.timed_out:
+      return 'timed out after %gs' % self.timeout
+    if self.cancelled:
+      return 'cancelled'
+    if self.returncode is None:
+      return 'running'
+    return 'exited with %d' % self.returncode
+
+
+class ProcessRunner(object):
+  """ Starts commands and writes their output to the log files of their apps.
+
+  The log of an app, <app>.log in log_dir, is rewritten by the first command
+  a runner starts for the app, and appended to by the next ones.
+
+  Args:
+    log_dir: The dir of the log files, or None for no logs.
+    timeout: The default timeout of the commands in seconds, or None.
+    tail_lines: The number of output lines kept of every command.
+    echo: Whether the output is printed as it is read.
+  """
+  def __init__(self, log_dir=None, timeout=None,
+               tail_lines=DEFAULT_TAIL_LINES, echo=True):
+    self.log_dir = log_dir
+    self.timeout = timeout
+    self.tail_lines = tail_lines
+    self.echo = echo
+    self.lock_ = threading.Lock()
+    self.log_files_ = {}
+
+  def GetLogPath(self, app):
+    return os.path.join(self.log_dir, app + '.log')
+
+  def __GetLogFile(self, app):
+    if not self.log_dir or not app:
+      return None
+    with self.lock_:
+      if app not in self.log_files_:
+        if not os.path.exists(self.log_dir):
+          try:
+            os.makedirs(self.log_dir)
+          except OSError:
+            # Another build may have created it in the meantime.
+            if not os.path.isdir(self.log_dir):
+              raise
+        # Line buffered, so the log can be followed while the command runs.
+        self.log_files_[app] = open(self.GetLogPath(app), 'w', 1)
+      return self.log_files_[app]
+
+  def Start(self, command, cwd=None, app='', timeout=None, env=None):
+    """Starts command, a list, and returns its Process. timeout overrides the
+    default one of the runner.
+    """
+    return Process(command, cwd, env, app, self.__GetLogFile(app),
+                   timeout or self.timeout, self.tail_lines, self.echo)
+
+  def Run(self, command, cwd=None, app='', timeout=None, env=None):
+    """Runs command like Start, and returns its Process once it exited."""
+    process = self.Start(command, cwd, app, timeout, env)
+    process.Wait()
+    return process
+
+  def Close(self):
+    """Closes the log files. Commands must not be started afterwards."""
+    with self.lock_:
+      for log_file in self.log_files_.values():
+        log_file.close()
+      self.log_files_ = {}
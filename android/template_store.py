@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Shared store of extracted xwalk_app_template versions.
+
+Every version and architecture of the template is downloaded and extracted
+once, into ~/.cache/crosswalk-demos/templates/<version>-<arch>. The
+android/xwalk_app_template dir of the tree is a symlink to one of them, so
+switching versions only swaps the link. Builds for several architectures
+link android/xwalk_app_template_<arch> to the template of each of them.
+Least recently used versions are removed once the store grows over its size
+limit.
+
+The crosswalk package of a version is downloaded into
+.downloads/<version>-<arch> of the store, which outlives failed fetches, so
+an interrupted download is resumed by the next one. It is removed once the
+template is extracted from the verified package.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'crosswalk-demos', 'templates')
+# An extracted template takes about 150MB.
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+TEMPLATE_DIR_NAME = 'xwalk_app_template'
+# The url get_xwalk_app_template.py downloads from by default.
+DEFAULT_URL = 'https://download.01.org/crosswalk/releases/android-x86/canary'
+ARCHES = ('x86', 'arm')
+_DOWNLOADS_DIR_NAME = '.downloads'
+
+
+def GetArchFromUrl(url):
+  """Returns the architecture of the crosswalk packages under url, the same
+  way get_xwalk_app_template.py picks it. The downloader defaults to x86.
+  """
+  if url and 'arm' in url:
+    return 'arm'
+  return 'x86'
+
+
+def GetUrlForArch(url, arch):
+  """Returns the url of the crosswalk packages for arch, next to the ones
+  under url, like .../android-arm/canary for .../android-x86/canary.
+  Returns None if url does not name an architecture.
+  """
+  url = url or DEFAULT_URL
+  if GetArchFromUrl(url) == arch:
+    return url
+  arch_url, count = re.subn(r'(?<=android-)(x86|arm)\b', arch, url)
+  if not count:
+    return None
+  return arch_url
+
+
+def GetArchTemplatePath(android_dir, arch):
+  """Returns the path of the template of arch for builds of several
+  architectures, next to the single android/xwalk_app_template.
+  """
+  return os.path.join(android_dir, TEMPLATE_DIR_NAME + '_' + arch)
+
+
+def _GetTreeSize(path):
+  size = 0
+  for dirname, _, files in os.walk(path):
+    for filename in files:
+      file_path = os.path.join(dirname, filename)
+      if not os.path.islink(file_path):
+        size += os.path.getsize(file_path)
+  return size
+
+
+class TemplateStore(object):
+  """ Keeps extracted templates by version and architecture.
+
+  Args:
+    store_dir: The directory holding the templates.
+    max_size: The total size in bytes the store is trimmed to.
+  """
+  def __init__(self, store_dir=None, max_size=DEFAULT_MAX_SIZE):
+    self.store_dir = store_dir or DEFAULT_STORE_DIR
+    self.max_size = max_size
+
+  def _EntryPath(self, version, arch):
+    return os.path.join(self.store_dir, version + '-' + arch)
+
+  def GetDownloadPath(self, version, arch):
+    """Returns the dir the crosswalk package of version and arch is
+    downloaded to.
+    """
+    return os.path.join(self.store_dir, _DOWNLOADS_DIR_NAME,
+                        version + '-' + arch)
+
+  def GetTemplatePath(self, version, arch):
+    """Returns the path of the stored template, or None if it is missing."""
+    template_path = os.path.join(self._EntryPath(version, arch),
+                                 TEMPLATE_DIR_NAME)
+    if os.path.exists(os.path.join(template_path, 'make_apk.py')):
+      return template_path
+    return None
+
+  def Fetch(self, version, arch, download_func):
+    """Adds a template version to the store.
+
+    download_func(dest_dir, download_dir) downloads the crosswalk package
+    into download_dir, extracts the template into dest_dir and returns
+    whether it succeeded. Everything else it leaves in dest_dir is dropped.
+    download_dir is kept when the fetch fails, for the next one to resume
+    from, and removed once it succeeded.
+
+    Returns the path of the stored template, or None on failure.
+    """
+    download_dir = self.GetDownloadPath(version, arch)
+    if not os.path.exists(download_dir):
+      try:
+        os.makedirs(download_dir)
+      except OSError:
+        if not os.path.isdir(download_dir):
+          raise
+    temp_entry = tempfile.mkdtemp(prefix='.tmp-' + version + '-' + arch + '-',
+                                  dir=self.store_dir)
+    try:
+      if not download_func(temp_entry, download_dir):
+        return None
+      if not os.path.isdir(os.path.join(temp_entry, TEMPLATE_DIR_NAME)):
+        return None
+      for name in os.listdir(temp_entry):
+        if name == TEMPLATE_DIR_NAME:
+          continue
+        path = os.path.join(temp_entry, name)
+        if os.path.isdir(path):
+          shutil.rmtree(path)
+        else:
+          os.remove(path)
+      entry = self._EntryPath(version, arch)
+      if os.path.exists(entry):
+        shutil.rmtree(entry)
+      os.rename(temp_entry, entry)
+    finally:
+      if os.path.exists(temp_entry):
+        shutil.rmtree(temp_entry, ignore_errors=True)
+    # The template is only extracted from a package whose checksum matched.
+    shutil.rmtree(download_dir, ignore_errors=True)
+    return self.GetTemplatePath(version, arch)
+
+  def Activate(self, version, arch, link_path, keep_arches=()):
+    """Points link_path at the stored template of version and arch.
+
+    The link is replaced atomically. Platforms without symlinks get a copy
+    of the template instead. The templates of version for keep_arches are
+    kept in the store, as other links point at them.
+    """
+    template_path = self.GetTemplatePath(version, arch)
+    if not template_path:
+      return False
+    # Mark the entry as recently used.
+    os.utime(self._EntryPath(version, arch), None)
+    # A template extracted in place by an older make_webapp.py.
+    if os.path.isdir(link_path) and not os.path.islink(link_path):
+      shutil.rmtree(link_path)
+    if not hasattr(os, 'symlink'):
+      if os.path.exists(link_path):
+        shutil.rmtree(link_path)
+      shutil.copytree(template_path, link_path)
+      return True
+    temp_link = link_path + '.tmp-%d' % os.getpid()
+    if os.path.lexists(temp_link):
+      os.remove(temp_link)
+    os.symlink(template_path, temp_link)
+    os.rename(temp_link, link_path)
+    self.CollectGarbage(keep=[self._EntryPath(version, keep_arch)
+                              for keep_arch in set(keep_arches) | set([arch])])
+    return True
+
+  def CollectGarbage(self, keep=()):
+    """Removes least recently used templates until the store fits max_size.
+    Entries in keep are never removed.
+    """
+    if not os.path.isdir(self.store_dir):
+      return
+    entries = []
+    total_size = 0
+    for name in os.listdir(self.store_dir):
+      entry = os.path.join(self.store_dir, name)
+      # Temp entries and the downloads are not templates.
+      if name.startswith('.') or not os.path.isdir(entry):
+        continue
+      size = _GetTreeSize(entry)
+      total_size += size
+      if entry not in keep:
+        entries.append((os.path.getmtime(entry), size, entry))
+    entries.sort()
+    for _, size, entry in entries:
+      if total_size <= self.max_size:
+        break
+      shutil.rmtree(entry, ignore_errors=True)
+      total_size -= size
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Cached index of the webapps in the tree and of their manifests.
+
+An app is a dir with a manifest.json, or with one in its src dir. The one
+next to src overlays the one in src. The index keeps the mtimes of every
+dir it looked at and of the manifests, and only lists and parses again
+what changed since, so finding the apps of a large tree is a few stats
+per app. Dirs are listed with os.scandir, or the scandir module, where
+available, and with os.listdir otherwise.
+
+Manifests are validated when they are parsed. Apps whose manifest can not
+be read or has no name are left out of the index, other problems, like
+missing icons, are reported as warnings.
+
+Sample usage from shell script:
+List the apps of the tree with their package ids and versions
+    python app_index.py
+"""
+
+import json
+import optparse
+import os
+import re
+import sys
+import tempfile
+
+try:
+  from os import scandir
+except ImportError:
+  try:
+    from scandir import scandir
+  except ImportError:
+    scandir = None
+
+INDEX_FILE_NAME = 'app_index.json'
+# Changes when the index format does, older indexes are rebuilt.
+_INDEX_VERSION = 1
+
+_PACKAGE_ID = re.compile(r'^[a-zA-Z]\w*(\.[a-zA-Z]\w*)+$')
+
+
+class _DirEntry(object):
+  """The part of os.DirEntry the index uses, for os.listdir."""
+  def __init__(self, dirname, name):
+    self.name = name
+    self.path = os.path.join(dirname, name)
+
+  def is_dir(self):
+    return os.path.isdir(self.path)
+
+
+def _ScanDir(path):
+  """Returns the entries of the dir path, sorted by name."""
+  if scandir:
+    entries = list(scandir(path))
+  else:
+    entries = [_DirEntry(path, name) for name in os.listdir(path)]
+  return sorted(entries, key=lambda entry: entry.name)
+
+
+def _GetMtime(path):
+  """Returns the mtime of path, or None if it does not exist."""
+  try:
+    return os.stat(path).st_mtime
+  except OSError:
+    return None
+
+
+def ValidateManifest(manifest, app_root):
+  """Returns the index entry of manifest, a parsed manifest.json, and the
+  list of its problems. The entry is None if the app can not be built.
+  icons are looked up relative to app_root.
+  """
+  warnings = []
+  name = manifest.get('name')
+  if not isinstance(name, basestring) or not name.strip():
+    return None, ['No name in the manifest.']
+  package_id = manifest.get('xwalk_package_id')
+  if package_id is not None and (not isinstance(package_id, basestring) or
+                                 not _PACKAGE_ID.match(package_id)):
+    warnings.append('Invalid xwalk_package_id ' + repr(package_id) + '.')
+    package_id = None
+  version = manifest.get('version')
+  if version is not None and not isinstance(version, basestring):
+    warnings.append('The version is not a string.')
+    version = None
+  # Icons are a dict of the path of every size in the old format, and a
+  # list of dicts with src and sizes in the W3C one.
+  icons = manifest.get('icons') or {}
+  if isinstance(icons, dict):
+    icons = sorted(icons.values())
+  elif isinstance(icons, list):
+    icons = [icon.get('src') for icon in icons if isinstance(icon, dict)]
+  else:
+    warnings.append('The icons are neither a dict nor a list.')
+    icons = []
+  for icon in icons:
+    if (not isinstance(icon, basestring) or
+        not os.path.isfile(os.path.join(app_root, icon))):
+      warnings.append('Missing icon ' + repr(icon) + '.')
+  return {
+    'name': name,
+    'xwalk_package_id': package_id,
+    'version': version,
+    'icons': icons,
+  }, warnings
+
+
+def ReadManifest(manifest_path, app_root):
+  """Returns the validated index entry of the manifest at manifest_path and
+  the list of its problems, see ValidateManifest.
+  """
+  try:
+    manifest_file = open(manifest_path, 'r')
+  except IOError as e:
+    return None, ['Can\'t read the manifest: ' + str(e)]
+  try:
+    manifest = json.load(manifest_file)
+  except ValueError as e:
+    return None, ['Invalid manifest: ' + str(e)]
+  finally:
+    manifest_file.close()
+  if not isinstance(manifest, dict):
+    return None, ['The manifest is not a JSON object.']
+  return ValidateManifest(manifest, app_root)
+
+
+class AppIndex(object):
+  """ Finds the apps under root and keeps their manifests.
+
+  Args:
+    root: The dir holding the apps.
+    index_path: The file the index is cached in, out/app_index.json under
+                root by default.
+  """
+  def __init__(self, root, index_path=None):
+    self.root = root
+    self.index_path = index_path or os.path.join(root, 'out',
+                                                 INDEX_FILE_NAME)
+    self.index_ = self.__Load()
+    self.changed_ = False
+
+  def __Load(self):
+    try:
+      index_file = open(self.index_path, 'r')
+    except IOError:
+      return {}
+    try:
+      index = json.load(index_file)
+    except ValueError:
+      return {}
+    finally:
+      index_file.close()
+    if index.get('version') != _INDEX_VERSION or index.get('root') != self.root:
+      return {}
+    return index
+
+  def __Save(self):
+    index_dir = os.path.dirname(self.index_path)
+    if not os.path.exists(index_dir):
+      try:
+        os.makedirs(index_dir)
+      except OSError:
+        if not os.path.isdir(index_dir):
+          raise
+    fd, temp_path = tempfile.mkstemp(prefix='.tmp-', dir=index_dir)
+    try:
+      index_file = os.fdopen(fd, 'w')
+      json.dump(self.index_, index_file, indent=2, sort_keys=True)
+      index_file.close()
+      if sys.platform == 'win32' and os.path.exists(self.index_path):
+        os.remove(self.index_path)
+      os.rename(temp_path, self.index_path)
+    finally:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+  def __ScanDir(self, path):
+    """Returns the index entry of the dir at path."""
+    src_dir = os.path.join(path, 'src')
+    entry = {
+      'mtime': _GetMtime(path),
+      'src_mtime': _GetMtime(src_dir),
+      'manifest': None,
+      'manifest_mtime': None,
+      'info': None,
+      'warnings': [],
+    }
+    for manifest_path in (os.path.join(path, 'manifest.json'),
+                          os.path.join(src_dir, 'manifest.json')):
+      manifest_mtime = _GetMtime(manifest_path)
+      if manifest_mtime is None:
+        continue
+      entry['manifest'] = os.path.relpath(manifest_path, path)
+      entry['manifest_mtime'] = manifest_mtime
+      entry['info'], entry['warnings'] = ReadManifest(manifest_path, src_dir)
+      break
+    return entry
+
+  def __IsFresh(self, path, entry):
+    if (_GetMtime(path) != entry['mtime'] or
+        _GetMtime(os.path.join(path, 'src')) != entry['src_mtime']):
+      return False
+    if entry['manifest']:
+      return (_GetMtime(os.path.join(path, entry['manifest'])) ==
+              entry['manifest_mtime'])
+    return True
+
+  def Update(self):
+    """Brings the index up to date with the tree and saves it if anything
+    changed. Only dirs whose mtime changed are scanned again.
+    """
+    dirs = self.index_.get('dirs', {})
+    root_mtime = _GetMtime(self.root)
+    if root_mtime != self.index_.get('root_mtime'):
+      names = [entry.name for entry in _ScanDir(self.root)
+               if entry.is_dir() and not entry.name.startswith('.')]
+      self.changed_ = True
+    else:
+      names = sorted(dirs)
+    new_dirs = {}
+    for name in names:
+      path = os.path.join(self.root, name)
+      entry = dirs.get(name)
+      if not entry or not self.__IsFresh(path, entry):
+        entry = self.__ScanDir(path)
+        self.changed_ = True
+      new_dirs[name] = entry
+    self.index_ = {
+      'version': _INDEX_VERSION,
+      'root': self.root,
+      'root_mtime': root_mtime,
+      'dirs': new_dirs,
+    }
+    if self.changed_:
+      self.__Save()
+      self.changed_ = False
+
+  def GetApp(self, name):
+    """Returns the manifest info of the app name, a dict of its name,
+    xwalk_package_id, version and icons, or None if it is not an app.
+    """
+    entry = self.index_.get('dirs', {}).get(name)
+    return entry and entry['info']
+
+  def GetManifestPath(self, name):
+    """Returns the path of the manifest the app name is built with."""
+    entry = self.index_.get('dirs', {}).get(name)
+    if not entry or not entry['manifest']:
+      return None
+    return os.path.join(self.root, name, entry['manifest'])
+
+  def GetWarnings(self, name):
+    entry = self.index_.get('dirs', {}).get(name)
+    return entry and entry['warnings'] or []
+
+  def FindApps(self):
+    """Returns the sorted names of the apps with a valid manifest."""
+    return sorted(name for name, entry in self.index_.get('dirs', {}).items()
+                  if entry['info'])
+
+  def FindInvalidApps(self):
+    """Returns the sorted names of the dirs with an invalid manifest."""
+    return sorted(name for name, entry in self.index_.get('dirs', {}).items()
+                  if entry['manifest'] and not entry['info'])
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--root', action='store', dest='root',
+      default=os.path.abspath(os.path.dirname(__file__)),
+      help='The dir holding the apps. Such as: --root=.')
+  options, _ = parser.parse_args()
+  index = AppIndex(os.path.abspath(options.root))
+  index.Update()
+  for name in index.FindApps():
+    info = index.GetApp(name)
+    print ('%s: %s %s %s' % (name, info['name'],
+                             info['xwalk_package_id'] or '-',
+                             info['version'] or '-'))
+    for warning in index.GetWarnings(name):
+      print ('[Warning]: ' + name + ': ' + warning)
+  for name in index.FindInvalidApps():
+    for warning in index.GetWarnings(name):
+      print ('[Error]: ' + name + ': ' + warning)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Watches the sources of webapps for changes.
+
+The files of an app are its src tree, without git metadata, and the
+manifest.json and *.patch files next to it. On Linux the kernel reports
+changes through inotify. Elsewhere, or when inotify is not available, the
+files are polled for size and mtime changes.
+
+A burst of changes, like a git checkout or an editor saving a few files, is
+collected into a single set of changed apps by WaitForChanges.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_POLL_INTERVAL = 1.0
+
+# From <sys/inotify.h>.
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM |
+               _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF |
+               _IN_MOVE_SELF)
+_EVENT_HEADER = 'iIII'
+_EVENT_HEADER_SIZE = struct.calcsize(_EVENT_HEADER)
+
+
+def IsAppFile(app_dir, path):
+  """Returns whether a change of path changes the build of the app in
+  app_dir.
+
+  The manifest.json next to src overlays the one in src, changes of the
+  latter are ignored then.
+  """
+  relative_path = os.path.relpath(path, app_dir)
+  parts = relative_path.split(os.sep)
+  if len(parts) == 1:
+    return (parts[0] == 'manifest.json' or
+            parts[0].lower().endswith('.patch'))
+  if parts[0] != 'src' or '.git' in parts:
+    return False
+  if (len(parts) == 2 and parts[1] == 'manifest.json' and
+      os.path.exists(os.path.join(app_dir, 'manifest.json'))):
+    return False
+  return True
+
+
+def _WalkApp(app_dir):
+  """Yields the paths of the files of the app in app_dir."""
+  for name in sorted(os.listdir(app_dir)):
+    path = os.path.join(app_dir, name)
+    if os.path.isfile(path) and IsAppFile(app_dir, path):
+      yield path
+  src_dir = os.path.join(app_dir, 'src')
+  for dirname, dirs, files in os.walk(src_dir):
+    dirs[:] = [name for name in dirs if name != '.git']
+    for name in files:
+      path = os.path.join(dirname, name)
+      if IsAppFile(app_dir, path):
+        yield path
+
+
+class PollingWatcher(object):
+  """
+  Finds changes by comparing the size and mtime of all files.
+
+  apps     : a dict of the app dir of every app name.
+  interval : the seconds between two scans.
+  """
+  def __init__(self, apps, interval=DEFAULT_POLL_INTERVAL):
+    self.apps_ = apps
+    self.interval_ = interval
+    self.snapshot_ = self.__Scan()
+
+  def __Scan(self):
+    snapshot = {}
+    for app, app_dir in self.apps_.items():
+      for path in _WalkApp(app_dir):
+        try:
+          st = os.stat(path)
+        except OSError:
+          # Removed while scanning.
+          continue
+        snapshot[path] = (app, st.st_size, st.st_mtime)
+    return snapshot
+
+  def Wait(self, timeout=None):
+    """Returns the set of changed apps, empty if nothing changed within
+    timeout seconds. Waits forever if timeout is None.
+    """
+    deadline = timeout is not None and time.time() + timeout
+    while True:
+      snapshot = self.__Scan()
+      changed = set()
+      for path in set(snapshot) | set(self.snapshot_):
+        if snapshot.get(path) != self.snapshot_.get(path):
+          changed.add((snapshot.get(path) or self.snapshot_.get(path))[0])
+      self.snapshot_ = snapshot
+      if changed:
+        return changed
+      if deadline is not False:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          return changed
+        time.sleep(min(self.interval_, remaining))
+      else:
+        time.sleep(self.interval_)
+
+  def Close(self):
+    pass
+
+
+class InotifyWatcher(object):
+  """
+  Finds changes with Linux inotify. Every dir of the src trees gets a watch,
+  new dirs are watched as they are created.
+
+  apps : a dict of the app dir of every app name.
+  """
+  def __init__(self, apps):
+    self.libc_ = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    self.fd_ = self.libc_.inotify_init()
+    if self.fd_ < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init failed')
+    # Maps every watch descriptor to its app and dir.
+    self.watches_ = {}
+    for app, app_dir in apps.items():
+      self.__AddWatch(app, app_dir, app_dir)
+      self.__AddTree(app, app_dir, os.path.join(app_dir, 'src'))
+
+  def __AddWatch(self, app, app_dir, path):
+    wd = self.libc_.inotify_add_watch(self.fd_, path.encode('utf-8'),
+                                      _WATCH_MASK)
+    if wd < 0:
+      error = ctypes.get_errno()
+      if error in (errno.ENOENT, errno.ENOTDIR):
+        # Removed in the meantime.
+        return
+      raise OSError(error, 'Failed to watch ' + path)
+    self.watches_[wd] = (app, app_dir, path)
+
+  def __AddTree(self, app, app_dir, root):
+    for dirname, dirs, _ in os.walk(root):
+      dirs[:] = [name for name in dirs if name != '.git']
+      self.__AddWatch(app, app_dir, dirname)
+
+  def __ReadEvents(self):
+    changed = set()
+    try:
+      data = os.read(self.fd_, 64 * 1024)
+    except OSError as e:
+      if e.errno == errno.EINTR:
+        return changed
+      raise
+    offset = 0
+    while offset < len(data):
+      wd, mask, _, name_size = struct.unpack_from(_EVENT_HEADER, data, offset)
+      name = data[offset + _EVENT_HEADER_SIZE:
+                  offset + _EVENT_HEADER_SIZE + name_size].rstrip(b'\0')
+      offset += _EVENT_HEADER_SIZE + name_size
+      if mask & _IN_Q_OVERFLOW:
+        # Events were lost, take every app as changed.
+        changed.update(app for app, _, _ in self.watches_.values())
+        continue
+      if wd not in self.watches_:
+        continue
+      app, app_dir, dirname = self.watches_[wd]
+      if mask & _IN_IGNORED:
+        del self.watches_[wd]
+        continue
+      path = dirname
+      if name:
+        path = os.path.join(dirname, name.decode('utf-8'))
+      if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+        if IsAppFile(app_dir, os.path.join(path, 'file')):
+          self.__AddTree(app, app_dir, path)
+          changed.add(app)
+        continue
+      if path == dirname or IsAppFile(app_dir, path):
+        changed.add(app)
+    return changed
+
+  def Wait(self, timeout=None):
+    """Returns the set of changed apps, empty if nothing changed within
+    timeout seconds. Waits forever if timeout is None.
+    """
+    deadline = timeout is not None and time.time() + timeout
+    while True:
+      remaining = None
+      if deadline is not False:
+        remaining = max(deadline - time.time(), 0)
+      try:
+        readable, _, _ = select.select([self.fd_], [], [], remaining)
+      except select.error as e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+      if not readable:
+        return set()
+      changed = self.__ReadEvents()
+      if changed or remaining == 0:
+        return changed
+
+  def Close(self):
+    os.close(self.fd_)
+
+
+def CreateWatcher(apps, poll=False):
+  """Returns an inotify watcher of apps, a dict of the app dir of every app
+  name, or a polling one if inotify is not available or poll is set.
+  """
+  if not poll and sys.platform.startswith('linux'):
+    try:
+      return InotifyWatcher(apps)
+    except (AttributeError, OSError) as e:
+      print ('[Warning]: inotify is not available (' + str(e) +
+             '), polling for changes instead.')
+  return PollingWatcher(apps)
+
+
+def WaitForChanges(watcher, debounce=DEFAULT_DEBOUNCE):
+  """Waits until some apps change and no further changes come in for
+  debounce seconds.
+
+  Returns the set of changed apps and the time of the first change.
+  """
+  changed = watcher.Wait()
+  first_change = time.time()
+  while True:
+    more = watcher.Wait(debounce)
+    if not more:
+      return changed, first_change
+    changed.update(more)
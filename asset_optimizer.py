@@ -0,0 +1,736 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Optimizes the assets of webapps before they are packaged.
+
+The stages are:
+  prune  : leaves out the files which nothing reachable from the manifest
+           refers to. A file is taken as referred to if its path or name
+           occurs in the manifest, or in a reachable HTML, CSS, JS or other
+           text file, or if the path of one of its dirs ends a string there.
+           Names put together otherwise at runtime are not found, so this
+           stage only runs when asked for.
+  minify : removes comments and extra whitespace from JS, CSS and HTML.
+           Line breaks are kept in JS, so automatic semicolon insertion
+           does not change.
+  png    : recompresses the image data of PNGs with the best zlib settings.
+           The pixels and all other chunks stay the same.
+An optimized file is only used if it is smaller. New stages are plugged in
+by adding an optimizer for their file extensions to OPTIMIZERS.
+
+The files are optimized in parallel, and the result of every file and stage
+is cached by the hash of its content, so unchanged assets are not optimized
+again. The optimized app is written to a new dir, the sources are left as
+they are.
+
+Sample usage from shell script:
+Optimize an app into out/optimized
+    python asset_optimizer.py MemoryGame/src out/optimized/MemoryGame
+Also prune the files the app does not refer to
+    python asset_optimizer.py --stages=all MemoryGame/src out/optimized/MemoryGame
+"""
+
+import hashlib
+import json
+import multiprocessing
+import optparse
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import urllib
+import zlib
+
+from file_utils import LinkFile
+from multiprocessing.pool import ThreadPool
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'crosswalk-demos', 'assets')
+# Optimized assets are small, this holds those of many app versions.
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+# Changes the cache keys, bump it when an optimizer gives other results.
+_CACHE_VERSION = '1'
+
+# Keywords after which a / starts a regular expression, not a division.
+_JS_REGEX_KEYWORDS = frozenset(['return', 'typeof', 'case', 'do', 'else', 'in',
+                                'instanceof', 'new', 'delete', 'void', 'throw',
+                                'yield', 'await'])
+_JS_REGEX_PRECEDERS = frozenset('(,=:[!&|?{};+-*%<>~^')
+# Whitespace next to these can go, it never separates two tokens.
+_JS_PUNCTUATORS = frozenset('{}()[];,=:<>?!&|*%^~')
+_JS_WORD = re.compile(r'[\w$]+$')
+_JS_IDENTIFIER = re.compile(r'[\w$.]+')
+
+
+class _Unterminated(Exception):
+  """A string, comment or regular expression runs to the end of the file."""
+
+
+def _JsSkipQuoted(data, start, quote):
+  """Returns the index after the quote closing the string at start."""
+  i = start + 1
+  while i < len(data):
+    c = data[i]
+    if c == '\\':
+      i += 2
+      continue
+    if c == quote:
+      return i + 1
+    if c == '\n' and quote != '`':
+      break
+    if quote == '`' and data.startswith('${', i):
+      i = _JsSkipPlaceholder(data, i + 2)
+      continue
+    i += 1
+  raise _Unterminated()
+
+
+def _JsSkipPlaceholder(data, start):
+  """Returns the index after the } closing the ${ of a template literal.
+  Placeholders may hold strings and template literals of their own.
+  """
+  i = start
+  depth = 1
+  while i < len(data):
+    c = data[i]
+    if c in '\'"`':
+      i = _JsSkipQuoted(data, i, c)
+      continue
+    if c == '{':
+      depth += 1
+    elif c == '}':
+      depth -= 1
+      if not depth:
+        return i + 1
+    i += 1
+  raise _Unterminated()
+
+
+def _JsSkipRegex(data, start):
+  """Returns the index after the / closing the regular expression."""
+  i = start + 1
+  in_class = False
+  while i < len(data):
+    c = data[i]
+    if c == '\\':
+      i += 2
+      continue
+    if c == '\n':
+      break
+    if c == '[':
+      in_class = True
+    elif c == ']':
+      in_class = False
+    elif c == '/' and not in_class:
+      return i + 1
+    i += 1
+  raise _Unterminated()
+
+
+def _JsStartsRegex(out):
+  """Returns whether a / after the minified code in out is a regex."""
+  code = ''.join(out[-2:]).rstrip()
+  if not code:
+    return True
+  if code[-1] in _JS_REGEX_PRECEDERS:
+    return True
+  word = _JS_WORD.search(code)
+  return bool(word) and word.group() in _JS_REGEX_KEYWORDS
+
+
+def MinifyJs(data):
+  """Returns data without comments, indentation and blank lines. /*! */
+  comments, like licenses, are kept.
+  """
+  out = []
+  i = 0
+  pending_space = None
+  try:
+    while i < len(data):
+      c = data[i]
+      if c in ' \t\r\n\f\v':
+        end = i
+        while end < len(data) and data[end] in ' \t\r\n\f\v':
+          end += 1
+        space = '\n' if '\n' in data[i:end] else ' '
+        if pending_space != '\n':
+          pending_space = space
+        i = end
+        continue
+      if c == '/' and data[i + 1:i + 2] == '/':
+        end = data.find('\n', i)
+        i = len(data) if end < 0 else end
+        continue
+      if c == '/' and data[i + 1:i + 2] == '*':
+        end = data.find('*/', i + 2)
+        if end < 0:
+          raise _Unterminated()
+        comment = data[i:end + 2]
+        i = end + 2
+        if comment.startswith('/*!'):
+          token = comment
+        else:
+          # A comment with a line break ends a statement like one.
+          if '\n' in comment:
+            pending_space = '\n'
+          elif pending_space is None:
+            pending_space = ' '
+          continue
+      elif c in '\'"`':
+        end = _JsSkipQuoted(data, i, c)
+        token = data[i:end]
+        i = end
+      elif c == '/' and _JsStartsRegex(out):
+        end = _JsSkipRegex(data, i)
+        token = data[i:end]
+        i = end
+      else:
+        # Identifiers and numbers are taken as a whole, one character
+        # at a time is slow on large libraries.
+        identifier = _JS_IDENTIFIER.match(data, i)
+        token = identifier.group() if identifier else c
+        i += len(token)
+      if pending_space and out:
+        previous = out[-1][-1]
+        if (pending_space == '\n' or
+            (previous not in _JS_PUNCTUATORS and
+             token[0] not in _JS_PUNCTUATORS)):
+          out.append(pending_space)
+      pending_space = None
+      out.append(token)
+  except _Unterminated:
+    # Not code this minifier understands, leave it alone.
+    return data
+  return ''.join(out) + ('\n' if out else '')
+
+
+_CSS_TOKEN = re.compile(r'("(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')|'
+                        r'(/\*.*?\*/)', re.S)
+_CSS_PUNCTUATOR_SPACE = re.compile(r' ?([{};,>]) ?')
+
+
+def _MinifyCssCode(code):
+  code = re.sub(r'\s+', ' ', code)
+  code = _CSS_PUNCTUATOR_SPACE.sub(r'\1', code)
+  # A space after a colon never matters, one before it does in selectors.
+  code = code.replace(': ', ':')
+  return code.replace(';}', '}')
+
+
+def MinifyCss(data):
+  """Returns data without comments and extra whitespace. /*! */ comments
+  are kept.
+  """
+  out = []
+  code = []
+  position = 0
+  for match in _CSS_TOKEN.finditer(data):
+    code.append(data[position:match.start()])
+    position = match.end()
+    string, comment = match.groups()
+    if string or comment.startswith('/*!'):
+      out.append(_MinifyCssCode(''.join(code)))
+      out.append(match.group())
+      code = []
+    else:
+      # A comment separates tokens like a space.
+      code.append(' ')
+  code.append(data[position:])
+  out.append(_MinifyCssCode(''.join(code)))
+  return ''.join(out).strip() + '\n'
+
+
+_HTML_TOKEN = re.compile(
+    r'(<!--.*?-->)|'
+    r'(<(script|style|pre|textarea)\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*>)'
+    r'(.*?)(</\3\s*>)|'
+    r'(<(?:[^>"\']|"[^"]*"|\'[^\']*\')*>)',
+    re.S | re.I)
+_HTML_TAG_SPACE = re.compile(r'("[^"]*"|\'[^\']*\')|\s+')
+_HTML_SCRIPT_TYPE = re.compile(r'\btype\s*=\s*["\']?([^"\'\s>]+)', re.I)
+
+
+def _CollapseSpace(text):
+  return re.sub(r'\s+', lambda m: '\n' if '\n' in m.group() else ' ', text)
+
+
+def _MinifyTag(tag):
+  return _HTML_TAG_SPACE.sub(lambda m: m.group(1) or ' ', tag)
+
+
+def MinifyHtml(data):
+  """Returns data without comments and extra whitespace. Inline scripts and
+  styles are minified, pre and textarea are kept as they are, as are
+  conditional comments.
+  """
+  out = []
+  position = 0
+  for match in _HTML_TOKEN.finditer(data):
+    out.append(_CollapseSpace(data[position:match.start()]))
+    position = match.end()
+    comment, open_tag, name, content, close_tag, tag = match.groups()
+    if comment:
+      if comment.startswith('<!--[if') or comment.startswith('<!--<!'):
+        out.append(comment)
+    elif open_tag:
+      name = name.lower()
+      if name == 'script':
+        script_type = _HTML_SCRIPT_TYPE.search(open_tag)
+        if (not script_type or
+            'javascript' in script_type.group(1).lower() or
+            'ecmascript' in script_type.group(1).lower()):
+          content = MinifyJs(content)
+      elif name == 'style':
+        content = MinifyCss(content)
+      out.append(_MinifyTag(open_tag) + content + close_tag)
+    else:
+      out.append(_MinifyTag(tag))
+  out.append(_CollapseSpace(data[position:]))
+  return ''.join(out)
+
+
+_PNG_SIGNATURE = '\x89PNG\r\n\x1a\n'
+
+
+def _PngChunks(data):
+  """Yields the type and data of the chunks of a PNG. Raises ValueError if
+  data is not a valid PNG.
+  """
+  if not data.startswith(_PNG_SIGNATURE):
+    raise ValueError('No PNG signature')
+  offset = len(_PNG_SIGNATURE)
+  while offset < len(data):
+    if offset + 12 > len(data):
+      raise ValueError('Truncated chunk')
+    length, chunk_type = struct.unpack('>I4s', data[offset:offset + 8])
+    chunk_data = data[offset + 8:offset + 8 + length]
+    crc, = struct.unpack('>I', data[offset + 8 + length:offset + 12 + length])
+    if (len(chunk_data) != length or
+        zlib.crc32(chunk_type + chunk_data) & 0xffffffff != crc):
+      raise ValueError('Bad chunk ' + repr(chunk_type))
+    yield chunk_type, chunk_data
+    offset += 12 + length
+    if chunk_type == 'IEND':
+      return
+
+
+def _PngChunk(chunk_type, chunk_data):
+  return (struct.pack('>I4s', len(chunk_data), chunk_type) + chunk_data +
+          struct.pack('>I', zlib.crc32(chunk_type + chunk_data) & 0xffffffff))
+
+
+def RecompressPng(data):
+  """Returns data with its image data recompressed into one IDAT chunk, with
+  the zlib strategy which gives the smallest PNG. Returns data itself if it
+  is not a valid PNG.
+  """
+  try:
+    chunks = list(_PngChunks(data))
+    image_data = zlib.decompress(''.join(chunk_data for chunk_type, chunk_data
+                                         in chunks if chunk_type == 'IDAT'))
+  except (ValueError, struct.error, zlib.error):
+    return data
+  compressed = None
+  for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS, 9,
+                                  strategy)
+    candidate = compressor.compress(image_data) + compressor.flush()
+    if compressed is None or len(candidate) < len(compressed):
+      compressed = candidate
+  out = [_PNG_SIGNATURE]
+  for chunk_type, chunk_data in chunks:
+    if chunk_type != 'IDAT':
+      out.append(_PngChunk(chunk_type, chunk_data))
+    elif compressed is not None:
+      out.append(_PngChunk('IDAT', compressed))
+      compressed = None
+  return ''.join(out)
+
+
+# The optimizers of every stage by file extension. An optimizer takes the
+# content of a file and returns the optimized content.
+OPTIMIZERS = {
+  'minify': {
+    '.css': MinifyCss,
+    '.htm': MinifyHtml,
+    '.html': MinifyHtml,
+    '.js': MinifyJs,
+  },
+  'png': {
+    '.png': RecompressPng,
+  },
+}
+PRUNE_STAGE = 'prune'
+# All stages in the order they run.
+STAGES = (PRUNE_STAGE, 'minify', 'png')
+DEFAULT_STAGES = ('minify', 'png')
+
+# Files whose content is searched for the files they refer to.
+_TEXT_EXTENSIONS = frozenset(['.appcache', '.css', '.htm', '.html', '.js',
+                              '.json', '.manifest', '.svg', '.txt', '.xml'])
+
+
+def _ListFiles(root):
+  """Returns the relative paths of the files under root, with / separators.
+  Git metadata is skipped.
+  """
+  paths = []
+  # Links are followed, apps may be overlays of links to their sources.
+  for dirname, dirs, files in os.walk(root, followlinks=True):
+    dirs[:] = sorted(d for d in dirs if d != '.git')
+    for filename in sorted(files):
+      if filename == '.git':
+        continue
+      path = os.path.join(dirname, filename)
+      paths.append(os.path.relpath(path, root).replace(os.sep, '/'))
+  return paths
+
+
+def _JsonStrings(value):
+  if isinstance(value, dict):
+    for item in value.values():
+      for string in _JsonStrings(item):
+        yield string
+  elif isinstance(value, list):
+    for item in value:
+      for string in _JsonStrings(item):
+        yield string
+  elif isinstance(value, basestring):
+    yield value
+
+
+def _Names(path):
+  """Returns the strings which refer to path: its path and its name, and
+  the paths of the dirs holding it at the end of a string, like in
+  'images/' + name.
+  """
+  names = set([path, path.rsplit('/', 1)[-1]])
+  names.update(set(urllib.quote(name) for name in names))
+  parts = path.split('/')
+  for end in range(1, len(parts)):
+    for quote in '\'"`':
+      names.add('/'.join(parts[:end]) + '/' + quote)
+  return names
+
+
+def FindReachableFiles(root):
+  """Returns the set of relative paths of the files under root which are
+  reachable from its manifest.json, or None if root has no manifest.json
+  or it does not lead to an HTML file. Then nothing can be pruned.
+  """
+  files = _ListFiles(root)
+  if 'manifest.json' not in files:
+    return None
+  manifest_file = open(os.path.join(root, 'manifest.json'), 'r')
+  try:
+    manifest = json.load(manifest_file)
+  except ValueError:
+    return None
+  finally:
+    manifest_file.close()
+  references = set(string.lstrip('/').split('?')[0].split('#')[0]
+                   for string in _JsonStrings(manifest))
+  reachable = set(['manifest.json'])
+  reachable.update(path for path in files if path in references)
+  if not [path for path in reachable
+          if os.path.splitext(path)[1].lower() in ('.html', '.htm')]:
+    # Old manifests may not name the start page.
+    if 'index.html' not in files:
+      return None
+    reachable.add('index.html')
+  names = dict((path, _Names(path)) for path in files)
+  queue = sorted(reachable)
+  while queue:
+    path = queue.pop()
+    if os.path.splitext(path)[1].lower() not in _TEXT_EXTENSIONS:
+      continue
+    text_file = open(os.path.join(root, path), 'rb')
+    text = text_file.read()
+    text_file.close()
+    for other in files:
+      if other in reachable:
+        continue
+      if [name for name in names[other] if name in text]:
+        reachable.add(other)
+        queue.append(other)
+  return reachable
+
+
+class AssetCache(object):
+  """ Stores optimized assets by the hash of their content and stage.
+
+  Args:
+    cache_dir: The directory holding the cached assets.
+    max_size: The total size in bytes the cache is trimmed to.
+  """
+  def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+    self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    self.max_size = max_size
+
+  def _EntryPath(self, key):
+    return os.path.join(self.cache_dir, key[:2], key)
+
+  def Lookup(self, key):
+    """Returns the optimized content cached under key, or None."""
+    entry = self._EntryPath(key)
+    try:
+      entry_file = open(entry, 'rb')
+    except IOError:
+      return None
+    try:
+      content = entry_file.read()
+    finally:
+      entry_file.close()
+    # Mark the entry as recently used.
+    os.utime(entry, None)
+    return content
+
+  def Store(self, key, content):
+    entry = self._EntryPath(key)
+    entry_dir = os.path.dirname(entry)
+    if not os.path.exists(entry_dir):
+      try:
+        os.makedirs(entry_dir)
+      except OSError:
+        if not os.path.isdir(entry_dir):
+          raise
+    # Write a temp file and rename it, so that concurrent optimizers never
+    # read a half written entry.
+    fd, temp_path = tempfile.mkstemp(prefix='.tmp-', dir=entry_dir)
+    try:
+      temp_file = os.fdopen(fd, 'wb')
+      temp_file.write(content)
+      temp_file.close()
+      os.rename(temp_path, entry)
+    finally:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+  def Evict(self):
+    """Removes least recently used entries until the cache fits max_size."""
+    if not os.path.isdir(self.cache_dir):
+      return
+    entries = []
+    total_size = 0
+    for dirname, _, files in os.walk(self.cache_dir):
+      for name in files:
+        if name.startswith('.tmp-'):
+          continue
+        entry = os.path.join(dirname, name)
+        st = os.stat(entry)
+        entries.append((st.st_mtime, st.st_size, entry))
+        total_size += st.st_size
+    entries.sort()
+    for _, size, entry in entries:
+      if total_size <= self.max_size:
+        break
+      os.remove(entry)
+      total_size -= size
+
+
+def _CacheKey(stage, extension, content):
+  sha = hashlib.sha1()
+  sha.update(('%s:%s:%s\n' % (_CACHE_VERSION, stage, extension)))
+  sha.update(content)
+  return sha.hexdigest()
+
+
+def OptimizeFile(args):
+  """Optimizes the file source with every stage in stages which has an
+  optimizer for it, and writes the result to destination.
+
+  Returns the path and a list of the stage and the sizes before and after
+  it, for each stage run.
+  """
+  path, source, destination, stages, cache = args
+  extension = os.path.splitext(path)[1].lower()
+  source_file = open(source, 'rb')
+  content = source_file.read()
+  source_file.close()
+  sizes = []
+  for stage in stages:
+    optimizer = OPTIMIZERS.get(stage, {}).get(extension)
+    if not optimizer:
+      continue
+    key = _CacheKey(stage, extension, content)
+    optimized = cache and cache.Lookup(key)
+    if optimized is None:
+      optimized = optimizer(content)
+      if len(optimized) >= len(content):
+        optimized = content
+      if cache:
+        cache.Store(key, optimized)
+    sizes.append((stage, len(content), len(optimized)))
+    content = optimized
+  destination_file = open(destination, 'wb')
+  destination_file.write(content)
+  destination_file.close()
+  shutil.copystat(source, destination)
+  return path, sizes
+
+
+def _CreatePool(jobs):
+  """Returns a process pool, or a thread pool where processes can not be
+  started, like in the workers of make_webapp.py and in pipeline threads.
+  zlib releases the GIL, so PNGs still use all threads.
+  """
+  if (multiprocessing.current_process().daemon or
+      threading.current_thread().name != 'MainThread'):
+    return ThreadPool(jobs)
+  return multiprocessing.Pool(jobs)
+
+
+def OptimizeApp(source_dir, dest_dir, stages=DEFAULT_STAGES, cache=None,
+                jobs=None):
+  """Writes the app in source_dir to dest_dir, with its assets optimized by
+  stages. dest_dir is replaced as a whole once the app is written.
+
+  Returns a dict of the total size before and after each stage run, and
+  the number of files it changed.
+  """
+  files = _ListFiles(source_dir)
+  report = {}
+  if PRUNE_STAGE in stages:
+    reachable = FindReachableFiles(source_dir)
+    if reachable is not None:
+      pruned = [path for path in files if path not in reachable]
+      files = [path for path in files if path in reachable]
+      report[PRUNE_STAGE] = [
+          sum(os.path.getsize(os.path.join(source_dir, path))
+              for path in pruned), 0, len(pruned)]
+  parent_dir = os.path.dirname(os.path.abspath(dest_dir))
+  if not os.path.exists(parent_dir):
+    try:
+      os.makedirs(parent_dir)
+    except OSError:
+      if not os.path.isdir(parent_dir):
+        raise
+  temp_dir = tempfile.mkdtemp(prefix='.tmp-' + os.path.basename(dest_dir),
+                              dir=parent_dir)
+  try:
+    tasks = []
+    for path in files:
+      source = os.path.join(source_dir, path)
+      destination = os.path.join(temp_dir, path)
+      if not os.path.isdir(os.path.dirname(destination)):
+        os.makedirs(os.path.dirname(destination))
+      extension = os.path.splitext(path)[1].lower()
+      if [stage for stage in stages
+          if extension in OPTIMIZERS.get(stage, {})]:
+        tasks.append((path, source, destination, stages, cache))
+      else:
+        # The sources are never modified in place, so a link will do.
+        LinkFile(source, destination)
+    jobs = min(jobs or multiprocessing.cpu_count(), len(tasks))
+    if jobs <= 1:
+      results = [OptimizeFile(task) for task in tasks]
+    else:
+      pool = _CreatePool(jobs)
+      try:
+        results = pool.map(OptimizeFile, tasks)
+        pool.close()
+      except:
+        pool.terminate()
+        raise
+      finally:
+        pool.join()
+    for _, sizes in results:
+      for stage, before, after in sizes:
+        totals = report.setdefault(stage, [0, 0, 0])
+        totals[0] += before
+        totals[1] += after
+        if after != before:
+          totals[2] += 1
+    # Swap the new dir in, readers see either the old or the new app.
+    old_dir = None
+    if os.path.exists(dest_dir):
+      old_dir = tempfile.mkdtemp(prefix='.old-', dir=parent_dir)
+      os.rename(dest_dir, os.path.join(old_dir, 'app'))
+    os.rename(temp_dir, dest_dir)
+    if old_dir:
+      shutil.rmtree(old_dir, ignore_errors=True)
+  finally:
+    if os.path.exists(temp_dir):
+      shutil.rmtree(temp_dir, ignore_errors=True)
+  if cache:
+    cache.Evict()
+  return report
+
+
+def _FormatSize(size):
+  if size >= 1024 * 1024:
+    return '%.1fMB' % (size / (1024.0 * 1024))
+  return '%.1fKB' % (size / 1024.0)
+
+
+def FormatReport(app, report):
+  """Returns the size deltas of report, like OptimizeApp returns, as lines
+  tagged with app.
+  """
+  lines = []
+  for stage in STAGES + tuple(sorted(set(report) - set(STAGES))):
+    if stage not in report:
+      continue
+    before, after, changed = report[stage]
+    percent = before and 100.0 * (after - before) / before
+    lines.append('[%s]: %s: %s -> %s (%+.1f%%), %d files' %
+                 (app, stage, _FormatSize(before), _FormatSize(after),
+                  percent, changed))
+  return '\n'.join(lines)
+
+
+def ParseStages(value):
+  """Returns the stages named by value, a comma separated list, 'default'
+  or 'all'. Raises ValueError for unknown stages.
+  """
+  if value == 'all':
+    return STAGES
+  if value == 'default':
+    return DEFAULT_STAGES
+  stages = [stage.strip() for stage in value.split(',') if stage.strip()]
+  for stage in stages:
+    if stage != PRUNE_STAGE and stage not in OPTIMIZERS:
+      raise ValueError('Unknown asset stage ' + stage)
+  return tuple(stage for stage in STAGES if stage in stages) + tuple(
+      stage for stage in stages if stage not in STAGES)
+
+
+def main():
+  parser = optparse.OptionParser(usage='%prog [options] source_dir dest_dir')
+  parser.add_option('--stages', action='store', dest='stages',
+      default='default',
+      help='The comma separated stages to run, of ' + ', '.join(STAGES) +
+           ', or all. minify and png by default. Such as: --stages=all')
+  parser.add_option('-j', '--jobs', action='store', dest='jobs', type='int',
+      help='The number of files optimized at a time, all CPUs by default.')
+  parser.add_option('--no-cache', action='store_true', dest='no_cache',
+      default=False,
+      help='Optimize every file, even if it was optimized before.')
+  parser.add_option('--cache-dir', action='store', dest='cache_dir',
+      default=DEFAULT_CACHE_DIR,
+      help='The directory of the cached assets.')
+  options, args = parser.parse_args()
+  if len(args) != 2:
+    parser.error('The source and destination dirs are required.')
+  try:
+    stages = ParseStages(options.stages)
+  except ValueError as e:
+    parser.error(str(e))
+  cache = None
+  if not options.no_cache:
+    cache = AssetCache(options.cache_dir)
+  report = OptimizeApp(args[0], args[1], stages, cache, options.jobs)
+  print (FormatReport(os.path.basename(os.path.normpath(args[0])), report))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Tests the minifiers of asset_optimizer.py against golden outputs.
+
+Sample usage from shell script:
+python -m unittest asset_optimizer_unittest
+"""
+import unittest
+
+from asset_optimizer import MinifyCss, MinifyHtml, MinifyJs
+
+# A / is a division after an operand, and a regular expression elsewhere.
+JS_REGEX_AND_DIVISION = [
+  ('a = b / c / d;', 'a=b / c / d;\n'),
+  ('var x = (a + b) / 2 / c;', 'var x=(a + b)/ 2 / c;\n'),
+  ('x = y[i] / 2; // half', 'x=y[i]/ 2;\n'),
+  ('x = /ab+c/g.test(s);', 'x=/ab+c/g.test(s);\n'),
+  ('if (/^\\/\\*/.test(s)) f();', 'if(/^\\/\\*/.test(s))f();\n'),
+  ('return /[/]x/.exec(s);', 'return /[/]x/.exec(s);\n'),
+  ('var t = typeof /x/;', 'var t=typeof /x/;\n'),
+  ('f(a, /=/);', 'f(a,/=/);\n'),
+]
+
+# Line breaks are kept, automatic semicolon insertion depends on them.
+JS_ASI = [
+  ('a = b\n(c)', 'a=b\n(c)\n'),
+  ('return\nx', 'return\nx\n'),
+  ('a\n++b', 'a\n++b\n'),
+  ('var a = 1\n\n\n  var b = 2', 'var a=1\nvar b=2\n'),
+  ('a/*\n*/b', 'a\nb\n'),
+  ('if (a) {\n  b();\n}\n', 'if(a){\nb();\n}\n'),
+]
+
+# Template literals, their placeholders and strings are kept as they are.
+JS_LITERALS = [
+  ('x = `a  ${ b + `c  ${d}` }  e`;', 'x=`a  ${ b + `c  ${d}` }  e`;\n'),
+  ('x = `// not  a comment\n  line`;', 'x=`// not  a comment\n  line`;\n'),
+  ('x = `${ "}" }`;', 'x=`${ "}" }`;\n'),
+  ('x = "http://example.com";  // comment', 'x="http://example.com";\n'),
+  ('x = a - -b + +c;', 'x=a - -b + +c;\n'),
+]
+
+JS_COMMENTS = [
+  ('/*! License */\nvar  a = 1; /* gone */', '/*! License */\nvar a=1;\n'),
+  ('a /* c */ b', 'a b\n'),
+  # Code the minifier does not understand is left alone.
+  ('x = "unterminated\n', 'x = "unterminated\n'),
+  ('x = `unterminated ${ a', 'x = `unterminated ${ a'),
+]
+
+CSS = [
+  ('a  >  b { color: red ; }', 'a>b{color:red}\n'),
+  ('a::before { content: "  x  " } /* c */', 'a::before{content:"  x  "}\n'),
+  ('/*! keep */ p {margin:0}', '/*! keep */ p{margin:0}\n'),
+  ('a b\n{ x: y }', 'a b{x:y}\n'),
+]
+
+HTML = [
+  ('<div   class="a  b">\n  <!-- gone -->  <p>x   y</p>\n</div>',
+   '<div class="a  b">\n <p>x y</p>\n</div>'),
+  ('<!--[if IE]><p>ie</p><![endif]-->', '<!--[if IE]><p>ie</p><![endif]-->'),
+  ('<pre>  keep\n   this </pre>', '<pre>  keep\n   this </pre>'),
+  ('<script>\n  var a = 1;  // c\n</script>', '<script>var a=1;\n</script>'),
+  ('<script type="text/template"> <b>  x </b> </script>',
+   '<script type="text/template"> <b>  x </b> </script>'),
+  ('<style>\n a { color: red ; }\n</style>', '<style>a{color:red}\n</style>'),
+]
+
+
+class MinifyTest(unittest.TestCase):
+  def AssertGolden(self, minify, cases):
+    for source, expected in cases:
+      self.assertEqual(minify(source), expected, repr(source))
+
+  def testJsRegexAndDivision(self):
+    self.AssertGolden(MinifyJs, JS_REGEX_AND_DIVISION)
+
+  def testJsAsi(self):
+    self.AssertGolden(MinifyJs, JS_ASI)
+
+  def testJsLiterals(self):
+    self.AssertGolden(MinifyJs, JS_LITERALS)
+
+  def testJsComments(self):
+    self.AssertGolden(MinifyJs, JS_COMMENTS)
+
+  def testJsIsStable(self):
+    for source, expected in (JS_REGEX_AND_DIVISION + JS_ASI + JS_LITERALS +
+                             JS_COMMENTS):
+      self.assertEqual(MinifyJs(expected), expected, repr(source))
+
+  def testCss(self):
+    self.AssertGolden(MinifyCss, CSS)
+
+  def testHtml(self):
+    self.AssertGolden(MinifyHtml, HTML)
+
+
+if __name__ == '__main__':
+  unittest.main()
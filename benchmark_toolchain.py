@@ -0,0 +1,528 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Benchmarks the packaging toolchain on synthetic data.
+
+The data is generated in the shape of the real apps: many small JS, CSS and
+HTML files in deep dirs, a few large images and audio files which do not
+compress, a crosswalk package zip holding an app template, and a stub
+make_apk.py in place of the real one. The same seed gives the same data.
+
+The benchmarks are:
+  walk             : hashes an app tree like the APK build cache does.
+  xpk              : XPKGenerator.Generate of an app.
+  xpk_incremental  : XPKGenerator.Generate of an unchanged app again, reusing
+                     the previous package.
+  extract_template : GetXWalkAppTemplate.ExtractAppTemplate of the package.
+  build_apps       : make_webapp.BuildApps of several apps with the stub.
+
+Every run of a benchmark is a process of its own, so that its peak RSS is
+its own. The result holds the median wall time, the throughput and the peak
+RSS of every benchmark, and can be compared against a stored baseline.
+
+Sample usage from shell script:
+Run all benchmarks and store the result as the baseline
+    python benchmark_toolchain.py --output=baseline.json
+Compare against the baseline, fail if a benchmark got 10% slower
+    python benchmark_toolchain.py --baseline=baseline.json --threshold=0.1
+Run only the XPK benchmarks on a quarter of the data, 5 times each
+    python benchmark_toolchain.py --benchmarks=xpk,xpk_incremental --scale=0.25 --repeat=5
+"""
+
+import hashlib
+import json
+import multiprocessing
+import optparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+try:
+  import resource
+except ImportError:
+  # No resource module on Windows, no peak RSS there.
+  resource = None
+
+BENCHMARKS = ('walk', 'xpk', 'xpk_incremental', 'extract_template',
+              'build_apps')
+DEFAULT_SEED = 2013
+TEMPLATE_VERSION = '0.0.0.1'
+
+_WORDS = ('function', 'var', 'return', 'this', 'prototype', 'document',
+          'window', 'element', 'style', 'color', 'margin', 'padding', 'width',
+          'height', 'div', 'span', 'class', 'if', 'else', 'for', 'new',
+          'null', 'true', 'false', 'callback', 'event', 'listener', 'game')
+
+_STUB_MAKE_APK = '''#!/usr/bin/env python
+# Stands in for make_apk.py: stores the app in <name>.apk in the current dir.
+import json
+import os
+import sys
+import zipfile
+
+args = dict(arg.split('=', 1) for arg in sys.argv[1:] if '=' in arg)
+manifest_path = args['--manifest']
+manifest_file = open(manifest_path)
+name = json.load(manifest_file)['name']
+manifest_file.close()
+app_root = os.path.dirname(manifest_path)
+apk = zipfile.ZipFile(name + '.apk', 'w', zipfile.ZIP_STORED)
+for dirname, _, files in os.walk(app_root):
+  for filename in files:
+    path = os.path.join(dirname, filename)
+    apk.write(path, os.path.relpath(path, app_root))
+apk.close()
+'''
+
+
+def _RandomBytes(seed, size):
+  """Returns size incompressible bytes, the same ones for the same seed."""
+  blocks = []
+  counter = 0
+  while size > 0:
+    block = hashlib.sha256(('%s:%d' % (seed, counter)).encode('utf-8'))
+    blocks.append(block.digest()[:size])
+    size -= 32
+    counter += 1
+  return b''.join(blocks)
+
+
+def _RandomText(rng, size):
+  """Returns about size bytes of code-like, compressible text."""
+  words = []
+  length = 0
+  while length < size:
+    word = rng.choice(_WORDS)
+    words.append(word)
+    length += len(word) + 1
+    if rng.random() < 0.1:
+      words.append('\n')
+  return ' '.join(words).encode('utf-8')
+
+
+def _WriteFile(path, data):
+  dirname = os.path.dirname(path)
+  if not os.path.isdir(dirname):
+    os.makedirs(dirname)
+  output_file = open(path, 'wb')
+  output_file.write(data)
+  output_file.close()
+
+
+def CreateSyntheticApp(app_dir, name, seed=DEFAULT_SEED, scale=1.0):
+  """Creates an app named name in app_dir: src with many small text files
+  in deep dirs and a few large assets, and a manifest.json.
+
+  Returns the number of files and their total size.
+  """
+  rng = random.Random('%s:%s' % (seed, name))
+  src_dir = os.path.join(app_dir, 'src')
+  files = 0
+  size = 0
+  extensions = ('.js', '.js', '.js', '.css', '.html', '.json')
+  for i in range(max(int(300 * scale), 1)):
+    depth = rng.randint(0, 6)
+    dirs = ['d%d' % rng.randint(0, 3) for _ in range(depth)]
+    file_name = 'f%d%s' % (i, rng.choice(extensions))
+    path = os.path.join(src_dir, *(dirs + [file_name]))
+    data = _RandomText(rng, rng.randint(512, 20 * 1024))
+    _WriteFile(path, data)
+    files += 1
+    size += len(data)
+  assets = [('images/background.png', 1536), ('images/sprites.png', 768),
+            ('images/icon_128.png', 64), ('audio/music.ogg', 3072),
+            ('audio/click.ogg', 128)]
+  for i, (asset, kb) in enumerate(assets):
+    data = _RandomBytes('%s:%s:%d' % (seed, name, i),
+                        max(int(kb * 1024 * scale), 1))
+    _WriteFile(os.path.join(src_dir, asset), data)
+    files += 1
+    size += len(data)
+  manifest = json.dumps({'name': name, 'version': '1.0.0',
+                         'launch_path': 'index.html'}).encode('utf-8')
+  _WriteFile(os.path.join(src_dir, 'index.html'), b'<html></html>')
+  _WriteFile(os.path.join(app_dir, 'manifest.json'), manifest)
+  return files + 2, size + len(manifest) + 13
+
+
+def CreateStubTemplate(template_dir, seed=DEFAULT_SEED, scale=1.0):
+  """Creates an xwalk_app_template with the stub make_apk.py, large native
+  libs and many small resources.
+
+  Returns the total size of its files.
+  """
+  rng = random.Random('%s:template' % seed)
+  _WriteFile(os.path.join(template_dir, 'make_apk.py'),
+             _STUB_MAKE_APK.encode('utf-8'))
+  os.chmod(os.path.join(template_dir, 'make_apk.py'), 0o755)
+  _WriteFile(os.path.join(template_dir, 'VERSION'),
+             TEMPLATE_VERSION.encode('utf-8'))
+  size = len(_STUB_MAKE_APK) + len(TEMPLATE_VERSION)
+  for i, mb in enumerate((12, 4)):
+    data = _RandomBytes('%s:lib:%d' % (seed, i),
+                        max(int(mb * 1024 * 1024 * scale), 1))
+    _WriteFile(os.path.join(template_dir, 'native_libs', 'x86',
+                            'lib%d.so' % i), data)
+    size += len(data)
+  for i in range(max(int(200 * scale), 1)):
+    data = _RandomText(rng, rng.randint(256, 4096))
+    _WriteFile(os.path.join(template_dir, 'res', 'r%d' % (i % 10),
+                            'res%d.xml' % i), data)
+    size += len(data)
+  return size
+
+
+def CreateCrosswalkPackage(dest_dir, seed=DEFAULT_SEED, scale=1.0):
+  """Creates crosswalk-<version>-x86.zip in dest_dir holding an app template
+  tar.gz and a large runtime APK.
+
+  Returns the path of the zip and the size of the template files.
+  """
+  package_name = 'crosswalk-' + TEMPLATE_VERSION + '-x86'
+  work_dir = tempfile.mkdtemp(dir=dest_dir)
+  try:
+    template_dir = os.path.join(work_dir, 'xwalk_app_template')
+    template_size = CreateStubTemplate(template_dir, seed, scale)
+    tar_path = os.path.join(work_dir, 'xwalk_app_template.tar.gz')
+    tar = tarfile.open(tar_path, 'w:gz')
+    tar.add(template_dir, 'xwalk_app_template')
+    tar.close()
+    zip_path = os.path.join(dest_dir, package_name + '.zip')
+    package = zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED)
+    package.write(tar_path, package_name + '/xwalk_app_template.tar.gz')
+    package.writestr(package_name + '/apks/XWalkRuntimeLib.apk',
+                     _RandomBytes('%s:runtime' % seed,
+                                  max(int(20 * 1024 * 1024 * scale), 1)))
+    package.close()
+  finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
+  return zip_path, template_size
+
+
+def _GenerateKey(key_file):
+  from Crypto.PublicKey import RSA
+  key = RSA.generate(1024)
+  key_output = open(key_file, 'wb')
+  key_output.write(key.exportKey('PEM'))
+  key_output.close()
+
+
+class _BuildOptions(object):
+  """The options of make_webapp.BuildApps."""
+  def __init__(self, jobs):
+    self.jobs = jobs
+    self.no_cache = True
+    self.arch = None
+    self.optimize_assets = None
+    self.timeout = None
+
+
+def SetUp(work_dir, benchmarks, seed, scale):
+  """Generates the data of benchmarks in work_dir.
+
+  Returns the size of the data of every benchmark as a dict of
+  {'files': ..., 'bytes': ...}.
+  """
+  sizes = {}
+  if set(benchmarks) & set(['walk', 'xpk', 'xpk_incremental']):
+    files, size = CreateSyntheticApp(os.path.join(work_dir, 'apps', 'App'),
+                                     'App', seed, scale)
+    for name in ('walk', 'xpk', 'xpk_incremental'):
+      sizes[name] = {'files': files, 'bytes': size}
+  if 'walk' in benchmarks:
+    CreateStubTemplate(os.path.join(work_dir, 'apps', 'android',
+                                    'xwalk_app_template'), seed, 0.01)
+  if set(benchmarks) & set(['xpk', 'xpk_incremental']):
+    _GenerateKey(os.path.join(work_dir, 'key.pem'))
+  if 'extract_template' in benchmarks:
+    package_dir = os.path.join(work_dir, 'package')
+    os.makedirs(package_dir)
+    _, template_size = CreateCrosswalkPackage(package_dir, seed, scale)
+    sizes['extract_template'] = {'files': 0, 'bytes': template_size}
+  if 'build_apps' in benchmarks:
+    workspace = os.path.join(work_dir, 'workspace')
+    CreateStubTemplate(os.path.join(workspace, 'android',
+                                    'xwalk_app_template'), seed, scale * 0.25)
+    total_files = 0
+    total_size = 0
+    for i in range(max(int(8 * scale), 2)):
+      files, size = CreateSyntheticApp(os.path.join(workspace, 'App%d' % i),
+                                       'App%d' % i, seed, scale * 0.25)
+      total_files += files
+      total_size += size
+    sizes['build_apps'] = {'files': total_files, 'bytes': total_size}
+  return sizes
+
+
+def _RunWalk(work_dir, jobs):
+  import android.build_cache
+  apps_dir = os.path.join(work_dir, 'apps')
+  android.build_cache.ComputeBuildKey(
+      apps_dir, 'App', os.path.join(apps_dir, 'android', 'xwalk_app_template'))
+
+
+def _RunXpk(work_dir, jobs, incremental=False):
+  import make_xpk
+  output_file = os.path.join(work_dir, 'App.xpk')
+  if not incremental and os.path.exists(output_file):
+    os.remove(output_file)
+  if incremental and not os.path.exists(output_file):
+    raise RuntimeError('No previous package to reuse.')
+  source_dir = os.path.join(work_dir, 'apps', 'App', 'src')
+  generator = make_xpk.XPKGenerator(source_dir,
+                                    os.path.join(work_dir, 'key.pem'),
+                                    output_file, jobs, incremental)
+  if not generator.Generate():
+    raise RuntimeError('XPKGenerator failed.')
+
+
+def _RunExtractTemplate(work_dir, jobs):
+  import android.get_xwalk_app_template
+  handler = android.get_xwalk_app_template.GetXWalkAppTemplate(
+      '', 'crosswalk-', TEMPLATE_VERSION, 'xwalk_app_template.tar.gz',
+      os.path.join(work_dir, 'package'))
+  # DownloadCrosswalkPackage sets the arch, the package is never downloaded.
+  handler.arch = '-x86'
+  handler.ExtractAppTemplate()
+  if not os.path.exists(os.path.join(work_dir, 'package', 'xwalk_app_template',
+                                     'make_apk.py')):
+    raise RuntimeError('The template was not extracted.')
+
+
+def _RunBuildApps(work_dir, jobs):
+  import android.build_telemetry
+  import make_webapp
+  workspace = os.path.join(work_dir, 'workspace')
+  shutil.rmtree(os.path.join(workspace, 'out'), ignore_errors=True)
+  apps = sorted(name for name in os.listdir(workspace)
+                if name.startswith('App'))
+  result = make_webapp.BuildApps(make_webapp.BuildForAndroidApp,
+                                 _BuildOptions(jobs), workspace, apps, '',
+                                 android.build_telemetry.BuildTelemetry())
+  if 'Failed' in result:
+    raise RuntimeError(result)
+
+
+def _PrepareRun(name, work_dir, jobs):
+  """Runs what a benchmark needs before it is timed."""
+  if name == 'xpk_incremental':
+    _RunXpk(work_dir, jobs)
+
+
+def RunOne(name, work_dir, jobs):
+  """Runs benchmark name once in this process.
+
+  Returns the wall time and the peak RSS in KB of this process and its
+  children.
+  """
+  runners = {
+    'walk': _RunWalk,
+    'xpk': _RunXpk,
+    'xpk_incremental': lambda work_dir, jobs: _RunXpk(work_dir, jobs, True),
+    'extract_template': _RunExtractTemplate,
+    'build_apps': _RunBuildApps,
+  }
+  _PrepareRun(name, work_dir, jobs)
+  start = time.time()
+  runners[name](work_dir, jobs)
+  wall = time.time() - start
+  max_rss_kb = None
+  if resource:
+    max_rss_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                     resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+  return wall, max_rss_kb
+
+
+def _Median(values):
+  values = sorted(values)
+  middle = len(values) // 2
+  if len(values) % 2:
+    return values[middle]
+  return (values[middle - 1] + values[middle]) / 2.0
+
+
+def RunBenchmark(name, work_dir, jobs, repeat, size):
+  """Runs benchmark name repeat times, each in a new process.
+
+  Returns the result of the benchmark, or None if it failed.
+  """
+  walls = []
+  max_rss_kb = None
+  for _ in range(repeat):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                             '--run-one=' + name, '--work-dir=' + work_dir,
+                             '--jobs=%d' % jobs],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    out, _ = proc.communicate()
+    lines = out.strip().splitlines()
+    if proc.returncode or not lines:
+      print ('[Error]: Benchmark ' + name + ' failed:\n' + out)
+      return None
+    run = json.loads(lines[-1])
+    walls.append(run['wall'])
+    if run['max_rss_kb'] is not None:
+      max_rss_kb = max(max_rss_kb or 0, run['max_rss_kb'])
+  wall = _Median(walls)
+  result = {
+    'wall': wall,
+    'walls': walls,
+    'max_rss_kb': max_rss_kb,
+    'files': size['files'],
+    'bytes': size['bytes'],
+    'mb_per_s': size['bytes'] / 1024.0 / 1024.0 / max(wall, 1e-6),
+  }
+  if size['files']:
+    result['files_per_s'] = size['files'] / max(wall, 1e-6)
+  return result
+
+
+def CompareToBaseline(results, baseline, threshold):
+  """Prints the change of every benchmark against baseline.
+
+  Returns the names of the benchmarks which got slower than threshold, a
+  fraction of the baseline wall time.
+  """
+  regressions = []
+  for name in sorted(results):
+    if name not in baseline:
+      print ('%-18s no baseline' % name)
+      continue
+    before = baseline[name]['wall']
+    after = results[name]['wall']
+    change = (after - before) / max(before, 1e-6)
+    status = ''
+    if change > threshold:
+      status = ' REGRESSION'
+      regressions.append(name)
+    print ('%-18s %8.3fs -> %8.3fs %+7.1f%%%s' % (name, before, after,
+                                                  change * 100, status))
+  return regressions
+
+
+def main():
+  parser = optparse.OptionParser()
+  parser.add_option('--benchmarks', action='store', dest='benchmarks',
+      default=','.join(BENCHMARKS),
+      help='The benchmarks to run. Such as: --benchmarks=xpk,walk')
+  parser.add_option('--repeat', action='store', dest='repeat', type='int',
+      default=3,
+      help='The number of runs of every benchmark, the median wall time is '
+           'reported. Such as: --repeat=5')
+  parser.add_option('--scale', action='store', dest='scale', type='float',
+      default=1.0,
+      help='Scales the number and size of the generated files. '
+           'Such as: --scale=0.25')
+  parser.add_option('--seed', action='store', dest='seed', type='int',
+      default=DEFAULT_SEED,
+      help='The seed of the generated data. Such as: --seed=1')
+  parser.add_option('-j', '--jobs', action='store', dest='jobs', type='int',
+      default=multiprocessing.cpu_count(),
+      help='The jobs of XPKGenerator and BuildApps. Such as: --jobs=4')
+  parser.add_option('--work-dir', action='store', dest='work_dir',
+      help='Where the data is generated, a temp dir by default.')
+  parser.add_option('-o', '--output', action='store', dest='output',
+      help='Write the result as JSON to the file. Such as: '
+           '--output=baseline.json')
+  parser.add_option('--baseline', action='store', dest='baseline',
+      help='Compare against the result stored by a previous --output. '
+           'Such as: --baseline=baseline.json')
+  parser.add_option('--threshold', action='store', dest='threshold',
+      type='float', default=0.1,
+      help='The slowdown against the baseline reported as a regression. '
+           'Such as: --threshold=0.2')
+  parser.add_option('--run-one', action='store', dest='run_one',
+      help=optparse.SUPPRESS_HELP)
+  options, _ = parser.parse_args()
+
+  root_dir = os.path.dirname(os.path.abspath(__file__))
+  sys.path.insert(0, os.path.join(root_dir, 'bin'))
+  sys.path.insert(0, root_dir)
+  if options.run_one:
+    # Keep the output of the toolchain, and of its subprocesses, away from
+    # the result line.
+    result_output = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    sys.stdout.flush()
+    os.dup2(devnull, sys.stdout.fileno())
+    os.chdir(options.work_dir)
+    wall, max_rss_kb = RunOne(options.run_one, options.work_dir, options.jobs)
+    sys.stdout.flush()
+    result_output.write(json.dumps({'wall': wall,
+                                    'max_rss_kb': max_rss_kb}) + '\n')
+    result_output.close()
+    return 0
+
+  benchmarks = options.benchmarks.split(',')
+  for name in benchmarks:
+    if name not in BENCHMARKS:
+      parser.error('Unknown benchmark ' + name + ', the benchmarks are ' +
+                   ', '.join(BENCHMARKS) + '.')
+  if set(benchmarks) & set(['xpk', 'xpk_incremental']):
+    try:
+      import Crypto
+    except ImportError:
+      print ('[Warning]: pycrypto is not installed, skip the XPK benchmarks.')
+      benchmarks = [name for name in benchmarks
+                    if name not in ('xpk', 'xpk_incremental')]
+
+  work_dir = options.work_dir or tempfile.mkdtemp(prefix='xwalk-benchmark-')
+  work_dir = os.path.abspath(work_dir)
+  try:
+    print ('Generating the data in ' + work_dir)
+    sizes = SetUp(work_dir, benchmarks, options.seed, options.scale)
+    results = {}
+    for name in benchmarks:
+      print ('Running ' + name)
+      result = RunBenchmark(name, work_dir, options.jobs, options.repeat,
+                            sizes[name])
+      if not result:
+        return 1
+      results[name] = result
+      print ('%-18s %8.3fs %8.1f MB/s %10s files/s  peak RSS %s KB'
+             % (name, result['wall'], result['mb_per_s'],
+                '%.0f' % result['files_per_s'] if 'files_per_s' in result
+                else '-', result['max_rss_kb']))
+  finally:
+    if not options.work_dir:
+      shutil.rmtree(work_dir, ignore_errors=True)
+
+  report = {
+    'config': {
+      'scale': options.scale,
+      'seed': options.seed,
+      'jobs': options.jobs,
+      'repeat': options.repeat,
+      'python': sys.version.split()[0],
+      'platform': sys.platform,
+    },
+    'benchmarks': results,
+  }
+  if options.output:
+    output = open(options.output, 'w')
+    json.dump(report, output, indent=2, sort_keys=True)
+    output.write('\n')
+    output.close()
+  if options.baseline:
+    baseline_file = open(options.baseline, 'r')
+    baseline = json.load(baseline_file)
+    baseline_file.close()
+    if baseline.get('config', {}).get('scale') != options.scale:
+      print ('[Warning]: The baseline was run with another --scale.')
+    print ('\nCompared to ' + options.baseline + ':')
+    if CompareToBaseline(results, baseline['benchmarks'], options.threshold):
+      return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
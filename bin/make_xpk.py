@@ -6,34 +6,216 @@
 
 """
 Generate XPK package from package resources and the author private key.
+
+In reproducible mode the same resources and key always give the same
+package bytes. The content digest of the package is then stored in its zip
+comment, and a package whose digest did not change is not written again.
+
+With --blob-store-dir, compressed files are kept in a blob store shared by
+all runs which use it, see xpk_zip.BlobStore, so a file many apps ship is
+only compressed once. In batch mode, --duplicates prints the files which
+several packages carry, and --duplicates-only prints them without building
+the packages.
 """
 import argparse
+import collections
+import hashlib
 import os
+import shutil
+import tempfile
 from Crypto.PublicKey import RSA
 from Crypto import Random
 from Crypto.Signature import PKCS1_v1_5
 from Crypto.Hash import SHA
+from Crypto.Util import number
+from multiprocessing.pool import ThreadPool
+import multiprocessing
 import traceback
-import zipfile
 import struct
+import sys
+import threading
+import xpk_zip
+import zipfile
+import zlib
 
-class XPKGenerator(object):
-  def __init__(self, source_dir, key_file, output_file):
-    """
-    source_dir  : the path to package resource directory.
-    key_file    : the path to RSA private key file, if the file is invalid,
-                  generator will create it automatically.
-    output_file : the output XPK file path.
-    """
-    self.source_dir_ = source_dir
-    self.output_file_ = output_file
+XPK_MAGIC = '\x43\x72\x57\x6B'
+# The magic, the public key size and the signature size.
+XPK_HEADER_SIZE = 12
+# Prefix of the content digest in the zip comment of reproducible packages.
+CONTENT_DIGEST_PREFIX = b'xpk-content-sha256:'
+# Members compressed ahead of the writer, per job.
+_WINDOW_PER_JOB = 2
+
+
+def _BoundedImap(pool, func, items, window):
+  """
+  Like pool.imap, but at most window items are queued or done ahead of the
+  consumer, so their results don't pile up in memory when it is slower.
+  """
+  pending = collections.deque()
+  for item in items:
+    pending.append(pool.apply_async(func, (item,)))
+    if len(pending) >= window:
+      yield pending.popleft().get()
+  while pending:
+    yield pending.popleft().get()
+
+
+def _PrepareMember(entry):
+  (absname, relativename, previous, reproducible, blob_store, temp_dir,
+   hash_files) = entry
+  return xpk_zip.PrepareMember(absname, relativename, previous=previous,
+                               reproducible=reproducible,
+                               blob_store=blob_store, temp_dir=temp_dir,
+                               hash_files=hash_files)
+
+
+def ListFiles(source_dir):
+  """
+  Returns the (absolute path, name in the package) of every file under
+  source_dir, sorted by name.
+  """
+  entries = []
+  abs_src = os.path.abspath(source_dir)
+  for dirname, _, files in os.walk(source_dir):
+    for filename in files:
+      absname = os.path.abspath(os.path.join(dirname, filename))
+      relativename = absname[len(abs_src) + 1:].replace(os.sep, '/')
+      entries.append((absname, relativename))
+  entries.sort(key=lambda entry: entry[1])
+  return entries
+
+
+def _FileDigest(entry):
+  absname, relativename = entry
+  sha = hashlib.sha256()
+  input_file = open(absname, 'rb')
+  try:
+    while True:
+      chunk = input_file.read(xpk_zip.CHUNK_SIZE)
+      if not chunk:
+        break
+      sha.update(chunk)
+  finally:
+    input_file.close()
+  mode = os.stat(absname).st_mode
+  return relativename, xpk_zip.ReproducibleAttr(mode), sha.hexdigest()
+
+
+def _HashPackageFile(entry):
+  source_dir, absname = entry
+  _, size, digest = xpk_zip.HashFile(absname)
+  return source_dir, absname, size, digest
+
+
+def FindDuplicates(source_dirs, jobs=None):
+  """
+  Returns the files whose content is in more than one of source_dirs, as a
+  list of (wasted size, size, paths) tuples, the largest wasted size first.
+  The wasted size is what the copies beyond the first one take. Copies
+  inside one source dir are not counted.
+  """
+  entries = [(source_dir, absname) for source_dir in source_dirs
+             for absname, _ in ListFiles(source_dir)]
+  copies = {}
+  pool = ThreadPool(jobs or multiprocessing.cpu_count())
+  try:
+    for source_dir, absname, size, digest in pool.imap(_HashPackageFile,
+                                                       entries):
+      copies.setdefault((digest, size), {}).setdefault(source_dir, absname)
+  finally:
+    pool.close()
+    pool.join()
+  duplicates = []
+  for (_, size), paths in copies.items():
+    if len(paths) > 1 and size:
+      duplicates.append((size * (len(paths) - 1), size,
+                         sorted(paths.values())))
+  duplicates.sort(key=lambda duplicate: (-duplicate[0], duplicate[2]))
+  return duplicates
+
+
+def _FormatSize(size):
+  if size >= 1024 * 1024:
+    return '%.1fMB' % (size / (1024.0 * 1024))
+  return '%.1fKB' % (size / 1024.0)
+
+
+def FormatDuplicates(duplicates):
+  """Returns the report of duplicates, like FindDuplicates returns."""
+  lines = ['Files in several packages, by the size of the extra copies:']
+  for wasted, size, paths in duplicates:
+    lines.append('%9s  %9s x %d  %s' % (_FormatSize(wasted), _FormatSize(size),
+                                        len(paths), paths[0]))
+    for path in paths[1:]:
+      lines.append('%26s%s' % ('', path))
+  lines.append('%s in %d duplicated files.'
+               % (_FormatSize(sum(duplicate[0] for duplicate in duplicates)),
+                  len(duplicates)))
+  return '\n'.join(lines)
+
+
+def ComputeContentDigest(source_dir, pubkey, jobs=None):
+  """
+  Returns the SHA-256 hex digest of everything a reproducible package of
+  source_dir depends on: the names, contents and normalized permissions of
+  the files, the public key, the member timestamp and the compression
+  settings. Packages with the same digest have the same bytes, so this
+  tells identical packages apart without building them.
+  """
+  sha = hashlib.sha256()
+  sha.update(b'xpk-content-v1\n')
+  sha.update(('zlib:%s level:%d date_time:%r\n'
+              % (zlib.ZLIB_VERSION, xpk_zip.COMPRESSION_LEVEL,
+                 xpk_zip.ReproducibleDateTime())).encode('utf-8'))
+  sha.update(pubkey)
+  pool = ThreadPool(jobs or multiprocessing.cpu_count())
+  try:
+    for name, attr, digest in pool.imap(_FileDigest, ListFiles(source_dir)):
+      sha.update(('\nfile:%s:%d:%s' % (name, attr, digest)).encode('utf-8'))
+  finally:
+    pool.close()
+    pool.join()
+  return sha.hexdigest()
+
+
+def ReadContentDigest(xpk_file):
+  """
+  Returns the content digest stored in the reproducible package xpk_file,
+  or None if it has none.
+  """
+  try:
+    zfile = zipfile.ZipFile(xpk_file, 'r')
+  except (IOError, zipfile.BadZipfile):
+    return None
+  comment = zfile.comment
+  zfile.close()
+  if not comment.startswith(CONTENT_DIGEST_PREFIX):
+    return None
+  return comment[len(CONTENT_DIGEST_PREFIX):].decode('ascii')
+
+
+# Parsed RSA keys by key file path, so that batch mode reads every key once.
+_key_cache = {}
+_key_cache_lock = threading.Lock()
+
+
+def LoadKey(key_file):
+  """
+  Returns the RSA key in key_file. If the file does not exist, a new key is
+  generated and saved as key_file.
+  """
+  key_path = os.path.abspath(key_file)
+  with _key_cache_lock:
+    if key_path in _key_cache:
+      return _key_cache[key_path]
     if not os.path.exists(key_file):
       try:
         print('Start to generate RSA key')
         rng = Random.new().read
-        self.RSAkey = RSA.generate(1024, rng)
+        key = RSA.generate(1024, rng)
         kfile = open(key_file,'w')
-        kfile.write(self.RSAkey.exportKey('PEM'))
+        kfile.write(key.exportKey('PEM'))
         kfile.close()
         print('Finished generating RSA key, saved as %s' % key_file)
       except IOError:
@@ -41,82 +223,301 @@ class XPKGenerator(object):
           os.remove(key_file)
         traceback.print_exc()
     else:
-      self.RSAkey = RSA.importKey(open(key_file, 'r').read())
+      key = RSA.importKey(open(key_file, 'r').read())
+    _key_cache[key_path] = key
+    return key
+
+
+def _ReplaceFile(src, dst):
+  try:
+    os.rename(src, dst)
+  except OSError:
+    # Windows does not rename over an existing file.
+    os.remove(dst)
+    os.rename(src, dst)
+
+
+class XPKGenerator(object):
+  def __init__(self, source_dir, key_file, output_file, jobs=None,
+               incremental=False, reproducible=False, blob_store=None):
+    """
+    source_dir  : the path to package resource directory.
+    key_file    : the path to RSA private key file, if the file is invalid,
+                  generator will create it automatically.
+    output_file : the output XPK file path.
+    jobs        : the number of threads compressing files, all CPUs by
+                  default.
+    incremental : reuse the compressed members of an existing output_file
+                  for the files which did not change, as told by the digests
+                  recorded next to it by the last incremental run.
+    reproducible : give every file the same timestamp and normalized
+                  permissions, and store the content digest in the package.
+    blob_store  : an xpk_zip.BlobStore holding the compressed data of files
+                  packaged before, or None to compress every file.
+    """
+    self.source_dir_ = source_dir
+    self.output_file_ = output_file
+    self.jobs_ = jobs or multiprocessing.cpu_count()
+    self.incremental_ = incremental
+    self.reproducible_ = reproducible
+    self.blob_store_ = blob_store
+    self.RSAkey = LoadKey(key_file)
     self.pubkey = self.RSAkey.publickey().exportKey('DER')
 
+  def ContentDigest(self):
+    return ComputeContentDigest(self.source_dir_, self.pubkey, self.jobs_)
+
   def Generate(self):
     if not os.path.exists(self.source_dir_):
       print("The source directory %s is invalid." % self.source_dir_)
-      return
+      return False
+    comment = b''
+    if self.reproducible_:
+      content_digest = self.ContentDigest()
+      # The package would come out byte for byte the same.
+      if ReadContentDigest(self.output_file_) == content_digest:
+        print('XPK package %s is up to date.' % self.output_file_)
+        return True
+      comment = CONTENT_DIGEST_PREFIX + content_digest.encode('ascii')
+    previous = None
+    if self.incremental_ and os.path.exists(self.output_file_):
+      try:
+        previous = xpk_zip.PreviousPackage(self.output_file_)
+      except zipfile.BadZipfile:
+        print('Can not reuse the broken package %s.' % self.output_file_)
+    # The package is written next to the output, which may still be read
+    # for incremental packaging, and renamed when it is complete.
+    temp_file = '%s.tmp' % self.output_file_
+    # The deflated data of large files waits there for its turn to be
+    # written, on the disk of the output rather than in memory.
+    temp_dir = tempfile.mkdtemp(
+        prefix='.xpk-deflate-',
+        dir=os.path.dirname(os.path.abspath(self.output_file_)))
     try:
-      zip_file = '%s.tmp' % self.output_file_
-      self.__Compress(self.source_dir_, zip_file)
       signer = PKCS1_v1_5.new(self.RSAkey)
-      zfile = open(zip_file, 'rb')
-      sha = SHA.new(zfile.read())
+      signature_size = (number.size(self.RSAkey.n) + 7) // 8
+      header_size = XPK_HEADER_SIZE + len(self.pubkey) + signature_size
+      xpk = open(temp_file, 'wb')
+      # The zip is written straight after a reserved header and hashed as it
+      # is written, so it is never read back or copied.
+      xpk.write('\0' * header_size)
+      sha = SHA.new()
+      digests = self.__Compress(self.source_dir_, xpk, sha, self.jobs_,
+                                previous, self.reproducible_, comment,
+                                self.blob_store_, temp_dir, self.incremental_)
       signature = signer.sign(sha)
-      xpk = open(self.output_file_, 'wb')
-      zfile.seek(0)
+      if len(signature) != signature_size:
+        raise IOError('Unexpected signature size %d' % len(signature))
       print('Generating XPK package: %s' % self.output_file_)
-      xpk.write('\x43\x72\x57\x6B')
+      xpk.seek(0)
+      xpk.write(XPK_MAGIC)
       xpk.write(struct.pack('<I', len(self.pubkey)))
       xpk.write(struct.pack('<I', len(signature)))
       xpk.write(self.pubkey)
       xpk.write(signature)
-      xpk.write(zfile.read())
-      zfile.close()
       xpk.close()
+      _ReplaceFile(temp_file, self.output_file_)
+      # The next incremental run reuses the members of unchanged files by
+      # their digests.
+      if self.incremental_:
+        xpk_zip.WriteDigests(self.output_file_, digests)
+      else:
+        xpk_zip.RemoveDigests(self.output_file_)
       print('Generated new XPK package %s successfully.'
             % self.output_file_)
+      return True
     except IOError:
-      if os.path.exists(self.output_file_):
-        os.remove(self.output_file_)
       traceback.print_exc()
+      return False
     finally:
-      if os.path.exists(zip_file):
-        os.remove(zip_file)
+      if os.path.exists(temp_file):
+        os.remove(temp_file)
+      shutil.rmtree(temp_dir, ignore_errors=True)
 
   @classmethod
-  def __Compress(cls, src, dst):
+  def __Compress(cls, src, dst, sha, jobs, previous=None, reproducible=False,
+                 comment=b'', blob_store=None, temp_dir=None,
+                 hash_files=False):
+    print('Adding resources from %s into package.' % src)
+    # Members are compressed in parallel but always written in name order,
+    # so the same input gives the same package.
+    entries = [(absname, relativename, previous, reproducible, blob_store,
+                temp_dir, hash_files)
+               for absname, relativename in ListFiles(src)]
+    zfile = xpk_zip.ZipWriter(dst, sha)
+    pool = ThreadPool(jobs)
+    reused = 0
     try:
-      print('Adding resources from %s into package.' % src)
-      zfile = zipfile.ZipFile(dst, 'w')
-      abs_src = os.path.abspath(src)
-      for dirname, _, files in os.walk(src):
-        for filename in files:
-          absname = os.path.abspath(os.path.join(dirname, filename))
-          relativename = absname[len(abs_src) + 1:]
-          zfile.write(absname, relativename)
-      zfile.close()
-      print('Generated package successfully.')
-    except IOError:
-      if os.path.exists(dst):
-        os.remove(dst)
-      traceback.print_exc()
+      for member in _BoundedImap(pool, _PrepareMember, entries,
+                                 _WINDOW_PER_JOB * jobs):
+        if previous and member.path == previous.path:
+          reused += 1
+        try:
+          zfile.Write(member)
+        finally:
+          member.Discard()
+    finally:
+      pool.close()
+      pool.join()
+    zfile.Close(comment)
+    if previous:
+      print('Reused %d of %d files from the previous package.'
+            % (reused, len(entries)))
+    print('Generated package successfully.')
+    return zfile.digests
+
+def DefaultOutputFile(input_dir):
+  head, tail = os.path.split(input_dir)
+  while len(tail) == 0:
+    head, tail = os.path.split(head)
+  return tail + '.xpk'
+
+
+def ReadBatch(batch_file):
+  """
+  Reads the packages of a batch, one 'input_dir key_file [output_file]'
+  line per package. Empty lines and lines starting with '#' are skipped.
+  """
+  packages = []
+  for line in batch_file:
+    line = line.strip()
+    if not line or line.startswith('#'):
+      continue
+    fields = line.split()
+    if len(fields) == 2:
+      fields.append(DefaultOutputFile(fields[0]))
+    if len(fields) != 3:
+      raise ValueError('Invalid batch line: %s' % line)
+    packages.append(tuple(fields))
+  return packages
+
+
+def _GeneratePackage(package):
+  (input_dir, key_file, output_file, incremental, reproducible,
+   blob_store) = package
+  try:
+    # Packages are already built in parallel, one thread each is enough.
+    generator = XPKGenerator(input_dir, key_file, output_file, 1, incremental,
+                             reproducible, blob_store)
+    return generator.Generate()
+  except Exception:
+    traceback.print_exc()
+    return False
+
+
+def GenerateBatch(packages, jobs=None, incremental=False, reproducible=False,
+                  blob_store=None):
+  """
+  Generates many XPK packages in one process, jobs of them at a time. Every
+  key file is parsed once, however many packages it signs, and files the
+  packages share are compressed once through blob_store.
+  Returns the list of failed output files.
+  """
+  pool = ThreadPool(jobs or multiprocessing.cpu_count())
+  try:
+    results = pool.map(_GeneratePackage,
+                       [package + (incremental, reproducible, blob_store)
+                        for package in packages])
+  finally:
+    pool.close()
+    pool.join()
+  return [package[2] for package, result in zip(packages, results)
+          if not result]
+
+
+def _CloseBlobStore(blob_store):
+  """Prints how many files were found in blob_store and trims it."""
+  if not blob_store:
+    return
+  if blob_store.hits + blob_store.misses:
+    print('Took %d of %d compressed files from the blob store.'
+          % (blob_store.hits, blob_store.hits + blob_store.misses))
+  blob_store.Evict()
+
 
 def main():
   parser = argparse.ArgumentParser(
       description='XPKGenerator arguments parser')
-  parser.add_argument('input',
+  parser.add_argument('input', nargs='?',
       help='Directory path to Crosswalk package resources')
   parser.add_argument(
-      'key',
+      'key', nargs='?',
       help='Path to private key file, a new private ' \
            'key file will be generated if it is invalid.')
   parser.add_argument(
       '-o', '--output',
       help='Path to generated XPK file',
       default='default')
+  parser.add_argument(
+      '-j', '--jobs', type=int,
+      help='Number of threads compressing files, all CPUs by default. '
+           'In batch mode, the number of packages built at a time')
+  parser.add_argument(
+      '-i', '--incremental', action='store_true',
+      help='Only compress the files changed since the output XPK was built')
+  parser.add_argument(
+      '-r', '--reproducible', action='store_true',
+      help='Build the same bytes from the same files and key, and skip '
+           'packages whose content did not change')
+  parser.add_argument(
+      '--blob-store-dir',
+      help='Keep the compressed files in this directory, and reuse the ones '
+           'of files packaged before, such as %s. Every file is compressed '
+           'by default' % xpk_zip.DEFAULT_BLOB_STORE_DIR)
+  parser.add_argument(
+      '--duplicates', action='store_true',
+      help='In batch mode, also print the files which are in several '
+           'packages, by size')
+  parser.add_argument(
+      '--duplicates-only', action='store_true',
+      help='In batch mode, only print the files which are in several '
+           'packages, without building them')
+  parser.add_argument(
+      '--digest', action='store_true',
+      help='Only print the content digest of the reproducible package')
+  parser.add_argument(
+      '-b', '--batch',
+      help='Build all packages listed in the file, "-" for stdin. Each line '
+           'is "input_dir key_file [output_file]"')
   args = parser.parse_args()
 
+  blob_store = None
+  if args.blob_store_dir:
+    blob_store = xpk_zip.BlobStore(args.blob_store_dir)
+  if args.batch:
+    if args.batch == '-':
+      packages = ReadBatch(sys.stdin)
+    else:
+      batch_file = open(args.batch, 'r')
+      packages = ReadBatch(batch_file)
+      batch_file.close()
+    if args.duplicates_only:
+      print(FormatDuplicates(FindDuplicates(
+          [package[0] for package in packages], args.jobs)))
+      return 0
+    failed = GenerateBatch(packages, args.jobs, args.incremental,
+                           args.reproducible, blob_store)
+    for output_file in failed:
+      print('Failed to generate %s' % output_file)
+    _CloseBlobStore(blob_store)
+    if args.duplicates:
+      print(FormatDuplicates(FindDuplicates(
+          [package[0] for package in packages], args.jobs)))
+    return len(failed) and 1
+  if not args.input or not args.key:
+    parser.error('input and key are required without --batch')
+
   output_file = args.output
   if output_file == 'default':
-    head, tail = os.path.split(args.input)
-    while len(tail) == 0:
-      head, tail = os.path.split(head)
-    output_file = tail + '.xpk'
-  generator = XPKGenerator(args.input, args.key, output_file)
-  generator.Generate()
+    output_file = DefaultOutputFile(args.input)
+  generator = XPKGenerator(args.input, args.key, output_file, args.jobs,
+                           args.incremental, args.reproducible, blob_store)
+  if args.digest:
+    print(generator.ContentDigest())
+    return 0
+  result = generator.Generate()
+  _CloseBlobStore(blob_store)
+  return not result and 1 or 0
 
 if __name__ == '__main__':
-  main()
+  sys.exit(main())
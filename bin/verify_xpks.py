@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Verifies the signatures of many XPK packages in parallel.
+
+Every argument is an XPK file or a directory searched for *.xpk files.
+Prints one line per package and exits with 1 if any package failed.
+
+Sample usage from shell script:
+Verify all XPKs in xpks/
+    python bin/verify_xpks.py xpks
+Only accept packages signed with the given key, and check member CRCs too
+    python bin/verify_xpks.py --key=signature --test-zip xpks
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import zipfile
+
+from Crypto.PublicKey import RSA
+from xpk_reader import XPKError, XPKReader
+
+
+def FindPackages(paths):
+  """Returns the XPK files in paths, sorted, searching dirs recursively."""
+  packages = []
+  for path in paths:
+    if not os.path.isdir(path):
+      packages.append(path)
+      continue
+    for dirname, _, files in os.walk(path):
+      for filename in files:
+        if filename.lower().endswith('.xpk'):
+          packages.append(os.path.join(dirname, filename))
+  return sorted(packages)
+
+
+def VerifyPackage(args):
+  """
+  Verifies one package. Returns its path and None if it is fine, or the
+  reason why it is not.
+  """
+  path, expected_pubkey, test_zip = args
+  try:
+    reader = XPKReader(path)
+    try:
+      if expected_pubkey is not None and reader.pubkey != expected_pubkey:
+        return path, 'signed with another key'
+      if not reader.Verify():
+        return path, 'bad signature'
+      if test_zip:
+        bad_member = reader.Zip().testzip()
+        if bad_member is not None:
+          return path, 'bad CRC of ' + bad_member
+    finally:
+      reader.Close()
+  except (IOError, OSError, XPKError, zipfile.BadZipfile) as e:
+    return path, str(e)
+  return path, None
+
+
+def VerifyPackages(packages, expected_pubkey=None, test_zip=False,
+                   jobs=None):
+  """
+  Verifies packages on a pool of processes, RSA and SHA-1 hold the GIL.
+  Yields the path and the failure reason, None if the package is fine, in
+  the order the packages are done.
+  """
+  pool = multiprocessing.Pool(jobs or multiprocessing.cpu_count())
+  try:
+    for result in pool.imap_unordered(
+        VerifyPackage, [(path, expected_pubkey, test_zip)
+                        for path in packages], chunksize=4):
+      yield result
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description='Verifies the signatures of XPK packages')
+  parser.add_argument('paths', nargs='+',
+      help='XPK files, or directories searched for them')
+  parser.add_argument(
+      '-k', '--key',
+      help='Private or public key file the packages must be signed with')
+  parser.add_argument(
+      '-t', '--test-zip', action='store_true',
+      help='Also check the CRC of every member')
+  parser.add_argument(
+      '-j', '--jobs', type=int,
+      help='Number of packages verified at a time, all CPUs by default')
+  args = parser.parse_args()
+
+  expected_pubkey = None
+  if args.key:
+    key_file = open(args.key, 'r')
+    expected_pubkey = RSA.importKey(key_file.read()).publickey().exportKey(
+        'DER')
+    key_file.close()
+  packages = FindPackages(args.paths)
+  failed = 0
+  for path, error in VerifyPackages(packages, expected_pubkey, args.test_zip,
+                                    args.jobs):
+    if error:
+      failed += 1
+      print('FAILED %s: %s' % (path, error))
+    else:
+      print('OK %s' % path)
+  print('Verified %d packages, %d failed.' % (len(packages), failed))
+  return failed and 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
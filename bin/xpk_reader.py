@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Reads XPK packages without extracting them.
+
+An XPK is the 'CrWk' magic, the sizes of the public key and the signature,
+the DER public key, the signature, and then a zip payload signed with
+PKCS#1 v1.5 over SHA-1. The signature is verified by streaming the payload
+through the hash, and the members are read from a memory map of the file,
+so neither needs a copy of the package in memory.
+"""
+import mmap
+import os
+import struct
+import zipfile
+
+from Crypto.Hash import SHA
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+from make_xpk import CONTENT_DIGEST_PREFIX, XPK_HEADER_SIZE, XPK_MAGIC
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class XPKError(Exception):
+  """The file is not a valid XPK package."""
+
+
+class _MappedFile(object):
+  """
+  The file interface zipfile needs on a memory map. mmap.read of python 2
+  requires a size, and closing a ZipFile must not close the map.
+  """
+  def __init__(self, map):
+    self.map_ = map
+
+  def read(self, size=-1):
+    if size is None or size < 0:
+      size = len(self.map_) - self.map_.tell()
+    return self.map_.read(size)
+
+  def seek(self, offset, whence=os.SEEK_SET):
+    self.map_.seek(offset, whence)
+
+  def tell(self):
+    return self.map_.tell()
+
+  def close(self):
+    pass
+
+
+class XPKReader(object):
+  """
+  Reads the header of an XPK package and gives access to its payload.
+
+  path : the path of the XPK file.
+  """
+  def __init__(self, path):
+    self.path = path
+    self.file_ = open(path, 'rb')
+    self.map_ = None
+    self.zip_ = None
+    try:
+      self.__ReadHeader()
+    except:
+      self.file_.close()
+      raise
+
+  def __ReadHeader(self):
+    file_size = os.fstat(self.file_.fileno()).st_size
+    header = self.file_.read(XPK_HEADER_SIZE)
+    if len(header) != XPK_HEADER_SIZE or header[:4] != XPK_MAGIC:
+      raise XPKError('%s is not an XPK package.' % self.path)
+    pubkey_size, signature_size = struct.unpack('<II', header[4:])
+    self.payload_offset = XPK_HEADER_SIZE + pubkey_size + signature_size
+    if self.payload_offset > file_size:
+      raise XPKError('The header of %s is truncated.' % self.path)
+    self.pubkey = self.file_.read(pubkey_size)
+    self.signature = self.file_.read(signature_size)
+    self.payload_size = file_size - self.payload_offset
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.Close()
+
+  def Close(self):
+    if self.zip_:
+      self.zip_.close()
+      self.zip_ = None
+    if self.map_:
+      self.map_.close()
+      self.map_ = None
+    self.file_.close()
+
+  def PublicKey(self):
+    return RSA.importKey(self.pubkey)
+
+  def Verify(self, expected_pubkey=None):
+    """
+    Returns whether the signature matches the payload. The payload is read
+    in chunks of CHUNK_SIZE.
+
+    expected_pubkey : the DER public key the package must be signed with.
+                      Any key is accepted if it is None.
+    """
+    if expected_pubkey is not None and expected_pubkey != self.pubkey:
+      return False
+    try:
+      verifier = PKCS1_v1_5.new(self.PublicKey())
+    except (ValueError, IndexError, TypeError):
+      raise XPKError('The public key of %s is invalid.' % self.path)
+    sha = SHA.new()
+    self.file_.seek(self.payload_offset)
+    while True:
+      chunk = self.file_.read(CHUNK_SIZE)
+      if not chunk:
+        break
+      sha.update(chunk)
+    return bool(verifier.verify(sha, self.signature))
+
+  def Zip(self):
+    """
+    Returns the payload as a zipfile.ZipFile on a memory map of the package.
+    Members are read straight from the map; zipfile finds the payload after
+    the header by itself. The ZipFile is closed with the reader.
+    """
+    if not self.zip_:
+      if not self.map_:
+        self.map_ = mmap.mmap(self.file_.fileno(), 0, access=mmap.ACCESS_READ)
+      try:
+        self.zip_ = zipfile.ZipFile(_MappedFile(self.map_), 'r')
+      except zipfile.BadZipfile:
+        raise XPKError('The payload of %s is not a zip.' % self.path)
+    return self.zip_
+
+  def NameList(self):
+    return self.Zip().namelist()
+
+  def Read(self, name):
+    """Returns the content of the member name, such as 'manifest.json'."""
+    return self.Zip().read(name)
+
+  def ContentDigest(self):
+    """
+    Returns the content digest of a reproducible package, see
+    make_xpk.ComputeContentDigest, or None if it has none.
+    """
+    comment = self.Zip().comment
+    if not comment.startswith(CONTENT_DIGEST_PREFIX):
+      return None
+    return comment[len(CONTENT_DIGEST_PREFIX):].decode('ascii')
@@ -0,0 +1,703 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Zip writing helpers for XPK packages.
+
+zipfile writes the data of a member first and then seeks back to fill in its
+CRC and sizes. Here members are prepared first, possibly on many threads,
+and ZipWriter writes them front to back in one pass with their final
+headers, so the output can be hashed while it is written. Members of a
+previous package can be copied over still compressed when their files did
+not change, which is told by the SHA-256 digests recorded next to it.
+
+In reproducible mode every member gets the same timestamp and normalized
+permissions, so packaging the same files always gives the same bytes.
+
+A BlobStore keeps the compressed data of files by the SHA-256 of their
+content, shared by all packaging runs. Files which many apps ship, like
+jQuery or fonts, are then compressed once, whatever app and run packs them
+first.
+
+Files of LARGE_FILE_SIZE or more, like the media of games, are read through
+a memory map, and their deflated data is written to a temp file, so they
+are hashed, compressed and written without being held in memory. Members, offsets and member counts over the
+limits of the zip format get ZIP64 records.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+
+ZIP_STORED = zipfile.ZIP_STORED
+ZIP_DEFLATED = zipfile.ZIP_DEFLATED
+CHUNK_SIZE = 1024 * 1024
+COMPRESSION_LEVEL = 6
+# Files from this size on are memory mapped.
+LARGE_FILE_SIZE = 8 * CHUNK_SIZE
+
+# Assets which are compressed already. Deflating them again only costs time.
+STORED_EXTENSIONS = frozenset([
+  '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico',
+  '.ogg', '.oga', '.mp3', '.m4a', '.aac', '.opus',
+  '.mp4', '.m4v', '.webm', '.ogv',
+  '.woff', '.woff2',
+  '.zip', '.gz', '.tgz', '.bz2', '.xz', '.xpk', '.apk', '.jar',
+])
+
+_LOCAL_HEADER = '<4s2B4HL2L2H'
+_CENTRAL_HEADER = '<4s4B4HL2L5H2L'
+_END_RECORD = '<4s4H2LH'
+_ZIP64_END_RECORD = '<4sQ2BH2L4Q'
+_ZIP64_LOCATOR = '<4sLQL'
+_LOCAL_MAGIC = b'PK\x03\x04'
+_CENTRAL_MAGIC = b'PK\x01\x02'
+_END_MAGIC = b'PK\x05\x06'
+_ZIP64_END_MAGIC = b'PK\x06\x06'
+_ZIP64_LOCATOR_MAGIC = b'PK\x06\x07'
+_ZIP64_EXTRA_ID = 1
+# Version 2.0 of the zip format, made on unix, and 4.5 for ZIP64 members.
+_VERSION = 20
+_ZIP64_VERSION = 45
+_UNIX = 3
+# Sizes and offsets past the ones zipfile writes without ZIP64, some tools
+# read them as signed.
+_ZIP64_LIMIT = zipfile.ZIP64_LIMIT
+_ZIP64_COUNT_LIMIT = 0xFFFF
+_UTF8_FLAG = 0x800
+# The timestamp of all members in reproducible mode, unless
+# SOURCE_DATE_EPOCH is set.
+REPRODUCIBLE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+DEFAULT_BLOB_STORE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                      'crosswalk-demos', 'xpk-blobs')
+DEFAULT_BLOB_STORE_MAX_SIZE = 1024 * 1024 * 1024
+# The compression method of a blob, followed by its data.
+_BLOB_HEADER = '<B'
+# The digests of the members of a package, see WriteDigests.
+DIGESTS_SUFFIX = '.digests'
+
+
+class ZipMember(object):
+  """
+  A zip member whose CRC and sizes are known.
+
+  name          : the name of the member inside the zip.
+  path          : the source file, its content is copied as is when data is
+                  None.
+  date_time     : the modification time as a (Y, M, D, h, m, s) tuple.
+  external_attr : the file attributes.
+  compress_type : ZIP_STORED or ZIP_DEFLATED.
+  crc           : the CRC32 of the uncompressed data.
+  compress_size : the size of the data in the zip.
+  file_size     : the uncompressed size.
+  data          : the compressed data, or None.
+  data_offset   : where the data starts in path when data is None.
+  digest        : the SHA-256 hex digest of the uncompressed data, if it
+                  was computed.
+  temp          : whether path is a temp file of the compressed data, which
+                  Discard removes.
+  """
+  def __init__(self, name, path, date_time, external_attr, compress_type,
+               crc, compress_size, file_size, data=None, data_offset=0,
+               digest=None, temp=False):
+    self.name = name
+    self.path = path
+    self.date_time = date_time
+    self.external_attr = external_attr
+    self.compress_type = compress_type
+    self.crc = crc
+    self.compress_size = compress_size
+    self.file_size = file_size
+    self.data = data
+    self.data_offset = data_offset
+    self.digest = digest
+    self.temp = temp
+
+  def Discard(self):
+    """Removes the temp file of the member, once it is written."""
+    if self.temp and os.path.exists(self.path):
+      os.remove(self.path)
+
+
+try:
+  _Slice = buffer
+
+  def _Release(chunk):
+    pass
+except NameError:
+  def _Slice(data, offset, size):
+    return memoryview(data)[offset:offset + size]
+
+  def _Release(chunk):
+    # A map can't be closed while views on it are alive.
+    chunk.release()
+
+
+def _ReadChunks(path, offset=0, size=None, mapped=True):
+  """Yields the data of path from offset on, size bytes or up to its end,
+  in chunks of CHUNK_SIZE. Large files are memory mapped, unless mapped is
+  False, and the chunks are buffers on the map, they must not be kept after
+  the next one is taken.
+  """
+  input_file = open(path, 'rb')
+  try:
+    file_size = os.fstat(input_file.fileno()).st_size
+    end = file_size
+    if size is not None:
+      end = min(end, offset + size)
+    if mapped and end - offset >= LARGE_FILE_SIZE:
+      data = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+      try:
+        for position in range(offset, min(end, len(data)), CHUNK_SIZE):
+          chunk = _Slice(data, position, min(CHUNK_SIZE, end - position))
+          try:
+            yield chunk
+          finally:
+            _Release(chunk)
+      finally:
+        data.close()
+      return
+    input_file.seek(offset)
+    while size is None or size > 0:
+      chunk_size = CHUNK_SIZE
+      if size is not None:
+        chunk_size = min(chunk_size, size)
+        size -= chunk_size
+      chunk = input_file.read(chunk_size)
+      if not chunk:
+        break
+      yield chunk
+  finally:
+    input_file.close()
+
+
+def _TakesBuffers(hash):
+  """Returns whether hash takes the buffers on memory maps which _ReadChunks
+  yields. hashlib and PyCrypto do, pycryptodome on python 2 does not.
+  """
+  try:
+    hash.update(_Slice(b'', 0, 0))
+  except TypeError:
+    return False
+  return True
+
+
+def _FileCrc(path):
+  crc = 0
+  for chunk in _ReadChunks(path):
+    crc = zlib.crc32(chunk, crc)
+  return crc & 0xFFFFFFFF
+
+
+def HashFile(path):
+  """Returns the CRC32, the size and the SHA-256 hex digest of the file at
+  path, read once.
+  """
+  crc = 0
+  size = 0
+  sha = hashlib.sha256()
+  for chunk in _ReadChunks(path):
+    crc = zlib.crc32(chunk, crc)
+    size += len(chunk)
+    sha.update(chunk)
+  return crc & 0xFFFFFFFF, size, sha.hexdigest()
+
+
+def ReproducibleDateTime():
+  """Returns the member timestamp of reproducible packages, taken from
+  SOURCE_DATE_EPOCH like other reproducible build tools do.
+  """
+  epoch = os.environ.get('SOURCE_DATE_EPOCH')
+  if not epoch:
+    return REPRODUCIBLE_DATE_TIME
+  return NormalizeDateTime(time.gmtime(int(epoch))[0:6])
+
+
+def ReproducibleAttr(mode):
+  """Returns the attributes of a file with mode in a reproducible package:
+  only whether it is executable is kept.
+  """
+  if mode & 0o111:
+    return 0o100755 << 16
+  return 0o100644 << 16
+
+
+def NormalizeDateTime(date_time):
+  """Returns date_time as it is stored in a zip: not before 1980 and with
+  a two second resolution.
+  """
+  year, month, day, hour, minute, second = date_time
+  if year < 1980:
+    return (1980, 1, 1, 0, 0, 0)
+  return (year, month, day, hour, minute, second // 2 * 2)
+
+
+def _DigestsPath(path):
+  return path + DIGESTS_SUFFIX
+
+
+def WriteDigests(path, digests):
+  """Records digests, the SHA-256 hex digests of the members of the package
+  at path by name, next to it for PreviousPackage. The record is tied to
+  the size and mtime of the package, it is ignored once the package is
+  rewritten.
+  """
+  st = os.stat(path)
+  record = {'size': st.st_size, 'mtime': st.st_mtime, 'digests': digests}
+  digests_path = _DigestsPath(path)
+  temp_path = digests_path + '.tmp'
+  digests_file = open(temp_path, 'w')
+  try:
+    json.dump(record, digests_file, sort_keys=True)
+  finally:
+    digests_file.close()
+  try:
+    os.rename(temp_path, digests_path)
+  except OSError:
+    # Windows does not rename over an existing file.
+    os.remove(digests_path)
+    os.rename(temp_path, digests_path)
+
+
+def ReadDigests(path):
+  """Returns the digests WriteDigests recorded for the package at path, or
+  an empty dict if they are missing or the package changed since.
+  """
+  try:
+    digests_file = open(_DigestsPath(path), 'r')
+  except IOError:
+    return {}
+  try:
+    record = json.load(digests_file)
+  except ValueError:
+    return {}
+  finally:
+    digests_file.close()
+  st = os.stat(path)
+  if record.get('size') != st.st_size or record.get('mtime') != st.st_mtime:
+    return {}
+  return record.get('digests') or {}
+
+
+def RemoveDigests(path):
+  """Removes the digests recorded for the package at path, if any."""
+  if os.path.exists(_DigestsPath(path)):
+    os.remove(_DigestsPath(path))
+
+
+class PreviousPackage(object):
+  """
+  The members of a previously built zip or XPK, to be reused by
+  PrepareMember when the files did not change. Only the members whose
+  digests were recorded by WriteDigests can be reused.
+
+  path : the path of the zip or XPK. zipfile skips the XPK header on its own.
+  """
+  def __init__(self, path):
+    self.path = path
+    zfile = zipfile.ZipFile(path, 'r')
+    self.members_ = dict((info.filename, info) for info in zfile.infolist())
+    zfile.close()
+    self.digests_ = ReadDigests(path)
+
+  def __DataOffset(self, info):
+    package = open(self.path, 'rb')
+    try:
+      package.seek(info.header_offset)
+      header = package.read(struct.calcsize(_LOCAL_HEADER))
+    finally:
+      package.close()
+    fields = struct.unpack(_LOCAL_HEADER, header)
+    if fields[0] != _LOCAL_MAGIC:
+      raise zipfile.BadZipfile('Bad local header of ' + info.filename)
+    return info.header_offset + len(header) + fields[-2] + fields[-1]
+
+  def Reuse(self, name, st, date_time, external_attr, digest):
+    """Returns the previous member of name pointing at its compressed data,
+    if the file with stat st and SHA-256 hex digest still has the same size,
+    mtime and digest. Otherwise None.
+    """
+    info = self.members_.get(name)
+    if not info or info.compress_type not in (ZIP_STORED, ZIP_DEFLATED):
+      return None
+    if (info.file_size != st.st_size or
+        tuple(info.date_time) != NormalizeDateTime(date_time)):
+      return None
+    if self.digests_.get(name) != digest:
+      return None
+    return ZipMember(name, self.path, date_time, external_attr,
+                     info.compress_type, info.CRC, info.compress_size,
+                     info.file_size, data_offset=self.__DataOffset(info),
+                     digest=digest)
+
+
+def IsStoredAsset(name):
+  return os.path.splitext(name)[1].lower() in STORED_EXTENSIONS
+
+
+class BlobStore(object):
+  """
+  Compressed file data by the SHA-256 of the uncompressed data, shared by
+  packaging runs and processes. The blobs of every zlib version and
+  compression level are kept apart, so a package built from blobs has the
+  bytes it would have had without them. A blob of a file which deflate does
+  not shrink only records that, the file is then stored.
+
+  store_dir : the directory of the blobs.
+  max_size  : the total size in bytes Evict trims the store to.
+  """
+  def __init__(self, store_dir=None, max_size=DEFAULT_BLOB_STORE_MAX_SIZE):
+    self.store_dir = store_dir or DEFAULT_BLOB_STORE_DIR
+    self.max_size = max_size
+    self.hits = 0
+    self.misses = 0
+    self.lock_ = threading.Lock()
+    self.digest_locks_ = {}
+
+  def __BlobPath(self, digest, compression_level):
+    return os.path.join(self.store_dir,
+                        'zlib-%s-%d' % (zlib.ZLIB_VERSION, compression_level),
+                        digest[:2], digest)
+
+  def DigestLock(self, digest):
+    """Returns the lock of the content with digest, held while it is looked
+    up and compressed so that the threads of one run compress it once.
+    """
+    with self.lock_:
+      return self.digest_locks_.setdefault(digest, threading.Lock())
+
+  def Lookup(self, digest, compression_level):
+    """Returns the compression method and the compressed data of the
+    content with digest, or None if it is not in the store.
+    """
+    blob_path = self.__BlobPath(digest, compression_level)
+    try:
+      blob_file = open(blob_path, 'rb')
+    except IOError:
+      with self.lock_:
+        self.misses += 1
+      return None
+    try:
+      blob = blob_file.read()
+    finally:
+      blob_file.close()
+    # Mark the blob as recently used.
+    os.utime(blob_path, None)
+    with self.lock_:
+      self.hits += 1
+    header_size = struct.calcsize(_BLOB_HEADER)
+    compress_type, = struct.unpack(_BLOB_HEADER, blob[:header_size])
+    return compress_type, blob[header_size:]
+
+  def Store(self, digest, compression_level, compress_type, data=b'',
+            data_path=None):
+    """Adds the compressed data of the content with digest, given as data
+    or as the file at data_path.
+    """
+    blob_path = self.__BlobPath(digest, compression_level)
+    blob_dir = os.path.dirname(blob_path)
+    if not os.path.exists(blob_dir):
+      try:
+        os.makedirs(blob_dir)
+      except OSError:
+        if not os.path.isdir(blob_dir):
+          raise
+    # Write a temp file and rename it, so that concurrent runs never read a
+    # half written blob.
+    fd, temp_path = tempfile.mkstemp(prefix='.tmp-', dir=blob_dir)
+    try:
+      blob_file = os.fdopen(fd, 'wb')
+      blob_file.write(struct.pack(_BLOB_HEADER, compress_type))
+      if data_path:
+        for chunk in _ReadChunks(data_path):
+          blob_file.write(chunk)
+      else:
+        blob_file.write(data)
+      blob_file.close()
+      try:
+        os.rename(temp_path, blob_path)
+      except OSError:
+        # Windows does not rename over an existing file.
+        os.remove(blob_path)
+        os.rename(temp_path, blob_path)
+    finally:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+  def Evict(self):
+    """Removes least recently used blobs until the store fits max_size."""
+    if not os.path.isdir(self.store_dir):
+      return
+    blobs = []
+    total_size = 0
+    for dirname, _, files in os.walk(self.store_dir):
+      for filename in files:
+        if filename.startswith('.tmp-'):
+          continue
+        blob_path = os.path.join(dirname, filename)
+        st = os.stat(blob_path)
+        blobs.append((st.st_mtime, st.st_size, blob_path))
+        total_size += st.st_size
+    blobs.sort()
+    for _, size, blob_path in blobs:
+      if total_size <= self.max_size:
+        break
+      os.remove(blob_path)
+      total_size -= size
+
+
+def _DeflateMember(path, name, date_time, external_attr, compression_level,
+                   temp_dir=None):
+  """Returns the member of the file at path deflated, or stored if deflate
+  does not shrink it. The deflated data of files of LARGE_FILE_SIZE or more
+  is written to a temp file in temp_dir, the one of smaller files is kept in
+  memory.
+  """
+  compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -15)
+  compressed = []
+  compress_size = 0
+  crc = 0
+  file_size = 0
+  sha = hashlib.sha256()
+  temp_path = None
+  temp_file = None
+  write = compressed.append
+  if os.path.getsize(path) >= LARGE_FILE_SIZE:
+    fd, temp_path = tempfile.mkstemp(prefix='xpk-deflate-', dir=temp_dir)
+    temp_file = os.fdopen(fd, 'wb')
+    write = temp_file.write
+  try:
+    for chunk in _ReadChunks(path):
+      crc = zlib.crc32(chunk, crc)
+      file_size += len(chunk)
+      sha.update(chunk)
+      data = compressor.compress(chunk)
+      compress_size += len(data)
+      write(data)
+    data = compressor.flush()
+    compress_size += len(data)
+    write(data)
+    if temp_file:
+      temp_file.close()
+  except Exception:
+    if temp_file:
+      temp_file.close()
+      os.remove(temp_path)
+    raise
+  crc &= 0xFFFFFFFF
+  if compress_size >= file_size:
+    if temp_path:
+      os.remove(temp_path)
+    return ZipMember(name, path, date_time, external_attr, ZIP_STORED,
+                     crc, file_size, file_size, digest=sha.hexdigest())
+  if temp_path:
+    return ZipMember(name, temp_path, date_time, external_attr, ZIP_DEFLATED,
+                     crc, compress_size, file_size, digest=sha.hexdigest(),
+                     temp=True)
+  return ZipMember(name, path, date_time, external_attr, ZIP_DEFLATED,
+                   crc, compress_size, file_size, b''.join(compressed),
+                   digest=sha.hexdigest())
+
+
+def PrepareMember(path, name, compression_level=COMPRESSION_LEVEL,
+                  previous=None, reproducible=False, blob_store=None,
+                  temp_dir=None, hash_files=False):
+  """Computes the zip member of the file at path.
+
+  Text and other compressible files are deflated, in memory or, for large
+  files, to a temp file in temp_dir which ZipWriter copies from and the
+  caller removes with ZipMember.Discard. Assets listed in
+  STORED_EXTENSIONS, and files that deflate does not shrink, are stored; for
+  them only the CRC is computed and the data is copied by ZipWriter later.
+  zlib releases the GIL, so this scales over a thread pool.
+
+  If previous is given and holds an unchanged copy of the file, its
+  compressed data is reused instead. The file is hashed first to tell.
+
+  If hash_files is set, the SHA-256 of every file is computed, as the
+  digest of its member, to record with WriteDigests.
+
+  If blob_store, a BlobStore, is given, the file is hashed first and its
+  compressed data is taken from the store if any run compressed the same
+  content before. Otherwise the data is added to the store.
+
+  If reproducible is set, the mtime and permissions of the file are
+  replaced by ReproducibleDateTime and ReproducibleAttr.
+  """
+  st = os.stat(path)
+  if reproducible:
+    date_time = ReproducibleDateTime()
+    external_attr = ReproducibleAttr(st.st_mode)
+  else:
+    date_time = time.localtime(st.st_mtime)[0:6]
+    external_attr = (st.st_mode & 0xFFFF) << 16
+  crc = None
+  file_size = st.st_size
+  digest = None
+  if blob_store or previous or hash_files:
+    crc, file_size, digest = HashFile(path)
+  if previous:
+    member = previous.Reuse(name, st, date_time, external_attr, digest)
+    if member:
+      return member
+  if IsStoredAsset(name):
+    if crc is None:
+      crc = _FileCrc(path)
+    return ZipMember(name, path, date_time, external_attr, ZIP_STORED,
+                     crc, file_size, file_size, digest=digest)
+  if blob_store:
+    with blob_store.DigestLock(digest):
+      blob = blob_store.Lookup(digest, compression_level)
+      if blob:
+        compress_type, data = blob
+        if compress_type == ZIP_DEFLATED:
+          return ZipMember(name, path, date_time, external_attr, ZIP_DEFLATED,
+                           crc, len(data), file_size, data, digest=digest)
+        return ZipMember(name, path, date_time, external_attr, ZIP_STORED,
+                         crc, file_size, file_size, digest=digest)
+      member = _DeflateMember(path, name, date_time, external_attr,
+                              compression_level, temp_dir)
+      # A file changed since it was hashed is not stored under the old
+      # digest.
+      if member.digest == digest:
+        blob_store.Store(digest, compression_level, member.compress_type,
+                         member.data or b'',
+                         member.temp and member.path or None)
+      return member
+  return _DeflateMember(path, name, date_time, external_attr,
+                        compression_level, temp_dir)
+
+
+def _EncodeName(name):
+  """Returns the name bytes and the flag bits for the name."""
+  if isinstance(name, bytes):
+    return name, 0
+  try:
+    return name.encode('ascii'), 0
+  except UnicodeEncodeError:
+    return name.encode('utf-8'), _UTF8_FLAG
+
+
+def _DosDateTime(date_time):
+  year, month, day, hour, minute, second = NormalizeDateTime(date_time)
+  dos_date = (year - 1980) << 9 | month << 5 | day
+  dos_time = hour << 11 | minute << 5 | (second // 2)
+  return dos_date, dos_time
+
+
+class ZipWriter(object):
+  """
+  Writes a zip file front to back without seeking.
+
+  fileobj : a writable file object, the zip starts at its current position.
+  hash    : a hash object everything written is passed through, or None.
+            Files are copied from memory maps if it takes their buffers,
+            otherwise they are read, never copied twice.
+  """
+  def __init__(self, fileobj, hash=None):
+    self.fileobj_ = fileobj
+    self.hash_ = hash
+    self.mapped_ = not hash or _TakesBuffers(hash)
+    self.offset_ = 0
+    self.central_directory_ = []
+    # The SHA-256 hex digests of the members written, by name.
+    self.digests = {}
+
+  def __Write(self, data):
+    self.fileobj_.write(data)
+    if self.hash_:
+      self.hash_.update(data)
+    self.offset_ += len(data)
+
+  def __CopyFile(self, path, offset, size):
+    """Writes size bytes of path from offset on."""
+    copied = 0
+    for chunk in _ReadChunks(path, offset, size, self.mapped_):
+      self.__Write(chunk)
+      copied += len(chunk)
+    if copied != size:
+      raise IOError('%s changed while it was packed.' % path)
+
+  def Write(self, member):
+    if member.digest:
+      self.digests[member.name] = member.digest
+    name, flags = _EncodeName(member.name)
+    dos_date, dos_time = _DosDateTime(member.date_time)
+    header_offset = self.offset_
+    version = _VERSION
+    # The sizes and offset which do not fit go to the ZIP64 extra field,
+    # in this order, and are replaced by 0xFFFFFFFF.
+    sizes = [member.file_size, member.compress_size]
+    local_extra = b''
+    if max(sizes) > _ZIP64_LIMIT:
+      version = _ZIP64_VERSION
+      local_extra = struct.pack('<2H2Q', _ZIP64_EXTRA_ID, 16, *sizes)
+      sizes = [0xFFFFFFFF, 0xFFFFFFFF]
+    file_size, compress_size = sizes
+    self.__Write(struct.pack(_LOCAL_HEADER, _LOCAL_MAGIC, version, 0, flags,
+                             member.compress_type, dos_time, dos_date,
+                             member.crc, compress_size, file_size, len(name),
+                             len(local_extra)))
+    self.__Write(name)
+    self.__Write(local_extra)
+    if member.data is not None:
+      self.__Write(member.data)
+    else:
+      self.__CopyFile(member.path, member.data_offset, member.compress_size)
+    zip64_fields = [value for value in (member.file_size,
+                                        member.compress_size, header_offset)
+                    if value > _ZIP64_LIMIT]
+    central_extra = b''
+    if zip64_fields:
+      version = _ZIP64_VERSION
+      central_extra = struct.pack('<2H%dQ' % len(zip64_fields),
+                                  _ZIP64_EXTRA_ID, 8 * len(zip64_fields),
+                                  *zip64_fields)
+    file_size, compress_size, header_offset = [
+        value > _ZIP64_LIMIT and 0xFFFFFFFF or value
+        for value in (member.file_size, member.compress_size, header_offset)]
+    self.central_directory_.append(
+        struct.pack(_CENTRAL_HEADER, _CENTRAL_MAGIC, version, _UNIX,
+                    version, 0, flags, member.compress_type, dos_time,
+                    dos_date, member.crc, compress_size, file_size, len(name),
+                    len(central_extra), 0, 0, 0, member.external_attr,
+                    header_offset) + name + central_extra)
+
+  def Close(self, comment=b''):
+    """Writes the central directory and the zip comment. Returns the size of
+    the zip.
+    """
+    central_directory_offset = self.offset_
+    for record in self.central_directory_:
+      self.__Write(record)
+    count = len(self.central_directory_)
+    central_directory_size = self.offset_ - central_directory_offset
+    if (count >= _ZIP64_COUNT_LIMIT or
+        central_directory_offset > _ZIP64_LIMIT or
+        central_directory_size > _ZIP64_LIMIT):
+      zip64_end_offset = self.offset_
+      self.__Write(struct.pack(
+          _ZIP64_END_RECORD, _ZIP64_END_MAGIC,
+          struct.calcsize(_ZIP64_END_RECORD) - 12, _ZIP64_VERSION, _UNIX,
+          _ZIP64_VERSION, 0, 0, count, count, central_directory_size,
+          central_directory_offset))
+      self.__Write(struct.pack(_ZIP64_LOCATOR, _ZIP64_LOCATOR_MAGIC, 0,
+                               zip64_end_offset, 1))
+      count = min(count, 0xFFFF)
+      central_directory_size = min(central_directory_size, 0xFFFFFFFF)
+      central_directory_offset = min(central_directory_offset, 0xFFFFFFFF)
+    self.__Write(struct.pack(_END_RECORD, _END_MAGIC, 0, 0, count, count,
+                             central_directory_size, central_directory_offset,
+                             len(comment)))
+    self.__Write(comment)
+    return self.offset_
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Content-addressed cache of the npm and bower dependencies of webapps.
+
+The key of an app's dependencies is a hash of what npm install and bower
+install read: the dependency sections of package.json and bower.json, the
+shrinkwrap and rc files, and the install commands. Apps with the same key
+get the same node_modules and bower_components, so they are installed once
+and restored into the other apps as hardlinks. Files are copied instead
+where hardlinks are not possible, such as across file systems.
+
+The cached files are shared with the apps they were restored into. npm and
+bower rewrite files in place, so the dependency dirs of an app are removed
+with RemoveDependencyDirs before installing into it, and an entry is a copy
+of the installed dirs, never a link to them.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from file_utils import LinkTree
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'crosswalk-demos', 'dependencies')
+# node_modules of a grunt toolchain are around 50MB, this holds a few dozen.
+DEFAULT_MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+DEPENDENCY_DIRS = ('node_modules', 'bower_components')
+
+# The parts of package.json and bower.json which decide what is installed.
+_MANIFEST_KEYS = ('dependencies', 'devDependencies', 'optionalDependencies',
+                  'peerDependencies', 'bundleDependencies',
+                  'bundledDependencies', 'resolutions')
+_INSTALL_SCRIPTS = ('preinstall', 'install', 'postinstall')
+# Files which change what is installed as a whole.
+INSTALL_FILES = ('npm-shrinkwrap.json', 'package-lock.json', '.npmrc',
+                 '.bowerrc')
+
+
+def _ReadJson(path):
+  json_file = open(path, 'r')
+  try:
+    return json.load(json_file)
+  finally:
+    json_file.close()
+
+
+def ComputeDependencyKey(app_dir, install_commands=()):
+  """Returns the cache key of the dependencies of the app in app_dir.
+
+  install_commands are the commands running the installs, a different npm
+  or bower may install different trees.
+  """
+  sha = hashlib.sha1()
+  for command in install_commands:
+    sha.update(('command:' + ' '.join(command) + '\n').encode('utf-8'))
+  for name in ('package.json', 'bower.json'):
+    path = os.path.join(app_dir, name)
+    if not os.path.isfile(path):
+      continue
+    manifest = _ReadJson(path)
+    relevant = dict((key, manifest[key]) for key in _MANIFEST_KEYS
+                    if key in manifest)
+    scripts = manifest.get('scripts') or {}
+    relevant['scripts'] = dict((key, scripts[key]) for key in _INSTALL_SCRIPTS
+                               if key in scripts)
+    sha.update(('manifest:' + name + '\n').encode('utf-8'))
+    sha.update(json.dumps(relevant, sort_keys=True).encode('utf-8'))
+  for name in INSTALL_FILES:
+    path = os.path.join(app_dir, name)
+    if os.path.isfile(path):
+      sha.update(('file:' + name + '\n').encode('utf-8'))
+      install_file = open(path, 'rb')
+      sha.update(install_file.read())
+      install_file.close()
+  return sha.hexdigest()
+
+
+def RemoveDependencyDirs(app_dir):
+  """Removes the dependency dirs of app_dir, which may be linked to a cache
+  entry.
+  """
+  for name in DEPENDENCY_DIRS:
+    target = os.path.join(app_dir, name)
+    if os.path.islink(target):
+      os.remove(target)
+    elif os.path.exists(target):
+      shutil.rmtree(target)
+
+
+def _TreeSize(root):
+  size = 0
+  for dirname, _, files in os.walk(root):
+    for name in files:
+      path = os.path.join(dirname, name)
+      if not os.path.islink(path):
+        size += os.path.getsize(path)
+  return size
+
+
+class DependencyCache(object):
+  """ Stores and restores the dependency dirs of apps by dependency key.
+
+  Args:
+    cache_dir: The directory holding the cache entries.
+    max_size: The total size in bytes the cache is trimmed to.
+  """
+  def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+    self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    self.max_size = max_size
+    self.locks_ = {}
+    self.locks_lock_ = threading.Lock()
+
+  def _EntryPath(self, key):
+    return os.path.join(self.cache_dir, key)
+
+  def Lock(self, key):
+    """Returns the lock of key. Holding it while installing keeps apps with
+    the same dependencies from installing them at the same time, the others
+    wait and restore them from the cache.
+    """
+    with self.locks_lock_:
+      return self.locks_.setdefault(key, threading.Lock())
+
+  def Restore(self, key, app_dir):
+    """Replaces the dependency dirs of app_dir with the ones cached under
+    key.
+
+    Returns the list of restored dirs, or None on a cache miss.
+    """
+    entry = self._EntryPath(key)
+    if not os.path.isdir(entry):
+      return None
+    names = sorted(os.listdir(entry))
+    RemoveDependencyDirs(app_dir)
+    for name in names:
+      LinkTree(os.path.join(entry, name), os.path.join(app_dir, name))
+    # Mark the entry as recently used.
+    os.utime(entry, None)
+    return names
+
+  def Store(self, key, app_dir):
+    """Caches a copy of the dependency dirs of app_dir under key and trims
+    the cache to its size limit. The app keeps its own files, which later
+    installs into it may change.
+    """
+    if not os.path.exists(self.cache_dir):
+      try:
+        os.makedirs(self.cache_dir)
+      except OSError:
+        if not os.path.isdir(self.cache_dir):
+          raise
+    entry = self._EntryPath(key)
+    # Fill a temp dir first and rename it, so that concurrent builds never
+    # see a half written entry.
+    temp_entry = tempfile.mkdtemp(prefix='.tmp-' + key + '-',
+                                  dir=self.cache_dir)
+    try:
+      for name in DEPENDENCY_DIRS:
+        path = os.path.join(app_dir, name)
+        if os.path.isdir(path):
+          shutil.copytree(path, os.path.join(temp_entry, name), symlinks=True)
+      if os.path.exists(entry):
+        shutil.rmtree(entry)
+      os.rename(temp_entry, entry)
+    finally:
+      if os.path.exists(temp_entry):
+        shutil.rmtree(temp_entry, ignore_errors=True)
+    self.Evict()
+
+  def Evict(self):
+    """Removes least recently used entries until the cache fits max_size."""
+    if not os.path.isdir(self.cache_dir):
+      return
+    entries = []
+    total_size = 0
+    for name in os.listdir(self.cache_dir):
+      entry = os.path.join(self.cache_dir, name)
+      if name.startswith('.tmp-') or not os.path.isdir(entry):
+        continue
+      size = _TreeSize(entry)
+      entries.append((os.path.getmtime(entry), size, entry))
+      total_size += size
+    entries.sort()
+    for _, size, entry in entries:
+      if total_size <= self.max_size:
+        break
+      shutil.rmtree(entry, ignore_errors=True)
+      total_size -= size
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Fetches webapp repositories through a cache of local mirrors.
+
+Every remote repository is mirrored once as a bare repository under
+~/.cache/crosswalk-demos/mirrors, later runs only fetch what changed.
+Working copies are cloned from the mirrors locally, which hardlinks the
+objects, or reset to the mirror when they exist already. Git submodules
+borrow the objects of their mirror with --reference. The mirrors are updated
+on a bounded pool of threads.
+
+Sample usage from shell script:
+Clone the 01.org webapps into 01webapps
+    python fetch_webapps.py --dest=01webapps \
+        https://github.com/01org/webapps-annex.git ...
+Fetch 8 repositories at a time
+    python fetch_webapps.py --jobs=8 --dest=01webapps ...
+Init the git submodules of this repository
+    python fetch_webapps.py --submodules
+"""
+
+import hashlib
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+
+from git_utils import GitOutput, RunGit
+from multiprocessing.pool import ThreadPool
+
+DEFAULT_MIRROR_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'crosswalk-demos', 'mirrors')
+DEFAULT_JOBS = 4
+
+
+def GetRepoName(url):
+  name = url.rstrip('/').split('/')[-1]
+  if name.endswith('.git'):
+    name = name[:-len('.git')]
+  return name
+
+
+def GetMirrorPath(mirror_dir, url):
+  """Returns the mirror of url. The hash of the url keeps repositories of
+  the same name from different hosts apart.
+  """
+  url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+  return os.path.join(mirror_dir, GetRepoName(url) + '-' + url_hash + '.git')
+
+
+def UpdateMirror(url, mirror_dir=DEFAULT_MIRROR_DIR, runner=None):
+  """Creates or updates the mirror of url. git runs with runner, a
+  ProcessRunner, if it is given.
+
+  Returns the path of the mirror, or None if it could not be fetched.
+  """
+  name = GetRepoName(url)
+  mirror_path = GetMirrorPath(mirror_dir, url)
+  if os.path.exists(mirror_path):
+    # Only the new objects are fetched.
+    if RunGit(['remote', 'update', '--prune'], mirror_path, name, runner):
+      return mirror_path
+    print ('[Error]: Failed to update the mirror of ' + url)
+    return None
+  if not os.path.exists(mirror_dir):
+    try:
+      os.makedirs(mirror_dir)
+    except OSError:
+      if not os.path.isdir(mirror_dir):
+        raise
+  # Clone next to the mirror first, so that an interrupted clone is never
+  # taken for a mirror.
+  temp_dir = tempfile.mkdtemp(prefix='.tmp-' + name + '-', dir=mirror_dir)
+  try:
+    temp_mirror = os.path.join(temp_dir, 'mirror.git')
+    if not RunGit(['clone', '--quiet', '--mirror', url, temp_mirror],
+                  app=name, runner=runner):
+      print ('[Error]: Failed to clone ' + url)
+      return None
+    os.rename(temp_mirror, mirror_path)
+  finally:
+    shutil.rmtree(temp_dir, ignore_errors=True)
+  return mirror_path
+
+
+def UpdateMirrors(urls, mirror_dir=DEFAULT_MIRROR_DIR, jobs=DEFAULT_JOBS,
+                  runner=None):
+  """Updates the mirrors of urls, jobs at a time.
+
+  Returns a dict of the mirror path of every url, None for failed ones.
+  """
+  urls = list(urls)
+  if not urls:
+    return {}
+  pool = ThreadPool(min(jobs, len(urls)))
+  try:
+    mirrors = pool.map(lambda url: UpdateMirror(url, mirror_dir, runner),
+                       urls)
+  finally:
+    pool.close()
+    pool.join()
+  return dict(zip(urls, mirrors))
+
+
+def CloneFromMirror(url, mirror_path, dest, runner=None):
+  """Clones mirror_path to dest, with url as its origin. The clone is local,
+  git hardlinks the objects instead of copying them.
+
+  An existing clone is reset to the mirror instead. Ignored files, like
+  build outputs and installed dependencies, are kept.
+  """
+  name = GetRepoName(url)
+  if os.path.exists(os.path.join(dest, '.git')):
+    if (RunGit(['fetch', '--quiet', mirror_path, 'HEAD'], dest, name,
+               runner) and
+        RunGit(['reset', '--quiet', '--hard', 'FETCH_HEAD'], dest, name,
+               runner) and
+        RunGit(['clean', '--quiet', '-f', '-d'], dest, name, runner)):
+      return True
+    print ('[Error]: Failed to update ' + dest + ', cloning it again.')
+  if os.path.exists(dest):
+    shutil.rmtree(dest)
+  if not RunGit(['clone', '--quiet', mirror_path, dest], app=name,
+                runner=runner):
+    return False
+  return RunGit(['remote', 'set-url', 'origin', url], dest, name, runner)
+
+
+def CloneRepos(urls, dest_dir, mirror_dir=DEFAULT_MIRROR_DIR,
+               jobs=DEFAULT_JOBS, runner=None):
+  """Clones every url into dest_dir/<repository name> through its mirror.
+  git runs with runner, a ProcessRunner, if it is given.
+
+  Returns the list of urls which failed.
+  """
+  urls = list(urls)
+  mirrors = UpdateMirrors(urls, mirror_dir, jobs, runner)
+  if not os.path.exists(dest_dir):
+    os.makedirs(dest_dir)
+
+  def Clone(url):
+    mirror_path = mirrors.get(url)
+    if not mirror_path:
+      return False
+    return CloneFromMirror(url, mirror_path,
+                           os.path.join(dest_dir, GetRepoName(url)), runner)
+
+  if not urls:
+    return []
+  pool = ThreadPool(min(jobs, len(urls)))
+  try:
+    results = pool.map(Clone, urls)
+  finally:
+    pool.close()
+    pool.join()
+  return [url for url, result in zip(urls, results) if not result]
+
+
+def ReadSubmodules(repo_dir):
+  """Returns the (path, url) of every submodule listed in .gitmodules."""
+  gitmodules = os.path.join(repo_dir, '.gitmodules')
+  if not os.path.exists(gitmodules):
+    return []
+  out = GitOutput(['config', '-f', gitmodules, '--get-regexp',
+                   r'^submodule\..*\.(path|url)$']) or ''
+  paths = {}
+  urls = {}
+  for line in out.splitlines():
+    key, value = line.split(' ', 1)
+    name, field = key[len('submodule.'):].rsplit('.', 1)
+    if field == 'path':
+      paths[name] = value
+    else:
+      urls[name] = value
+  return [(paths[name], urls[name]) for name in sorted(paths)
+          if name in urls]
+
+
+def UpdateSubmodules(repo_dir, mirror_dir=DEFAULT_MIRROR_DIR,
+                     jobs=DEFAULT_JOBS):
+  """Inits and updates the submodules of repo_dir like
+  'git submodule update --init', with the network fetches done on the
+  mirrors in parallel.
+
+  Returns whether all submodules were updated.
+  """
+  submodules = ReadSubmodules(repo_dir)
+  mirrors = UpdateMirrors([url for _, url in submodules], mirror_dir, jobs)
+  succeed = True
+  for path, url in submodules:
+    args = ['submodule', 'update', '--init']
+    mirror_path = mirrors.get(url)
+    if mirror_path:
+      # --dissociate copies the borrowed objects, the submodule keeps working
+      # if the mirror is removed.
+      args += ['--reference', mirror_path, '--dissociate']
+    if not RunGit(args + ['--', path], repo_dir, path):
+      succeed = False
+  return succeed
+
+
+def main():
+  parser = optparse.OptionParser(
+      usage='%prog [options] [repository url ...]')
+  parser.add_option('-d', '--dest', action='store', dest='dest',
+      help='The directory the repositories are cloned into. '
+           'Such as: --dest=01webapps')
+  parser.add_option('-j', '--jobs', action='store', dest='jobs', type='int',
+      default=DEFAULT_JOBS,
+      help='The number of repositories fetched at a time. Such as: --jobs=8')
+  parser.add_option('-m', '--mirror-dir', action='store', dest='mirror_dir',
+      default=DEFAULT_MIRROR_DIR,
+      help='The directory of the local mirrors. '
+           'Such as: --mirror-dir=/var/cache/mirrors')
+  parser.add_option('--submodules', action='store_true', dest='submodules',
+      default=False,
+      help='Init and update the git submodules of the current directory.')
+  options, urls = parser.parse_args()
+  if options.submodules:
+    if not UpdateSubmodules(os.getcwd(), options.mirror_dir, options.jobs):
+      return 1
+    return 0
+  if not options.dest or not urls:
+    parser.error('--dest and at least one repository url are required.')
+  failed = CloneRepos(urls, options.dest, options.mirror_dir, options.jobs)
+  for url in failed:
+    print ('[Error]: Failed to fetch ' + url)
+  return len(failed) and 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Tests the mirrors and clones of fetch_webapps.py with temp bare
+repositories as the remotes.
+
+Sample usage from shell script:
+python -m unittest fetch_webapps_unittest
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import fetch_webapps
+
+
+def Git(args, cwd):
+  """Runs git quietly in cwd and returns its output."""
+  return subprocess.check_output(['git'] + args, cwd=cwd,
+                                 stderr=subprocess.STDOUT)
+
+
+def WriteFile(path, content):
+  output = open(path, 'w')
+  output.write(content)
+  output.close()
+
+
+class FetchWebappsTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.mirror_dir = os.path.join(self.temp_dir, 'mirrors')
+    self.dest_dir = os.path.join(self.temp_dir, 'clones')
+    self.url = os.path.join(self.temp_dir, 'remote', 'webapps-test.git')
+    self.work_dir = os.path.join(self.temp_dir, 'work')
+    Git(['init', '--quiet', '--bare', self.url], self.temp_dir)
+    # The remote is on master, whatever the default branch of git is.
+    Git(['symbolic-ref', 'HEAD', 'refs/heads/master'], self.url)
+    Git(['clone', '--quiet', self.url, self.work_dir], self.temp_dir)
+    Git(['config', 'user.name', 'Test'], self.work_dir)
+    Git(['config', 'user.email', 'test@example.com'], self.work_dir)
+    self.Push('.gitignore', 'build/\n')
+    self.clone_dir = os.path.join(self.dest_dir, 'webapps-test')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def Push(self, name, content, branch='master'):
+    """Commits name with content to branch of the remote."""
+    WriteFile(os.path.join(self.work_dir, name), content)
+    Git(['add', name], self.work_dir)
+    Git(['commit', '--quiet', '-m', 'Change ' + name], self.work_dir)
+    Git(['push', '--quiet', 'origin', 'HEAD:' + branch], self.work_dir)
+    return Git(['rev-parse', 'HEAD'], self.work_dir).strip()
+
+  def Head(self, repo_dir, revision='HEAD'):
+    return Git(['rev-parse', revision], repo_dir).strip()
+
+  def Clone(self, urls=None):
+    return fetch_webapps.CloneRepos(urls or [self.url], self.dest_dir,
+                                    self.mirror_dir, jobs=2)
+
+  def testClonesThroughMirror(self):
+    head = self.Push('index.html', 'one\n')
+    self.assertEqual(self.Clone(), [])
+    mirror_path = fetch_webapps.GetMirrorPath(self.mirror_dir, self.url)
+    self.assertEqual(os.listdir(self.mirror_dir),
+                     [os.path.basename(mirror_path)])
+    self.assertEqual(self.Head(mirror_path, 'master'), head)
+    self.assertEqual(self.Head(self.clone_dir), head)
+    self.assertEqual(Git(['config', 'remote.origin.url'],
+                         self.clone_dir).strip(), self.url)
+
+  def testUpdatesMirrorAndClone(self):
+    self.Push('index.html', 'one\n')
+    self.assertEqual(self.Clone(), [])
+    # Build outputs are ignored and kept, other untracked files are not.
+    os.makedirs(os.path.join(self.clone_dir, 'build'))
+    WriteFile(os.path.join(self.clone_dir, 'build', 'app.js'), 'built\n')
+    WriteFile(os.path.join(self.clone_dir, 'stray.txt'), 'stray\n')
+    WriteFile(os.path.join(self.clone_dir, 'index.html'), 'edited\n')
+    head = self.Push('index.html', 'two\n')
+    self.assertEqual(self.Clone(), [])
+    self.assertEqual(self.Head(self.clone_dir), head)
+    self.assertEqual(open(os.path.join(self.clone_dir, 'index.html')).read(),
+                     'two\n')
+    self.assertTrue(os.path.exists(os.path.join(self.clone_dir, 'build',
+                                                'app.js')))
+    self.assertFalse(os.path.exists(os.path.join(self.clone_dir,
+                                                 'stray.txt')))
+
+  def testPrunesDeletedBranches(self):
+    self.Push('index.html', 'one\n')
+    self.Push('feature.html', 'feature\n', 'feature')
+    mirror_path = fetch_webapps.UpdateMirror(self.url, self.mirror_dir)
+    self.assertTrue(self.Head(mirror_path, 'feature'))
+    Git(['push', '--quiet', 'origin', ':feature'], self.work_dir)
+    self.assertEqual(fetch_webapps.UpdateMirror(self.url, self.mirror_dir),
+                     mirror_path)
+    self.assertEqual(Git(['for-each-ref', '--format=%(refname:short)',
+                          'refs/heads'], mirror_path).split(), ['master'])
+
+  def testReclonesBrokenClone(self):
+    head = self.Push('index.html', 'one\n')
+    self.assertEqual(self.Clone(), [])
+    shutil.rmtree(os.path.join(self.clone_dir, '.git', 'objects'))
+    self.assertEqual(self.Clone(), [])
+    self.assertEqual(self.Head(self.clone_dir), head)
+
+  def testReportsFailedUrls(self):
+    self.Push('index.html', 'one\n')
+    missing_url = os.path.join(self.temp_dir, 'remote', 'webapps-none.git')
+    self.assertEqual(self.Clone([self.url, missing_url]), [missing_url])
+    self.assertTrue(os.path.exists(os.path.join(self.clone_dir, '.git')))
+    # An interrupted clone is never left for a mirror.
+    self.assertEqual(os.listdir(self.mirror_dir),
+                     [os.path.basename(fetch_webapps.GetMirrorPath(
+                         self.mirror_dir, self.url))])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Links files and trees of files into other dirs.
+
+Hardlinks are used where possible, files are copied instead where they are
+not, such as across file systems or on Windows with python 2. Linked files
+share their content, they must not be modified in place.
+"""
+
+import os
+import shutil
+
+
+def LinkFile(source, destination):
+  """Hardlinks source to destination, or copies it if that is not possible.
+  """
+  try:
+    os.link(source, destination)
+  except (AttributeError, OSError):
+    # No os.link on Windows with python 2, or another file system.
+    shutil.copy2(source, destination)
+
+
+def LinkTree(source, destination):
+  """Recreates the tree at source at destination, with hardlinks of its
+  files where possible. Symlinks are recreated as they are.
+  """
+  for dirname, dirs, files in os.walk(source):
+    target_dir = os.path.join(destination,
+                              os.path.relpath(dirname, source))
+    if not os.path.isdir(target_dir):
+      os.makedirs(target_dir)
+    for name in list(dirs):
+      path = os.path.join(dirname, name)
+      if os.path.islink(path):
+        # os.walk does not enter linked dirs, link them like files.
+        os.symlink(os.readlink(path), os.path.join(target_dir, name))
+        dirs.remove(name)
+    for name in files:
+      path = os.path.join(dirname, name)
+      if os.path.islink(path):
+        os.symlink(os.readlink(path), os.path.join(target_dir, name))
+      else:
+        LinkFile(path, os.path.join(target_dir, name))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Runs git for the scripts which fetch and patch the webapps.
+
+Git runs with an explicit working directory and without a shell, so it can
+run for several apps at the same time. The output of clones, fetches and
+patches is streamed through a ProcessRunner while git runs. Only the short
+queries whose whole output is parsed, like rev-parse, are read at once.
+"""
+
+import subprocess
+
+import android.process_runner
+
+# Prints the output of git as it runs, without logging it.
+_DEFAULT_RUNNER = android.process_runner.ProcessRunner()
+
+
+def RunGit(args, cwd=None, app='', runner=None):
+  """Runs git with args in cwd. runner prints and logs its output as the
+  output of app, by default it is only printed.
+
+  Returns whether git succeeded.
+  """
+  process = (runner or _DEFAULT_RUNNER).Run(['git'] + args, cwd, app)
+  return process.Succeeded()
+
+
+def GitOutput(args, cwd=None):
+  """Runs git with args in cwd and returns its output, or None if it failed.
+  Its errors are not shown.
+  """
+  proc = subprocess.Popen(['git'] + args, cwd=cwd, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE)
+  out, _ = proc.communicate()
+  if proc.returncode:
+    return None
+  return out
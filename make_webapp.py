@@ -20,37 +20,66 @@ Specify build tool with the download url
     python make_webapp.py --version=2.31.27.0 --url=https://download.01.org/crosswalk/releases/android-x86/canary
 Only checkout the webapps with patches patched
     python make_webapp.py --no-build
-
-The build result will be under out directory.
+Build 4 apps at a time
+    python make_webapp.py --jobs=4
+Rebuild all apps even if nothing changed since the last build
+    python make_webapp.py --no-cache
+Record the time of every build phase, and view it in chrome://tracing
+    python make_webapp.py --report=build.jsonl --trace=build_trace.json
+Build every app for both x86 and ARM
+    python make_webapp.py --version=2.31.27.0 --arch=x86,arm
+Minify the JS, CSS and HTML and recompress the PNGs of the apps
+    python make_webapp.py --optimize-assets=minify,png
+Rebuild an app whenever its sources change
+    python make_webapp.py --target=android --app=MemoryGame --watch
+Stop make_apk.py and downloads which take more than 10 minutes
+    python make_webapp.py --timeout=600
+
+The build result will be under out directory, and the output of make_apk.py
+and of the downloads in out/logs.
 """
 
+import multiprocessing
 import optparse
 import os
 import shutil
-import subprocess
 import sys
+import tempfile
+import time
+import traceback
 
-import android.android_build_app
-
-def RunCommandShell(command, app):
-  proc = subprocess.Popen(command, stdout=subprocess.PIPE,
-                          stderr=subprocess.STDOUT, shell=True)
-  out, _ = proc.communicate()
-  print ('[' + app + ']: ' + out)
+from multiprocessing.pool import ThreadPool
 
+import android.android_build_app
+import android.build_cache
+import android.build_telemetry
+import android.process_runner
+import android.template_store
+import app_index
+import app_watcher
+import asset_optimizer
+import fetch_webapps
+import file_utils
+import git_utils
+import patch_engine
+
+# The error code of an app whose patches failed to apply. make_apk errors
+# are 1 to 3, see android_build_app.BuildApp.
+PATCH_ERROR = 4
 
 def FindApps(app_list):
-  for i in os.listdir('.'):
-    if os.path.isdir(i):
-      check_file = os.path.join('.', i, 'manifest.json')
-      check_file2 = os.path.join('.', i, 'src', 'manifest.json')
-      if (os.path.exists(check_file) or
-          os.path.exists(check_file2)):
-        app_list.append(i)
-
-
-def BuildForAndroidApp(current_real_path, app, build_result):
-  return_value = android.android_build_app.BuildApp(current_real_path, app)
+  # The index only looks again at the dirs which changed since the last run.
+  index = app_index.AppIndex(os.getcwd())
+  index.Update()
+  for app in index.FindInvalidApps():
+    print ('[Error]: Skip ' + app + ', ' + ' '.join(index.GetWarnings(app)))
+  for app in index.FindApps():
+    for warning in index.GetWarnings(app):
+      print ('[Warning]: ' + app + ': ' + warning)
+    app_list.append(app)
+
+
+def AppendBuildResult(build_result, app, return_value):
   if not return_value:
     build_result = build_result + app + ' :OK\n'
   else:
@@ -58,50 +87,144 @@ def BuildForAndroidApp(current_real_path, app, build_result):
   return build_result
 
 
-def RevertManifestFile(current_real_path, app):
-  src_folder = os.path.join(current_real_path, app, 'src')
-  renamed_jsonfile = os.path.join(src_folder, '_original_manifest.json_')
-  target_jsonfile = os.path.join(src_folder, 'manifest.json')
-  if os.path.exists(os.path.join(current_real_path, app, 'manifest.json')):
-    os.remove(target_jsonfile)
-  if os.path.exists(renamed_jsonfile):
-    shutil.move(renamed_jsonfile, target_jsonfile)
+def GetArches(options):
+  """Returns the list of architectures given with --arch, or an empty list
+  if apps are built with android/xwalk_app_template only.
+  """
+  if not options.arch:
+    return []
+  return [arch.strip() for arch in options.arch.split(',') if arch.strip()]
+
+
+def GetTemplatePaths(options, current_real_path):
+  """Returns a dict of the template dir of every architecture to build. It
+  is android/xwalk_app_template under the key '' without --arch.
+  """
+  android_dir = os.path.join(current_real_path, 'android')
+  arches = GetArches(options)
+  if not arches:
+    return {'': os.path.join(android_dir, 'xwalk_app_template')}
+  return dict((arch, android.template_store.GetArchTemplatePath(android_dir,
+                                                                 arch))
+              for arch in arches)
+
+
+def GetLogDir(current_real_path):
+  return os.path.join(current_real_path, 'out', 'logs')
+
+
+def BuildForAndroidApp(options, current_real_path, app, build_result,
+                       telemetry, template_paths=None, src_folder=None):
+  cache = None
+  if not options.no_cache:
+    cache = android.build_cache.BuildCache()
+  if not template_paths:
+    template_paths = GetTemplatePaths(options, current_real_path)
+  arches = sorted(template_paths)
+  runner = android.process_runner.ProcessRunner(GetLogDir(current_real_path),
+                                                options.timeout)
+
+  def Build(arch):
+    return android.android_build_app.BuildApp(current_real_path, app,
+                                              template_paths[arch], cache,
+                                              telemetry, src_folder,
+                                              arch or None, runner)
+
+  try:
+    if len(arches) == 1:
+      return_values = [Build(arches[0])]
+    else:
+      # Every architecture has its own template dir, so make_apk.py runs for
+      # all of them at the same time.
+      pool = ThreadPool(len(arches))
+      try:
+        return_values = android.process_runner.GetResult(
+            pool.map_async(Build, arches))
+      finally:
+        pool.close()
+        pool.join()
+  finally:
+    runner.Close()
+  return_value = 0
+  for value in return_values:
+    return_value = return_value or value
+  return AppendBuildResult(build_result, app, return_value)
 
 
-def RevertPatchFiles(current_real_path, app):
-  # Check whether it's a git submodule.
-  git_file = os.path.join(current_real_path, app, 'src', '.git')
-  if not os.path.exists(git_file):
-    # It's not a git submodule, no patch files applied.
-    return
-  # cd to submodule dir.
-  previous_cwd = os.getcwd()
-  os.chdir(os.path.join(current_real_path, app, 'src'))
-  # Checkout to for_crosswalk branch.
-  RunCommandShell('git checkout for_crosswalk', app)
-  # Revert cd.
-  os.chdir(previous_cwd)
+def GetSourceDir(current_real_path, app):
+  return os.path.join(current_real_path, app, 'src')
+
 
+def GetPatchedSourceDir(current_real_path, app):
+  return os.path.join(current_real_path, 'out', 'patched', app)
 
-def RevertPatches(current_real_path, app):
-  RevertManifestFile(current_real_path, app)
-  RevertPatchFiles(current_real_path, app)
 
+def GetOptimizedSourceDir(current_real_path, app):
+  return os.path.join(current_real_path, 'out', 'optimized', app)
 
-def CopyManifestFile(current_real_path, app):
+
+def OptimizeAssets(options, current_real_path, app, src_folder):
+  """Returns the dir of a copy of src_folder with its assets optimized by
+  the --optimize-assets stages.
+  """
+  cache = None
+  if not options.no_cache:
+    cache = asset_optimizer.AssetCache()
+  optimized_src_folder = GetOptimizedSourceDir(current_real_path, app)
+  report = asset_optimizer.OptimizeApp(src_folder, optimized_src_folder,
+                                       options.optimize_assets, cache)
+  print (asset_optimizer.FormatReport(app, report))
+  return optimized_src_folder
+
+
+def GetOverlaySourceDir(current_real_path, app):
+  return os.path.join(current_real_path, 'out', 'overlay', app)
+
+
+def _LinkEntry(source, destination):
+  if hasattr(os, 'symlink'):
+    os.symlink(source, destination)
+  elif os.path.isdir(source):
+    file_utils.LinkTree(source, destination)
+  else:
+    shutil.copy2(source, destination)
+
+
+def OverlayManifestFile(current_real_path, app, src_folder):
+  """Returns the dir to build app from. It is src_folder itself, unless the
+  app has a manifest.json next to its src. Then it is a dir with links to
+  everything in src_folder and that manifest.json, and make_apk.py is given
+  it. src_folder is never changed, so a failed build can not leave the
+  source tree dirty.
+  """
   jsonfile = os.path.join(current_real_path, app, 'manifest.json')
-  src_folder = os.path.join(current_real_path, app, 'src')
-  target_jsonfile = os.path.join(src_folder, 'manifest.json')
-  renamed_jsonfile = os.path.join(src_folder, '_original_manifest.json_')
-  # Check whether manifest.json exists in webapp folder.
-  if os.path.exists(jsonfile):
-    # We need to copy manifest.json to src folder.
-    # Check whether there is manifest.json under src.
-    if os.path.exists(target_jsonfile):
-      # Rename current manifest.json.
-      shutil.move(target_jsonfile, renamed_jsonfile)
-    # Copy manifest.json to src.
-    shutil.copy2(jsonfile, target_jsonfile)
+  if not os.path.exists(jsonfile):
+    return src_folder
+  overlay_folder = GetOverlaySourceDir(current_real_path, app)
+  parent_folder = os.path.dirname(overlay_folder)
+  if not os.path.exists(parent_folder):
+    try:
+      os.makedirs(parent_folder)
+    except OSError:
+      if not os.path.isdir(parent_folder):
+        raise
+  temp_folder = tempfile.mkdtemp(prefix='.tmp-' + app + '-',
+                                 dir=parent_folder)
+  try:
+    for name in os.listdir(src_folder):
+      if name in ('.git', 'manifest.json'):
+        continue
+      _LinkEntry(os.path.join(src_folder, name),
+                 os.path.join(temp_folder, name))
+    shutil.copy2(jsonfile, os.path.join(temp_folder, 'manifest.json'))
+    if os.path.exists(overlay_folder):
+      # Only removes the links, not what they point at.
+      shutil.rmtree(overlay_folder)
+    os.rename(temp_folder, overlay_folder)
+  finally:
+    if os.path.exists(temp_folder):
+      shutil.rmtree(temp_folder, ignore_errors=True)
+  return overlay_folder
 
 
 def FindPatchFiles(current_real_path, app, patch_list):
@@ -116,84 +239,197 @@ def FindPatchFiles(current_real_path, app, patch_list):
 
 
 def ApplyPatchFiles(current_real_path, app):
+  """Returns the source dir to build app from, which is the patched
+  worktree if the app has patches, or None if the patches failed to apply.
+  """
+  src_folder = GetSourceDir(current_real_path, app)
   # Check whether it's a git submodule.
-  git_file = os.path.join(current_real_path, app, 'src', '.git')
+  git_file = os.path.join(src_folder, '.git')
   if not os.path.exists(git_file):
     # It's not a git submodule, no patch files needed.
-    return
+    return src_folder
 
   patch_list = []
   FindPatchFiles(current_real_path, app, patch_list)
 
   if len(patch_list) == 0:
-    return
-
-  # cd to submodule dir.
-  previous_cwd = os.getcwd()
-  os.chdir(os.path.join(current_real_path, app, 'src'))
-  # Checkout to for_crosswalk branch.
-  RunCommandShell('git checkout for_crosswalk', app)
+    return src_folder
+
+  # Apply all the patches in the worktree of the app.
+  patch_paths = [os.path.join(current_real_path, app, patch)
+                 for patch in patch_list]
+  patched_src_folder = GetPatchedSourceDir(current_real_path, app)
+  if not patch_engine.ApplyPatchSeries(app, src_folder, patch_paths,
+                                       patched_src_folder):
+    print ('[Error]: Failed to apply the patches of ' + app)
+    return None
+  return patched_src_folder
+
+
+def BuildOneApp(func, options, current_real_path, app, build_result,
+                telemetry, template_paths=None):
+  print ('Build ' + app + ':')
+  with telemetry.Phase(app, 'build'):
+    with telemetry.Phase(app, 'apply_patches'):
+      src_folder = ApplyPatchFiles(current_real_path, app)
+    if not src_folder:
+      return AppendBuildResult(build_result, app, PATCH_ERROR)
+    with telemetry.Phase(app, 'overlay_manifest'):
+      build_folder = OverlayManifestFile(current_real_path, app, src_folder)
+    if options.optimize_assets:
+      with telemetry.Phase(app, 'optimize_assets'):
+        build_folder = OptimizeAssets(options, current_real_path, app,
+                                      build_folder)
+    build_result = func(options, current_real_path, app, build_result,
+                        telemetry, template_paths, build_folder)
+  return build_result
 
-  # Delete previous auto_patch branch.
-  RunCommandShell('git branch -D auto_patch', app)
 
-  # Create auto_patch branch.
-  RunCommandShell('git checkout -b auto_patch for_crosswalk', app)
+def BuildAppInWorker(args):
+  """Builds one app inside a process pool worker.
 
-  # Apply all the patches.
-  for patch in patch_list:
-    patch_path = os.path.join(current_real_path, app, patch)
-    RunCommandShell('git am ' + patch_path, app)
+  Every worker gets its own copy of the templates, because make_apk.py
+  runs inside the template dir and leaves the APKs there. The result is the
+  build_result line of this app and the build phases recorded by the worker.
+  """
+  func, options, current_real_path, app = args
+  telemetry = android.build_telemetry.BuildTelemetry()
+  work_dir = tempfile.mkdtemp(prefix='xwalk-' + app + '-')
+  try:
+    isolated_template_paths = {}
+    with telemetry.Phase(app, 'copy_template'):
+      for arch, template_path in GetTemplatePaths(options,
+                                                  current_real_path).items():
+        isolated_template_path = os.path.join(work_dir,
+                                              os.path.basename(template_path))
+        shutil.copytree(template_path, isolated_template_path, symlinks=True)
+        isolated_template_paths[arch] = isolated_template_path
+    result = BuildOneApp(func, options, current_real_path, app, '',
+                         telemetry, isolated_template_paths)
+  except Exception:
+    traceback.print_exc()
+    result = app + ' :Failed, unexpected error\n'
+  finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
+  return result, telemetry.events
 
-  # Revert cd.
-  os.chdir(previous_cwd)
 
+def BuildApps(func, options, current_real_path, app_list, build_result,
+              telemetry):
+  jobs = options.jobs
+  if jobs <= 1 or len(app_list) <= 1:
+    for app in app_list:
+      build_result = BuildOneApp(func, options, current_real_path, app,
+                                 build_result, telemetry)
+    return build_result
 
-def ApplyPatches(current_real_path, app):
-  ApplyPatchFiles(current_real_path, app)
-  CopyManifestFile(current_real_path, app)
+  jobs = min(jobs, len(app_list))
+  print ('Build %d apps with %d jobs' % (len(app_list), jobs))
+  pool = multiprocessing.Pool(jobs)
+  try:
+    # map() keeps the order of app_list, so the summary is stable.
+    results = pool.map(BuildAppInWorker,
+                       [(func, options, current_real_path, app)
+                        for app in app_list])
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+  for result, events in results:
+    build_result += result
+    telemetry.Extend(events)
+  return build_result
 
 
-def BuildApps(func, current_real_path, app_list, build_result):
-  for app in app_list:
-    print ('Build ' + app + ':')
-    ApplyPatches(current_real_path, app)
-    build_result = func(current_real_path, app, build_result)
-    RevertPatches(current_real_path, app)
-  return build_result
+def DownloadBuildTool(options, current_real_path, dest_dir, url=None,
+                      arch=None, download_dir=None):
+  print ('Downloading xwalk_app_template...')
+  command = ['python',
+             os.path.join(current_real_path, 'android', 'get_xwalk_app_template.py'),
+             '--version=' + options.version,
+             '--dest-dir=' + dest_dir]
+  if download_dir:
+    command.append('--download-dir=' + download_dir)
+  # The '--url' is valid only when '-v' or '--version' is specified.
+  url = url or options.url
+  if url:
+    command.append('--url=' + url)
+  # Templates of several architectures are downloaded at the same time,
+  # each one is logged on its own.
+  log_name = 'xwalk_app_template' + (arch and '_' + arch or '')
+  runner = android.process_runner.ProcessRunner(GetLogDir(current_real_path),
+                                                options.timeout)
+  try:
+    process = runner.Run(command, app=log_name)
+  finally:
+    runner.Close()
+  if not process.Succeeded():
+    print ('[Error]: The download ' + process.Status() + '.')
+    return False
+  # Check whether download xwalk_app_template succeed, a template left
+  # half extracted by an earlier run has no make_apk.py.
+  return os.path.exists(os.path.join(dest_dir, 'xwalk_app_template',
+                                     'make_apk.py'))
 
 
 def RunGetBuildToolScript(options, current_real_path):
-  xwalk_app_template_path = os.path.join(current_real_path, 'android', 'xwalk_app_template')
-  # Remove build tool, we need to get new one.
-  if os.path.exists(xwalk_app_template_path):
-    shutil.rmtree(xwalk_app_template_path)
   if not options.version:
     print ('Please use --version or -v argument to specify xwalk application template version\n'
            'Or you can run android/get_xwalk_app_template.py to download')
     return False
-  print ('Downloading xwalk_app_template...')
-  version = '--version=' + options.version
-  # The '--url' is valid only when '-v' or '--version' is specified.
-  if options.url:
-    url = '--url=' + options.url
-  else:
-    url = ''
-  download_script = os.path.join(current_real_path, 'android', 'get_xwalk_app_template.py')
-  proc = subprocess.Popen(['python', download_script, version, url],
-                          stdout=subprocess.PIPE,
-                          stderr=subprocess.STDOUT)
-  out, _ = proc.communicate()
-  print (out)
-  # Check whether download xwalk_app_template succeed.
-  if not os.path.exists(xwalk_app_template_path):
-    return False;
+  # Every version is downloaded only once into the shared template store,
+  # switching versions just points xwalk_app_template at another one.
+  store = android.template_store.TemplateStore()
+  template_paths = GetTemplatePaths(options, current_real_path)
+  # The download url and the architecture in the store of every template.
+  urls = {}
+  store_arches = {}
+  for arch in template_paths:
+    if arch:
+      urls[arch] = android.template_store.GetUrlForArch(options.url, arch)
+      if not urls[arch]:
+        print ('[Error]: Can\'t find the ' + arch + ' packages next to ' +
+               options.url)
+        return False
+      store_arches[arch] = arch
+    else:
+      urls[arch] = options.url
+      store_arches[arch] = android.template_store.GetArchFromUrl(options.url)
+  missing = []
+  for arch in sorted(template_paths):
+    if store.GetTemplatePath(options.version, store_arches[arch]):
+      print ('Use stored xwalk_app_template ' + options.version + '-' +
+             store_arches[arch])
+    else:
+      missing.append(arch)
+
+  def Fetch(arch):
+    def Download(dest_dir, download_dir):
+      return DownloadBuildTool(options, current_real_path, dest_dir,
+                               urls[arch], store_arches[arch], download_dir)
+    return store.Fetch(options.version, store_arches[arch], Download)
+
+  if missing:
+    # The templates of all architectures are downloaded at the same time.
+    pool = ThreadPool(len(missing))
+    try:
+      fetched = android.process_runner.GetResult(
+          pool.map_async(Fetch, missing))
+    finally:
+      pool.close()
+      pool.join()
+    if not all(fetched):
+      return False
+  for arch, template_path in template_paths.items():
+    if not store.Activate(options.version, store_arches[arch], template_path,
+                          keep_arches=store_arches.values()):
+      return False
   return True
 
 
 def CheckAndroidBuildTool(options, current_real_path):
-  xwalk_app_template_path = os.path.join(current_real_path, 'android', 'xwalk_app_template')
-
   # If the version of build tool is specified.
   # We need to switch to the specified version.
   if options.version:
@@ -201,7 +437,8 @@ def CheckAndroidBuildTool(options, current_real_path):
 
   # No build tool version specified.
   # Use previous build tool.
-  if os.path.exists(xwalk_app_template_path):
+  template_paths = GetTemplatePaths(options, current_real_path).values()
+  if all(os.path.exists(path) for path in template_paths):
     return True
   else:
     # No build tool found, download one.
@@ -210,7 +447,8 @@ def CheckAndroidBuildTool(options, current_real_path):
 
 def InitWebApps(current_real_path, app_list):
   print ('Init submodules..')
-  RunCommandShell('git submodule update --init', '')
+  # The submodules are fetched through local mirrors, in parallel.
+  fetch_webapps.UpdateSubmodules(current_real_path)
   # The submodule/master branch will always be the latest version.
   # The branch 'for_crosswalk' will track the workable commit id we specified.
   for app in app_list:
@@ -219,14 +457,39 @@ def InitWebApps(current_real_path, app_list):
     if not os.path.exists(git_file):
       # It's not a git submodule, no patch files needed.
       continue
-    # cd to submodule dir.
-    previous_cwd = os.getcwd()
-    os.chdir(os.path.join(current_real_path, app, 'src'))
-    RunCommandShell('git checkout -b for_crosswalk', app)
-    os.chdir(previous_cwd)
+    git_utils.RunGit(['checkout', '-b', patch_engine.BASE_BRANCH],
+                     os.path.join(current_real_path, app, 'src'), app)
+
+
+def WatchWebApps(options, current_real_path, app_list, telemetry):
+  """Rebuilds the apps whose sources change until interrupted. The build
+  tool is checked and the apps are found only once, before watching.
+  """
+  apps = dict((app, os.path.join(current_real_path, app)) for app in app_list)
+  watcher = app_watcher.CreateWatcher(apps, options.poll)
+  print ('Watching ' + ', '.join(sorted(apps)) + ' for changes, '
+         'press Ctrl+C to stop.')
+  try:
+    while True:
+      changed_apps, first_change = app_watcher.WaitForChanges(
+          watcher, options.debounce)
+      changed_apps = sorted(changed_apps)
+      print ('Changed: ' + ', '.join(changed_apps))
+      with telemetry.Phase('', 'rebuild'):
+        build_result = BuildApps(BuildForAndroidApp, options,
+                                 current_real_path, changed_apps,
+                                 '\nRebuild Result:\n', telemetry)
+      print (build_result)
+      # The latency from the first change to the APKs in out/android.
+      print ('Rebuilt %s %.2fs after the change.' %
+             (', '.join(changed_apps), time.time() - first_change))
+  except KeyboardInterrupt:
+    print ('Stopped watching.')
+  finally:
+    watcher.Close()
 
 
-def Build_WebApps(options, current_real_path, build_result):
+def Build_WebApps(options, current_real_path, build_result, telemetry):
   app_list = []
   if options.app:
     app_list.append(options.app)
@@ -240,28 +503,42 @@ def Build_WebApps(options, current_real_path, build_result):
 
   # Init git submodules at the first time.
   # (git will automatically check whether need init the next time).
-  InitWebApps(current_real_path, app_list)
+  with telemetry.Phase('', 'init_submodules'):
+    InitWebApps(current_real_path, app_list)
 
   # If no build needed
   if options.no_build:
     for app in app_list:
-      ApplyPatchFiles(current_real_path, app)
+      src_folder = ApplyPatchFiles(current_real_path, app)
+      if src_folder:
+        print ('[' + app + ']: Source is at ' + src_folder)
     build_result = 'Webapps are checked out, and patches are patched.'
     return build_result
 
   # Build apps.
+  has_build_tool = False
   if options.target == 'android':
-    if CheckAndroidBuildTool(options, current_real_path):
-      build_result = BuildApps(BuildForAndroidApp, current_real_path, app_list, build_result)
+    with telemetry.Phase('', 'check_build_tool'):
+      has_build_tool = CheckAndroidBuildTool(options, current_real_path)
+    if has_build_tool:
+      build_result = BuildApps(BuildForAndroidApp, options, current_real_path,
+                               app_list, build_result, telemetry)
     else:
       build_result += 'No Build tools\n'
   elif options.target == 'tizen':
     print ('Tizen build not implemented')
   else:
-    if CheckAndroidBuildTool(options, current_real_path):
-      build_result = BuildApps(BuildForAndroidApp, current_real_path, app_list, build_result)
+    with telemetry.Phase('', 'check_build_tool'):
+      has_build_tool = CheckAndroidBuildTool(options, current_real_path)
+    if has_build_tool:
+      build_result = BuildApps(BuildForAndroidApp, options, current_real_path,
+                               app_list, build_result, telemetry)
     else:
       build_result += ('No Build tools\n')
+
+  if options.watch and has_build_tool:
+    print (build_result)
+    WatchWebApps(options, current_real_path, app_list, telemetry)
   return build_result
 
 
@@ -282,20 +559,76 @@ def main():
   parser.add_option('-u', '--url', action='store', dest='url',
       help='The xwalk application template basic url address. Such as: '
            '--url=https://download.01.org/crosswalk/releases/android-x86/canary')
+  parser.add_option('--arch', action='store', dest='arch',
+      help='Build every app for each of the comma separated architectures, '
+           'with a template per architecture. The packages of the other '
+           'architectures are next to the --url ones. Such as: --arch=x86,arm')
   parser.add_option('--no-build', action='store_true',
       dest='no_build', default=False,
       help = 'Only checkout the webapps with patches patched.')
+  parser.add_option('-j', '--jobs', action='store', dest='jobs', type='int',
+      default=1,
+      help='The number of apps built in parallel. Such as: --jobs=4')
+  parser.add_option('--no-cache', action='store_true',
+      dest='no_cache', default=False,
+      help='Always run make_apk.py, even if the app did not change since '
+           'the last build.')
+  parser.add_option('--optimize-assets', action='store',
+      dest='optimize_assets',
+      help='Optimize the assets of the apps before packaging them, with the '
+           'comma separated asset_optimizer stages, of ' +
+           ', '.join(asset_optimizer.STAGES) + ', default or all. '
+           'Such as: --optimize-assets=minify,png')
+  parser.add_option('--watch', action='store_true',
+      dest='watch', default=False,
+      help='Keep running after the build, and rebuild every app whose src, '
+           'manifest.json or patch files change.')
+  parser.add_option('--poll', action='store_true',
+      dest='poll', default=False,
+      help='Find changes in --watch mode by polling instead of inotify.')
+  parser.add_option('--debounce', action='store', dest='debounce',
+      type='float', default=app_watcher.DEFAULT_DEBOUNCE,
+      help='The seconds without further changes before a rebuild in --watch '
+           'mode. Such as: --debounce=1.5')
+  parser.add_option('--timeout', action='store', dest='timeout',
+      type='float',
+      help='Stop make_apk.py, or the download of a template, after the '
+           'seconds. Such as: --timeout=600')
+  parser.add_option('--report', action='store', dest='report',
+      help='Write the time and resource usage of every build phase to the '
+           'file, one JSON object per line. Such as: --report=build.jsonl')
+  parser.add_option('--trace', action='store', dest='trace',
+      help='Write the build phases as a Chrome trace, to be opened in '
+           'chrome://tracing. Such as: --trace=build_trace.json')
   options, _ = parser.parse_args()
+  if options.optimize_assets:
+    try:
+      options.optimize_assets = asset_optimizer.ParseStages(
+          options.optimize_assets)
+    except ValueError as e:
+      parser.error(str(e))
+  for arch in GetArches(options):
+    if arch not in android.template_store.ARCHES:
+      parser.error('Unknown architecture ' + arch + ', use one of ' +
+                   ', '.join(android.template_store.ARCHES) + '.')
   current_real_path = os.path.abspath(os.path.dirname(sys.argv[0]))
   previous_cwd = os.getcwd()
   os.chdir(current_real_path)
+  telemetry = android.build_telemetry.BuildTelemetry()
   try:
-    build_result = Build_WebApps(options, current_real_path, build_result)
+    build_result = Build_WebApps(options, current_real_path, build_result,
+                                 telemetry)
   except:
     print ('Unexpected error:', sys.exc_info()[0])
   finally:
+    # Commands run from threads are not stopped by ctrl-c by themselves.
+    android.process_runner.CancelAll()
     os.chdir(previous_cwd)
     print (build_result)
+    if options.report:
+      telemetry.WriteReport(options.report)
+    if options.trace:
+      telemetry.WriteTrace(options.trace)
   return 0
 
 
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Applies the patch files of a webapp in a git worktree of its submodule.
+
+The submodule checkout itself always stays on the 'for_crosswalk' branch.
+The patched state is built in a detached worktree under out/patched/<app>,
+with a single 'git am' of the whole patch series. The hash of the series and
+the resulting commit are remembered next to the worktree, so the patches are
+applied again only when the series or 'for_crosswalk' changed.
+
+Git runs with explicit working directories and without a shell, so several
+apps can be patched at the same time.
+"""
+
+import hashlib
+import os
+
+from git_utils import GitOutput, RunGit
+
+BASE_BRANCH = 'for_crosswalk'
+
+
+def GetPatchSetHash(patch_paths):
+  """Returns the hash of the names and contents of the patch series."""
+  sha = hashlib.sha1()
+  for patch_path in patch_paths:
+    sha.update(('patch:' + os.path.basename(patch_path) + '\n').encode('utf-8'))
+    patch_file = open(patch_path, 'rb')
+    sha.update(patch_file.read())
+    patch_file.close()
+  return sha.hexdigest()
+
+
+def _ReadState(state_file):
+  if not os.path.exists(state_file):
+    return None
+  state = open(state_file, 'r')
+  fields = state.read().split()
+  state.close()
+  if len(fields) != 3:
+    return None
+  return tuple(fields)
+
+
+def _WriteState(state_file, patch_set_hash, base, head):
+  state = open(state_file, 'w')
+  state.write('%s %s %s\n' % (patch_set_hash, base, head))
+  state.close()
+
+
+def _RevParse(cwd, revisions):
+  out = GitOutput(['rev-parse'] + revisions, cwd)
+  return out and out.split()
+
+
+def ApplyPatchSeries(app, src_dir, patch_paths, worktree_dir):
+  """Makes worktree_dir a checkout of 'for_crosswalk' in src_dir with
+  patch_paths applied in order.
+
+  Returns True on success. On failure the worktree is left without patches
+  and will be rebuilt by the next call.
+  """
+  state_file = worktree_dir + '.patchset'
+  patch_set_hash = GetPatchSetHash(patch_paths)
+  # Skip everything if the worktree holds exactly this patch series on top
+  # of the current 'for_crosswalk'.
+  state = _ReadState(state_file)
+  if state and state[0] == patch_set_hash and os.path.exists(worktree_dir):
+    revisions = _RevParse(worktree_dir, ['HEAD', BASE_BRANCH])
+    if revisions and (revisions[1], revisions[0]) == state[1:]:
+      print ('[' + app + ']: Patches are up to date.')
+      return True
+  if os.path.exists(state_file):
+    os.remove(state_file)
+
+  if not os.path.exists(os.path.join(worktree_dir, '.git')):
+    parent_dir = os.path.dirname(worktree_dir)
+    if not os.path.exists(parent_dir):
+      try:
+        os.makedirs(parent_dir)
+      except OSError:
+        # Another app may have created it in the meantime.
+        if not os.path.isdir(parent_dir):
+          raise
+    # Forget worktrees whose dirs were removed.
+    RunGit(['worktree', 'prune'], src_dir, app)
+    if not RunGit(['worktree', 'add', '--detach', worktree_dir, BASE_BRANCH],
+                  src_dir, app):
+      return False
+  else:
+    if not RunGit(['reset', '-q', '--hard', BASE_BRANCH], worktree_dir, app):
+      return False
+    RunGit(['clean', '-q', '-f', '-d'], worktree_dir, app)
+
+  if not RunGit(['am'] + patch_paths, worktree_dir, app):
+    RunGit(['am', '--abort'], worktree_dir, app)
+    return False
+  revisions = _RevParse(worktree_dir, ['HEAD', BASE_BRANCH])
+  if not revisions:
+    return False
+  _WriteState(state_file, patch_set_hash, revisions[1], revisions[0])
+  return True
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Tests ApplyPatchSeries of patch_engine.py on a clone of a temp bare
+repository.
+
+Sample usage from shell script:
+python -m unittest patch_engine_unittest
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import patch_engine
+
+
+def Git(args, cwd):
+  """Runs git quietly in cwd and returns its output."""
+  return subprocess.check_output(['git'] + args, cwd=cwd,
+                                 stderr=subprocess.STDOUT)
+
+
+def WriteFile(path, content):
+  output = open(path, 'w')
+  output.write(content)
+  output.close()
+
+
+def ReadFile(path):
+  input_file = open(path, 'r')
+  content = input_file.read()
+  input_file.close()
+  return content
+
+
+class ApplyPatchSeriesTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    upstream = os.path.join(self.temp_dir, 'upstream.git')
+    self.src_dir = os.path.join(self.temp_dir, 'src')
+    self.patches_dir = os.path.join(self.temp_dir, 'patches')
+    self.worktree_dir = os.path.join(self.temp_dir, 'out', 'patched', 'app')
+    Git(['init', '--quiet', '--bare', upstream], self.temp_dir)
+    Git(['clone', '--quiet', upstream, self.src_dir], self.temp_dir)
+    # The worktrees share this config, git am commits with it too.
+    Git(['config', 'user.name', 'Test'], self.src_dir)
+    Git(['config', 'user.email', 'test@example.com'], self.src_dir)
+    Git(['checkout', '--quiet', '-b', patch_engine.BASE_BRANCH],
+        self.src_dir)
+    self.Commit('app.js', 'one\ntwo\nthree\n', 'Base')
+    Git(['push', '--quiet', 'origin', patch_engine.BASE_BRANCH],
+        self.src_dir)
+    # The patches are made on a branch of their own, like the webapps'.
+    Git(['checkout', '--quiet', '-b', 'patches'], self.src_dir)
+    self.Commit('app.js', 'one\ntwo for crosswalk\nthree\n', 'First')
+    self.Commit('extra.js', 'extra\n', 'Second')
+    Git(['format-patch', '--quiet', '-o', self.patches_dir,
+         patch_engine.BASE_BRANCH], self.src_dir)
+    Git(['checkout', '--quiet', patch_engine.BASE_BRANCH], self.src_dir)
+    self.patches = sorted(os.path.join(self.patches_dir, name)
+                          for name in os.listdir(self.patches_dir))
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def Commit(self, name, content, message):
+    WriteFile(os.path.join(self.src_dir, name), content)
+    Git(['add', name], self.src_dir)
+    Git(['commit', '--quiet', '-m', message], self.src_dir)
+
+  def Apply(self, patches=None):
+    return patch_engine.ApplyPatchSeries(
+        'app', self.src_dir, patches or self.patches, self.worktree_dir)
+
+  def Revision(self, revision, cwd=None):
+    return Git(['rev-parse', revision], cwd or self.src_dir).strip()
+
+  def Marker(self):
+    """Returns the path of an untracked file in the worktree, which only
+    a new run of the patches removes.
+    """
+    return os.path.join(self.worktree_dir, 'marker')
+
+  def testAppliesSeriesInWorktree(self):
+    self.assertTrue(self.Apply())
+    self.assertEqual(ReadFile(os.path.join(self.worktree_dir, 'app.js')),
+                     'one\ntwo for crosswalk\nthree\n')
+    self.assertTrue(os.path.exists(os.path.join(self.worktree_dir,
+                                                'extra.js')))
+    self.assertEqual(self.Revision('HEAD~2', self.worktree_dir),
+                     self.Revision(patch_engine.BASE_BRANCH))
+    # The checkout of the submodule is left alone.
+    self.assertEqual(ReadFile(os.path.join(self.src_dir, 'app.js')),
+                     'one\ntwo\nthree\n')
+    self.assertEqual(Git(['symbolic-ref', '--short', 'HEAD'],
+                         self.src_dir).strip(), patch_engine.BASE_BRANCH)
+
+  def testSkipsUpToDateSeries(self):
+    self.assertTrue(self.Apply())
+    head = self.Revision('HEAD', self.worktree_dir)
+    WriteFile(self.Marker(), 'kept\n')
+    self.assertTrue(self.Apply())
+    self.assertTrue(os.path.exists(self.Marker()))
+    self.assertEqual(self.Revision('HEAD', self.worktree_dir), head)
+
+  def testReappliesOnNewBase(self):
+    self.assertTrue(self.Apply())
+    WriteFile(self.Marker(), 'removed\n')
+    self.Commit('other.js', 'other\n', 'Upstream change')
+    self.assertTrue(self.Apply())
+    self.assertFalse(os.path.exists(self.Marker()))
+    self.assertEqual(self.Revision('HEAD~2', self.worktree_dir),
+                     self.Revision(patch_engine.BASE_BRANCH))
+    self.assertTrue(os.path.exists(os.path.join(self.worktree_dir,
+                                                'other.js')))
+
+  def testReappliesChangedSeries(self):
+    self.assertTrue(self.Apply())
+    self.assertTrue(self.Apply(self.patches[:1]))
+    self.assertFalse(os.path.exists(os.path.join(self.worktree_dir,
+                                                 'extra.js')))
+    self.assertEqual(self.Revision('HEAD~1', self.worktree_dir),
+                     self.Revision(patch_engine.BASE_BRANCH))
+
+  def testRecoversFromFailedSeries(self):
+    bad_patch = os.path.join(self.temp_dir, 'bad.patch')
+    WriteFile(bad_patch, ReadFile(self.patches[0]).replace(
+        '-two\n', '-missing line\n'))
+    self.assertFalse(self.Apply([bad_patch]))
+    self.assertFalse(os.path.exists(self.worktree_dir + '.patchset'))
+    self.assertTrue(self.Apply())
+    self.assertEqual(ReadFile(os.path.join(self.worktree_dir, 'app.js')),
+                     'one\ntwo for crosswalk\nthree\n')
+
+  def testRecreatesRemovedWorktree(self):
+    self.assertTrue(self.Apply())
+    shutil.rmtree(self.worktree_dir)
+    self.assertTrue(self.Apply())
+    self.assertTrue(os.path.exists(os.path.join(self.worktree_dir,
+                                                'extra.js')))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,848 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Fetches, builds and packages the 01.org webapps as a pipeline of tasks.
+
+Every app goes through these stages:
+  fetch   : clones the app, or updates its clone, through fetch_webapps.
+  install : npm install and bower install.
+  grunt   : grunt xpk, builds the app into build/xpk.
+  optimize: with --optimize-assets only, optimizes the assets of build/xpk
+            into build/optimized through asset_optimizer, which is then
+            packaged instead.
+  apk     : make_apk.py, packages build/xpk into apks/.
+  xpk     : make_xpk.py, packages build/xpk into xpks/.
+A task only waits for the stages it depends on, so different apps, and the
+apk and xpk stages of one app, run at the same time. The xpk stages are
+batched instead: once every app is built, the ones which changed are
+packaged by a single make_xpk.py --batch run, which loads PyCrypto and
+every key once. The inputs and outputs of a stage are recorded when it
+succeeds, and the stage is skipped while both stay the same.
+
+npm, bower, grunt, make_apk.py and make_xpk.py can be replaced by any
+command, such as stubs in tests. Their output is streamed to out/logs, one
+log per app, as they run.
+
+Sample usage from shell script:
+Fetch, build and package all 01.org webapps
+    python webapps_pipeline.py
+Only the annex and go apps, 8 tasks at a time
+    python webapps_pipeline.py --jobs=8 webapps-annex webapps-go
+Only package the already built apps for android
+    python webapps_pipeline.py --no-fetch --only=apk
+Run every stage even if nothing changed
+    python webapps_pipeline.py --force
+Use stub tools
+    python webapps_pipeline.py --npm=true --bower=true --grunt=./fake_grunt
+Install the dependencies of every app, even if another app has the same ones
+    python webapps_pipeline.py --no-dependency-cache
+Minify the JS, CSS and HTML and recompress the PNGs of the apps
+    python webapps_pipeline.py --optimize-assets=minify,png
+Compress every file of the XPKs, instead of reusing the compressed files of
+other apps and runs
+    python webapps_pipeline.py --no-xpk-blob-store
+Print the files which are in the XPKs of several apps, by size
+    python webapps_pipeline.py --duplicates
+Only print the end of the output of failed commands, and stop commands
+which take more than 10 minutes
+    python webapps_pipeline.py --quiet --timeout=600
+"""
+
+import glob
+import hashlib
+import json
+import multiprocessing
+import optparse
+import os
+import shlex
+import shutil
+import sys
+import tempfile
+import traceback
+
+from multiprocessing.pool import ThreadPool
+try:
+  import Queue as queue
+except ImportError:
+  import queue
+
+import android.build_output
+import android.build_telemetry
+import android.process_runner
+import asset_optimizer
+import dependency_cache
+import fetch_webapps
+
+WEBAPPS = [
+  'webapps-annex',
+  'webapps-bubblewrap',
+  'webapps-countingbeads',
+  'webapps-flashcards',
+  'webapps-go',
+  'webapps-hangonman',
+  'webapps-make-a-monster',
+  'webapps-mancala',
+  'webapps-memory-game-older-kids',
+  'webapps-memory-match',
+  'webapps-numeroo',
+  'webapps-rabbit',
+  'webapps-scientific-calculator',
+  'webapps-shopping-list',
+  'webapps-slider-puzzle',
+  'webapps-sweetspot',
+  'webapps-tenframe',
+  'webapps-todo-list',
+  'webapps-wordswarm',
+]
+WEBAPPS_BASE_URL = 'https://github.com/01org/'
+
+STAGES = ('fetch', 'install', 'grunt', 'optimize', 'apk', 'xpk')
+
+# Top level dirs of an app which are not inputs of its grunt build.
+_GENERATED_DIRS = frozenset(['build', 'node_modules', 'bower_components'])
+# How often the pipeline checks for ctrl-c while tasks run.
+_POLL_SECONDS = 0.5
+# The compressed files of the XPKs, shared by all runs, like in make_xpk.py.
+DEFAULT_XPK_BLOB_STORE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                          'crosswalk-demos', 'xpk-blobs')
+# The log of the make_xpk.py run of the batched xpk stages.
+_XPK_BATCH_LOG = 'xpk_batch'
+# The log of the make_xpk.py run which reports the duplicated files.
+_XPK_DUPLICATES_LOG = 'xpk_duplicates'
+# make_xpk.py --batch prints it with the output of every failed package.
+_XPK_FAILED_PREFIX = 'Failed to generate '
+
+
+def RunProcess(tools, command, cwd, app):
+  """Runs command, a list, in cwd with tools.runner, logging its output
+  as the output of app. The end of the output is printed if the command
+  fails and the output was not printed as it ran.
+
+  Returns the Process of the command, or None if it could not be started.
+  """
+  try:
+    process = tools.runner.Run(command, cwd, app)
+  except OSError as e:
+    print ('[Error]: Failed to run ' + command[0] + ': ' + str(e))
+    return None
+  if process.Succeeded():
+    return process
+  if not tools.runner.echo and process.tail:
+    tag = '[' + app + ']: '
+    print (tag + tag.join(process.tail).rstrip('\n'))
+  print ('[Error]: ' + os.path.basename(command[0]) + ' ' + process.Status() +
+         ', see ' + tools.runner.GetLogPath(app))
+  return process
+
+
+def RunCommand(tools, command, cwd, app):
+  """Runs command like RunProcess. Returns whether it succeeded."""
+  process = RunProcess(tools, command, cwd, app)
+  return bool(process and process.Succeeded())
+
+
+def ReadPackageInfo(app_dir):
+  """Returns the name and version in the package.json of app_dir."""
+  package_file = open(os.path.join(app_dir, 'package.json'), 'r')
+  try:
+    package = json.load(package_file)
+  finally:
+    package_file.close()
+  return package['name'], package['version']
+
+
+def _HashFileInto(sha, path):
+  input_file = open(path, 'rb')
+  try:
+    while True:
+      chunk = input_file.read(1024 * 1024)
+      if not chunk:
+        break
+      sha.update(chunk)
+  finally:
+    input_file.close()
+
+
+def HashInputs(paths, exclude=frozenset()):
+  """Returns the hash of the names and contents of paths. Dirs are hashed
+  with all their files, except .git and the top level dirs in exclude.
+  """
+  sha = hashlib.sha1()
+  for path in paths:
+    sha.update(('path:' + path + '\n').encode('utf-8'))
+    if os.path.isfile(path):
+      _HashFileInto(sha, path)
+    elif os.path.isdir(path):
+      for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(name for name in dirs if name != '.git' and
+                         not (root == path and name in exclude))
+        for name in sorted(files):
+          file_path = os.path.join(root, name)
+          sha.update(('file:' + os.path.relpath(file_path, path) +
+                      '\n').encode('utf-8'))
+          _HashFileInto(sha, file_path)
+    else:
+      sha.update(b'missing\n')
+  return sha.hexdigest()
+
+
+def StatOutputs(paths):
+  """Returns the size and mtime of every output path, None for missing ones.
+
+  The outputs are not hashed, an output changes when it is rewritten.
+  """
+  stats = []
+  for path in paths:
+    if os.path.exists(path):
+      st = os.stat(path)
+      stats.append([path, st.st_size, st.st_mtime])
+    else:
+      stats.append([path, None, None])
+  return stats
+
+
+class Task(object):
+  """
+  A stage of an app.
+
+  app     : the app the task belongs to.
+  stage   : the name of the stage.
+  action  : a function running the task, returns True on success.
+  deps    : the tasks which must succeed first. Deps which are not part of
+            the pipeline are taken as done.
+  inputs  : a function returning the input paths, or None to always run.
+  outputs : a function returning the output paths.
+  exclude : the top level dirs of the inputs which are not hashed.
+  batch   : a function running the task together with the other tasks of
+            the same batch, instead of action. It is called once all of
+            them are ready, with the ones which are not up to date, and
+            returns whether each one succeeded.
+  """
+  def __init__(self, app, stage, action, deps=(), inputs=None,
+               outputs=lambda: [], exclude=frozenset(), batch=None):
+    self.app = app
+    self.stage = stage
+    self.action = action
+    self.deps = list(deps)
+    self.inputs = inputs
+    self.outputs = outputs
+    self.exclude = exclude
+    self.batch = batch
+
+
+class Pipeline(object):
+  """
+  Runs tasks in the order of their deps.
+
+  stamp_dir : where the inputs and outputs of succeeded tasks are recorded.
+  telemetry : a BuildTelemetry recording a phase for every task run.
+  """
+  def __init__(self, stamp_dir, telemetry=None):
+    self.stamp_dir_ = stamp_dir
+    self.telemetry_ = telemetry or android.build_telemetry.BuildTelemetry()
+    self.tasks_ = []
+
+  def AddTask(self, task):
+    self.tasks_.append(task)
+    return task
+
+  def __StampFile(self, task):
+    return os.path.join(self.stamp_dir_, task.app + '.' + task.stage + '.json')
+
+  def __CheckStamp(self, task, force):
+    """Returns whether task is up to date, and the stamp it gets if it
+    succeeds. The stamp of a task which is not up to date is removed.
+    """
+    stamp = None
+    stamp_file = self.__StampFile(task)
+    if task.inputs:
+      stamp = {
+        'inputs': HashInputs(task.inputs(), task.exclude),
+        'outputs': StatOutputs(task.outputs()),
+      }
+      if not force and os.path.exists(stamp_file):
+        stamp_fileobj = open(stamp_file, 'r')
+        try:
+          up_to_date = json.load(stamp_fileobj) == stamp
+        except ValueError:
+          up_to_date = False
+        finally:
+          stamp_fileobj.close()
+        if up_to_date:
+          print ('[' + task.app + ']: ' + task.stage + ' is up to date.')
+          return True, stamp
+    if os.path.exists(stamp_file):
+      os.remove(stamp_file)
+    return False, stamp
+
+  def __Finish(self, task, succeed, stamp):
+    """Records the stamp of task if it succeeded, and returns its result."""
+    if not succeed:
+      print ('[Error]: ' + task.stage + ' of ' + task.app + ' failed.')
+      return 'failed'
+    if stamp:
+      stamp['outputs'] = StatOutputs(task.outputs())
+      stamp_fileobj = open(self.__StampFile(task), 'w')
+      json.dump(stamp, stamp_fileobj)
+      stamp_fileobj.close()
+    return 'done'
+
+  def __RunTask(self, task, force):
+    """Runs task unless it is up to date. Returns a list of the task and its
+    result.
+    """
+    try:
+      up_to_date, stamp = self.__CheckStamp(task, force)
+      if up_to_date:
+        return [(task, 'skipped')]
+      print ('[' + task.app + ']: Running ' + task.stage + '.')
+      with self.telemetry_.Phase(task.app, task.stage):
+        succeed = task.action()
+      return [(task, self.__Finish(task, succeed, stamp))]
+    except Exception:
+      print ('[Error]: ' + task.stage + ' of ' + task.app + ' failed.')
+      traceback.print_exc()
+      return [(task, 'failed')]
+
+  def __RunBatch(self, tasks, force):
+    """Runs the tasks of a batch which are not up to date with one call of
+    their batch function. Returns a list of every task and its result.
+    """
+    results = []
+    stale = []
+    try:
+      for task in tasks:
+        up_to_date, stamp = self.__CheckStamp(task, force)
+        if up_to_date:
+          results.append((task, 'skipped'))
+        else:
+          stale.append((task, stamp))
+      if not stale:
+        return results
+      for task, _ in stale:
+        print ('[' + task.app + ']: Running ' + task.stage + ' in a batch of '
+               '%d.' % len(stale))
+      with self.telemetry_.Phase('', stale[0][0].stage):
+        succeeded = tasks[0].batch([task for task, _ in stale])
+      for (task, stamp), succeed in zip(stale, succeeded):
+        results.append((task, self.__Finish(task, succeed, stamp)))
+      return results
+    except Exception:
+      traceback.print_exc()
+      done = set(task for task, _ in results)
+      for task in tasks:
+        if task not in done:
+          print ('[Error]: ' + task.stage + ' of ' + task.app + ' failed.')
+          results.append((task, 'failed'))
+      return results
+
+  def Run(self, jobs, force=False):
+    """Runs the tasks, up to jobs at a time.
+
+    Returns the result of every task in a dict: 'done', 'skipped', 'failed',
+    or 'blocked' if one of its deps did not succeed.
+    """
+    if not os.path.exists(self.stamp_dir_):
+      os.makedirs(self.stamp_dir_)
+    tasks = set(self.tasks_)
+    pending = list(self.tasks_)
+    # The ready tasks of every batch, until all tasks of the batch are.
+    batches = {}
+    results = {}
+    finished = queue.Queue()
+    running = 0
+    pool = ThreadPool(jobs)
+    try:
+      while pending or batches or running:
+        for task in list(pending):
+          states = [results.get(dep) for dep in task.deps if dep in tasks]
+          if 'failed' in states or 'blocked' in states:
+            pending.remove(task)
+            results[task] = 'blocked'
+          elif None not in states:
+            pending.remove(task)
+            if task.batch:
+              batches.setdefault(task.batch, []).append(task)
+              continue
+            running += 1
+            pool.apply_async(self.__RunTask, (task, force),
+                             callback=finished.put)
+        for batch, batch_tasks in list(batches.items()):
+          if not any(task.batch == batch for task in pending):
+            del batches[batch]
+            running += 1
+            pool.apply_async(self.__RunBatch, (batch_tasks, force),
+                             callback=finished.put)
+        if running:
+          try:
+            # Waits with a timeout can be interrupted by ctrl-c.
+            task_results = finished.get(True, _POLL_SECONDS)
+          except queue.Empty:
+            continue
+          running -= 1
+          results.update(task_results)
+    except KeyboardInterrupt:
+      # The commands are in their own process groups, ctrl-c does not
+      # reach them.
+      android.process_runner.CancelAll()
+      raise
+    finally:
+      pool.close()
+      pool.join()
+    return results
+
+
+class Tools(object):
+  """The commands run by the stages, each a list of arguments, and the
+  ProcessRunner they are run with.
+  """
+  def __init__(self, options):
+    self.npm = shlex.split(options.npm)
+    self.bower = shlex.split(options.bower)
+    self.grunt = shlex.split(options.grunt)
+    self.make_apk = shlex.split(options.make_apk)
+    self.make_xpk = shlex.split(options.make_xpk)
+    self.template_dir = options.template_dir
+    self.runner = android.process_runner.ProcessRunner(
+        options.log_dir, options.timeout, echo=not options.quiet)
+
+
+def RunInstall(tools, app_dir, app):
+  if not RunCommand(tools, tools.npm + ['install'], app_dir, app):
+    return False
+  return RunCommand(tools, tools.bower + ['install'], app_dir, app)
+
+
+def Install(tools, app_dir, app, cache=None):
+  """Installs the npm and bower dependencies of app, or restores them from
+  cache if another app with the same dependencies installed them already.
+  """
+  if not cache:
+    return RunInstall(tools, app_dir, app)
+  key = dependency_cache.ComputeDependencyKey(app_dir,
+                                              [tools.npm, tools.bower])
+  with cache.Lock(key):
+    if cache.Restore(key, app_dir) is not None:
+      print ('[' + app + ']: Restored the dependencies ' + key[:8] +
+             ' from the cache.')
+      return True
+    # They may be restored from another entry, which npm and bower would
+    # change in place.
+    dependency_cache.RemoveDependencyDirs(app_dir)
+    if not RunInstall(tools, app_dir, app):
+      return False
+    cache.Store(key, app_dir)
+  return True
+
+
+def Grunt(tools, app_dir, app):
+  if not RunCommand(tools, tools.grunt + ['xpk'], app_dir, app):
+    return False
+  if not os.path.isdir(os.path.join(app_dir, 'build', 'xpk')):
+    print ('[Error]: grunt did not build ' + app + ' into build/xpk.')
+    return False
+  return True
+
+
+def GetApkPath(apks_dir, app_dir):
+  name, version = ReadPackageInfo(app_dir)
+  return os.path.join(apks_dir, '_%s_%s.apk' % (name, version))
+
+
+def GetXpkPath(xpks_dir, app_dir):
+  name, version = ReadPackageInfo(app_dir)
+  return os.path.join(xpks_dir, '%s_%s.xpk' % (name, version))
+
+
+def OptimizeAssets(app_dir, app, root, stages, cache=None):
+  """Writes the app built into build/xpk to root with its assets optimized
+  by stages, and prints how much smaller they got.
+  """
+  report = asset_optimizer.OptimizeApp(os.path.join(app_dir, 'build', 'xpk'),
+                                       root, stages, cache)
+  print (asset_optimizer.FormatReport(app, report))
+  return True
+
+
+def PackageApk(tools, app_dir, app, apk_path, root):
+  """Runs make_apk.py in a copy of the template, so that several apps can be
+  packaged at the same time, and moves the APK to apk_path. root is the dir
+  of the built app.
+  """
+  name, _ = ReadPackageInfo(app_dir)
+  temp_dir = tempfile.mkdtemp(prefix=app + '-')
+  try:
+    template_dir = os.path.join(temp_dir, 'xwalk_app_template')
+    shutil.copytree(tools.template_dir, template_dir, symlinks=True)
+    command = tools.make_apk + [
+        '--mode=embedded', '--fullscreen', '--enable-remote-debugging',
+        '--package=org.org01.webapps.' + app.replace('webapps-', '', 1),
+        '--name=_' + name, '--icon=' + os.path.join(root, 'icon_128.png'),
+        '--app-root=' + root, '--app-local-path=index.html']
+    if not RunCommand(tools, command, template_dir, app):
+      return False
+    # The APK name depends on the template, like in android_build_app.
+    apks = android.build_output.FindApks(template_dir, '_' + name)
+    if not apks:
+      print ('[Error]: Can\'t find the APK of ' + app + '.')
+      return False
+    built_apk = apks[sorted(apks)[0]]
+    # Rename within apks/, a half written APK is never published.
+    temp_apk = apk_path + '.tmp'
+    shutil.move(built_apk, temp_apk)
+    os.rename(temp_apk, apk_path)
+    return True
+  finally:
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _WriteXpkBatch(packages):
+  """Writes packages, (root, key_file, xpk_path) tuples, to a new make_xpk.py
+  batch file, and returns its path.
+  """
+  fd, batch_path = tempfile.mkstemp(prefix='xpk-batch-', suffix='.txt')
+  batch_file = os.fdopen(fd, 'w')
+  for root, key_file, xpk_path in packages:
+    batch_file.write('%s %s %s\n' % (root + os.sep, key_file, xpk_path))
+  batch_file.close()
+  return batch_path
+
+
+def PackageXpks(tools, packages, jobs, blob_store_dir=None):
+  """Packages all of packages, (root, key_file, xpk_path) tuples, with a
+  single make_xpk.py --batch run. It runs in reproducible mode, so that an
+  unchanged app gives the same XPK bytes and the published file is left
+  alone. Compressed files are shared through the blob store in
+  blob_store_dir, when given.
+
+  Returns whether each package was built.
+  """
+  batch_path = _WriteXpkBatch(packages)
+  try:
+    command = tools.make_xpk + ['--reproducible', '--jobs=%d' % jobs,
+                                '--batch', batch_path]
+    if blob_store_dir:
+      command.append('--blob-store-dir=' + blob_store_dir)
+    process = RunProcess(tools, command, None, _XPK_BATCH_LOG)
+  finally:
+    os.remove(batch_path)
+  if not process:
+    return [False] * len(packages)
+  if process.Succeeded():
+    return [True] * len(packages)
+  failed = set(line[len(_XPK_FAILED_PREFIX):].strip()
+               for line in process.tail
+               if line.startswith(_XPK_FAILED_PREFIX))
+  if process.returncode != 1 or not failed:
+    # It did not get to the end of the batch.
+    return [False] * len(packages)
+  return [xpk_path not in failed for _, _, xpk_path in packages]
+
+
+class XpkBatch(object):
+  """
+  The batch function of the xpk stages, see Task. The apps of the stages
+  which run are packaged together by PackageXpks.
+
+  tools          : the Tools to run make_xpk.py with.
+  xpks_dir       : the dir of the XPKs.
+  jobs           : the number of packages built at a time.
+  blob_store_dir : the dir of the compressed files shared by all runs, or
+                   None.
+  """
+  def __init__(self, tools, xpks_dir, jobs, blob_store_dir=None):
+    self.tools_ = tools
+    self.xpks_dir_ = xpks_dir
+    self.jobs_ = jobs
+    self.blob_store_dir_ = blob_store_dir
+    self.apps_ = {}
+
+  def AddApp(self, app, app_dir, root):
+    """Adds app, cloned into app_dir and built into root."""
+    self.apps_[app] = (app_dir, root)
+
+  def __Package(self, app):
+    app_dir, root = self.apps_[app]
+    # The name and version are only known once the app is built.
+    return (root, os.path.join(app_dir, 'data', 'tizen-xpk', 'signature'),
+            GetXpkPath(self.xpks_dir_, app_dir))
+
+  def __call__(self, tasks):
+    return PackageXpks(self.tools_,
+                       [self.__Package(task.app) for task in tasks],
+                       self.jobs_, self.blob_store_dir_)
+
+  def ReportDuplicates(self):
+    """Prints the files which are in the packages of several of the apps
+    built so far, with make_xpk.py --duplicates-only.
+
+    Returns whether the report was made.
+    """
+    packages = [self.__Package(app) for app in sorted(self.apps_)
+                if os.path.isdir(self.apps_[app][1])]
+    if len(packages) < 2:
+      return True
+    batch_path = _WriteXpkBatch(packages)
+    try:
+      process = RunProcess(self.tools_,
+                           self.tools_.make_xpk + [
+                               '--jobs=%d' % self.jobs_, '--batch', batch_path,
+                               '--duplicates-only'],
+                           None, _XPK_DUPLICATES_LOG)
+    finally:
+      os.remove(batch_path)
+    if not process or not process.Succeeded():
+      return False
+    print ('Duplicated files: see ' +
+           self.tools_.runner.GetLogPath(_XPK_DUPLICATES_LOG))
+    return True
+
+
+def FindClonedApps(clones_dir):
+  return sorted(os.path.basename(os.path.dirname(path)) for path in
+                glob.glob(os.path.join(clones_dir, 'webapps-*', '')))
+
+
+def AddAppTasks(pipeline, options, tools, app, url=None, cache=None,
+                asset_cache=None, xpk_batch=None):
+  """Adds the stages of app to pipeline. Only the stages in options.only
+  are added, the app is fetched from url when given. The dependencies are
+  shared through cache, a DependencyCache, and the optimized assets through
+  asset_cache, an AssetCache, when given. The xpk stage is run by
+  xpk_batch, an XpkBatch shared by the apps, or by one of its own.
+  """
+  app_dir = os.path.join(options.clones_dir, app)
+  build_dir = os.path.join(app_dir, 'build', 'xpk')
+  # The dir which is packaged.
+  package_dir = build_dir
+  if options.optimize_assets:
+    package_dir = os.path.join(app_dir, 'build', 'optimized')
+  key_file = os.path.join(app_dir, 'data', 'tizen-xpk', 'signature')
+  package_json = os.path.join(app_dir, 'package.json')
+  bower_json = os.path.join(app_dir, 'bower.json')
+  tasks = {}
+
+  def Add(stage, action, deps=(), **kwargs):
+    if stage in options.only:
+      tasks[stage] = pipeline.AddTask(Task(app, stage, action, deps, **kwargs))
+
+  def Deps(*stages):
+    return [tasks[stage] for stage in stages if stage in tasks]
+
+  if url:
+    Add('fetch', lambda: fetch_webapps.CloneRepos(
+        [url], options.clones_dir, options.mirror_dir, 1, tools.runner) == [])
+  Add('install', lambda: Install(tools, app_dir, app, cache), Deps('fetch'),
+      inputs=lambda: [package_json, bower_json] + [
+          os.path.join(app_dir, name)
+          for name in dependency_cache.INSTALL_FILES],
+      outputs=lambda: [os.path.join(app_dir, name)
+                       for name in dependency_cache.DEPENDENCY_DIRS])
+  Add('grunt', lambda: Grunt(tools, app_dir, app), Deps('fetch', 'install'),
+      inputs=lambda: [app_dir], outputs=lambda: [build_dir],
+      exclude=_GENERATED_DIRS)
+  if options.optimize_assets:
+    Add('optimize', lambda: OptimizeAssets(app_dir, app, package_dir,
+                                           options.optimize_assets,
+                                           asset_cache),
+        Deps('fetch', 'grunt'),
+        inputs=lambda: [build_dir], outputs=lambda: [package_dir])
+  Add('apk', lambda: PackageApk(tools, app_dir, app,
+                                GetApkPath(options.apks_dir, app_dir),
+                                package_dir),
+      Deps('fetch', 'grunt', 'optimize'),
+      inputs=lambda: [package_dir, package_json,
+                      os.path.join(tools.template_dir, 'make_apk.py')],
+      outputs=lambda: [GetApkPath(options.apks_dir, app_dir)])
+  if not xpk_batch:
+    xpk_batch = XpkBatch(tools, options.xpks_dir, 1)
+  xpk_batch.AddApp(app, app_dir, package_dir)
+  Add('xpk', None, Deps('fetch', 'grunt', 'optimize'),
+      inputs=lambda: [package_dir, key_file, package_json],
+      outputs=lambda: [GetXpkPath(options.xpks_dir, app_dir)],
+      batch=xpk_batch)
+
+
+def main():
+  root_dir = os.path.abspath(os.path.dirname(__file__))
+  parser = optparse.OptionParser(usage='%prog [options] [app ...]')
+  parser.add_option('--clones-dir', action='store', dest='clones_dir',
+      default=os.environ.get('WEBAPPSCLONESDIR',
+                             os.path.join(root_dir, '01webapps')),
+      help='The directory the apps are cloned into. '
+           'Such as: --clones-dir=01webapps')
+  parser.add_option('--apks-dir', action='store', dest='apks_dir',
+      default=os.path.join(root_dir, 'apks'),
+      help='The directory of the APKs. Such as: --apks-dir=apks')
+  parser.add_option('--xpks-dir', action='store', dest='xpks_dir',
+      default=os.path.join(root_dir, 'xpks'),
+      help='The directory of the XPKs. Such as: --xpks-dir=xpks')
+  parser.add_option('-j', '--jobs', action='store', dest='jobs', type='int',
+      default=multiprocessing.cpu_count(),
+      help='The number of tasks run at a time. Such as: --jobs=8')
+  parser.add_option('--only', action='store', dest='only',
+      default=','.join(STAGES),
+      help='The stages to run, the others are taken as done. '
+           'Such as: --only=apk,xpk')
+  parser.add_option('--no-fetch', action='store_true', dest='no_fetch',
+      default=False,
+      help='Use the apps which are cloned already.')
+  parser.add_option('--force', action='store_true', dest='force',
+      default=False,
+      help='Run every stage, even if its inputs and outputs did not change.')
+  parser.add_option('--base-url', action='store', dest='base_url',
+      default=WEBAPPS_BASE_URL,
+      help='Where the app repositories are fetched from. '
+           'Such as: --base-url=git://mirror.example.com/01org')
+  parser.add_option('--mirror-dir', action='store', dest='mirror_dir',
+      default=fetch_webapps.DEFAULT_MIRROR_DIR,
+      help='The directory of the git mirrors. '
+           'Such as: --mirror-dir=/var/cache/mirrors')
+  parser.add_option('--no-dependency-cache', action='store_true',
+      dest='no_dependency_cache', default=False,
+      help='Run npm install and bower install in every app, instead of '
+           'sharing the dependencies of apps which have the same ones.')
+  parser.add_option('--dependency-cache-dir', action='store',
+      dest='dependency_cache_dir',
+      default=dependency_cache.DEFAULT_CACHE_DIR,
+      help='The directory of the shared dependencies. '
+           'Such as: --dependency-cache-dir=/var/cache/deps')
+  parser.add_option('--no-xpk-blob-store', action='store_true',
+      dest='no_xpk_blob_store', default=False,
+      help='Compress every file of the XPKs, instead of reusing the '
+           'compressed files of other apps and runs.')
+  parser.add_option('--xpk-blob-store-dir', action='store',
+      dest='xpk_blob_store_dir', default=DEFAULT_XPK_BLOB_STORE_DIR,
+      help='The directory of the compressed files of the XPKs. '
+           'Such as: --xpk-blob-store-dir=/var/cache/xpk-blobs')
+  parser.add_option('--duplicates', action='store_true', dest='duplicates',
+      default=False,
+      help='Print the files which are in the XPKs of several apps, by size, '
+           'once the pipeline ran.')
+  parser.add_option('--npm', action='store', dest='npm', default='npm',
+      help='The npm command. Such as: --npm=/usr/local/bin/npm')
+  parser.add_option('--bower', action='store', dest='bower',
+      default=os.environ.get('BOWER', os.path.join(
+          root_dir, 'node_modules', 'bower', 'bin', 'bower')),
+      help='The bower command. Such as: --bower=bower')
+  parser.add_option('--grunt', action='store', dest='grunt',
+      default=os.environ.get('GRUNT', os.path.join(
+          root_dir, 'node_modules', 'grunt-cli', 'bin', 'grunt')),
+      help='The grunt command. Such as: --grunt=grunt')
+  parser.add_option('--make-apk', action='store', dest='make_apk',
+      default='./make_apk.py',
+      help='The make_apk command, run in a copy of the template. '
+           'Such as: --make-apk="python ./make_apk.py"')
+  parser.add_option('--template-dir', action='store', dest='template_dir',
+      default=os.path.join(root_dir, 'android', 'xwalk_app_template'),
+      help='The xwalk app template. '
+           'Such as: --template-dir=android/xwalk_app_template')
+  parser.add_option('--make-xpk', action='store', dest='make_xpk',
+      default=os.path.join(root_dir, 'bin', 'make_xpk.py'),
+      help='The make_xpk command. Such as: --make-xpk="python make_xpk.py"')
+  parser.add_option('--optimize-assets', action='store',
+      dest='optimize_assets',
+      help='Optimize the assets of the apps before packaging them, with the '
+           'comma separated asset_optimizer stages, of ' +
+           ', '.join(asset_optimizer.STAGES) + ', default or all. '
+           'Run with --force after changing them. '
+           'Such as: --optimize-assets=minify,png')
+  parser.add_option('--no-asset-cache', action='store_true',
+      dest='no_asset_cache', default=False,
+      help='Optimize every asset, even if it was optimized before.')
+  parser.add_option('--log-dir', action='store', dest='log_dir',
+      default=os.path.join(root_dir, 'out', 'logs'),
+      help='The directory of the logs of the commands, one per app. '
+           'Such as: --log-dir=out/logs')
+  parser.add_option('--timeout', action='store', dest='timeout',
+      type='float',
+      help='Stop every command after the seconds. Such as: --timeout=600')
+  parser.add_option('-q', '--quiet', action='store_true', dest='quiet',
+      default=False,
+      help='Only print the end of the output of the commands which fail, '
+           'instead of all of it as it comes.')
+  parser.add_option('--report', action='store', dest='report',
+      help='Write the time and resource usage of every stage to the '
+           'file, one JSON object per line. Such as: --report=pipeline.jsonl')
+  parser.add_option('--trace', action='store', dest='trace',
+      help='Write the stages as a Chrome trace, to be opened in '
+           'chrome://tracing. Such as: --trace=pipeline_trace.json')
+  options, apps = parser.parse_args()
+  options.only = options.only.split(',')
+  for stage in options.only:
+    if stage not in STAGES:
+      parser.error('Unknown stage ' + stage + ', the stages are ' +
+                   ', '.join(STAGES) + '.')
+  if options.optimize_assets:
+    try:
+      options.optimize_assets = asset_optimizer.ParseStages(
+          options.optimize_assets)
+    except ValueError as e:
+      parser.error(str(e))
+  for path in ('clones_dir', 'apks_dir', 'xpks_dir', 'template_dir',
+               'log_dir'):
+    setattr(options, path, os.path.abspath(getattr(options, path)))
+  for out_dir in (options.clones_dir, options.apks_dir, options.xpks_dir):
+    if not os.path.exists(out_dir):
+      os.makedirs(out_dir)
+
+  urls = {}
+  if not options.no_fetch:
+    urls = dict((app, options.base_url.rstrip('/') + '/' + app + '.git')
+                for app in WEBAPPS)
+  if not apps:
+    apps = sorted(urls) or FindClonedApps(options.clones_dir)
+
+  telemetry = android.build_telemetry.BuildTelemetry()
+  pipeline = Pipeline(os.path.join(options.clones_dir, '.pipeline'), telemetry)
+  tools = Tools(options)
+  cache = None
+  if not options.no_dependency_cache:
+    cache = dependency_cache.DependencyCache(options.dependency_cache_dir)
+  asset_cache = None
+  if not options.no_asset_cache:
+    asset_cache = asset_optimizer.AssetCache()
+  xpk_blob_store_dir = None
+  if not options.no_xpk_blob_store:
+    xpk_blob_store_dir = os.path.abspath(options.xpk_blob_store_dir)
+  xpk_batch = XpkBatch(tools, options.xpks_dir, max(options.jobs, 1),
+                       xpk_blob_store_dir)
+  for app in apps:
+    if not options.no_fetch and app not in urls:
+      print ('[Error]: ' + app + ' is not a known 01.org webapp.')
+      return 1
+    AddAppTasks(pipeline, options, tools, app, urls.get(app), cache,
+                asset_cache, xpk_batch)
+  failed = False
+  try:
+    results = pipeline.Run(max(options.jobs, 1), options.force)
+    if options.duplicates and not xpk_batch.ReportDuplicates():
+      failed = True
+  finally:
+    tools.runner.Close()
+
+  build_result = '\nBuild Result:\n'
+  for app in apps:
+    app_results = dict((task.stage, result) for task, result in results.items()
+                       if task.app == app)
+    bad_stages = [stage for stage in STAGES
+                  if app_results.get(stage) in ('failed', 'blocked')]
+    if bad_stages:
+      failed = True
+      build_result += app + ' :Failed, stage = ' + bad_stages[0] + '\n'
+    else:
+      build_result += app + ' :OK\n'
+  print (build_result)
+  if options.report:
+    telemetry.WriteReport(options.report)
+  if options.trace:
+    telemetry.WriteTrace(options.trace)
+  return failed and 1 or 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013 Intel Corporation. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""
+Tests webapps_pipeline.py on two apps, with stubs as npm, bower, grunt,
+make_apk.py and make_xpk.py.
+
+Sample usage from shell script:
+python -m unittest webapps_pipeline_unittest
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import webapps_pipeline
+
+APPS = ('webapps-one', 'webapps-two')
+
+# Every tool, told by its first argument. It records its calls in calls.log
+# next to it, and fails for the apps which have a fail-<tool> file.
+STUB_TOOL = r'''
+import os, shutil, sys
+tool, args = sys.argv[1], sys.argv[2:]
+
+def Record(name, cwd):
+  calls = open(os.path.join(os.path.dirname(__file__), 'calls.log'), 'a')
+  calls.write(name + ' ' + os.path.basename(cwd) + '\n')
+  calls.close()
+
+Record(tool, os.getcwd())
+options = dict(arg.split('=', 1) for arg in args if '=' in arg)
+if tool == 'npm':
+  if not os.path.isdir('node_modules'):
+    os.mkdir('node_modules')
+elif tool == 'grunt':
+  if os.path.exists('fail-grunt'):
+    sys.exit(1)
+  shutil.rmtree('build', ignore_errors=True)
+  shutil.copytree('app', os.path.join('build', 'xpk'))
+elif tool == 'make_apk':
+  shutil.copy(os.path.join(options['--app-root'], 'index.html'),
+              options['--name'] + '_x86.apk')
+elif tool == 'make_xpk':
+  failed = 0
+  for line in open(args[args.index('--batch') + 1]):
+    root, _, xpk_path = line.split()
+    app_dir = os.path.dirname(os.path.dirname(os.path.dirname(root)))
+    Record('xpk', app_dir)
+    if os.path.exists(os.path.join(app_dir, 'fail-xpk')):
+      print('Failed to generate ' + xpk_path)
+      failed = 1
+    else:
+      shutil.copy(os.path.join(root, 'index.html'), xpk_path)
+  sys.exit(failed)
+'''
+
+
+def WriteFile(path, content):
+  output = open(path, 'w')
+  output.write(content)
+  output.close()
+
+
+def ReadFile(path):
+  input_file = open(path, 'r')
+  content = input_file.read()
+  input_file.close()
+  return content
+
+
+class Options(object):
+  """The options of webapps_pipeline.main the stages use."""
+  def __init__(self, temp_dir, stub):
+    tool = sys.executable + ' ' + stub + ' '
+    self.npm = tool + 'npm'
+    self.bower = tool + 'bower'
+    self.grunt = tool + 'grunt'
+    self.make_apk = tool + 'make_apk'
+    self.make_xpk = tool + 'make_xpk'
+    self.template_dir = os.path.join(temp_dir, 'xwalk_app_template')
+    self.clones_dir = os.path.join(temp_dir, 'clones')
+    self.apks_dir = os.path.join(temp_dir, 'apks')
+    self.xpks_dir = os.path.join(temp_dir, 'xpks')
+    self.log_dir = os.path.join(temp_dir, 'logs')
+    self.mirror_dir = os.path.join(temp_dir, 'mirrors')
+    self.only = webapps_pipeline.STAGES
+    self.optimize_assets = None
+    self.timeout = None
+    self.quiet = True
+
+
+class PipelineTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    stub = os.path.join(self.temp_dir, 'stub_tool.py')
+    WriteFile(stub, STUB_TOOL)
+    self.calls_log = os.path.join(self.temp_dir, 'calls.log')
+    self.options = Options(self.temp_dir, stub)
+    os.makedirs(self.options.template_dir)
+    WriteFile(os.path.join(self.options.template_dir, 'make_apk.py'), '')
+    for out_dir in (self.options.apks_dir, self.options.xpks_dir):
+      os.makedirs(out_dir)
+    for app in APPS:
+      app_dir = self.AppDir(app)
+      os.makedirs(os.path.join(app_dir, 'app'))
+      os.makedirs(os.path.join(app_dir, 'data', 'tizen-xpk'))
+      WriteFile(os.path.join(app_dir, 'package.json'),
+                json.dumps({'name': app, 'version': '1.0.0'}))
+      WriteFile(os.path.join(app_dir, 'app', 'index.html'), app + '\n')
+      WriteFile(os.path.join(app_dir, 'data', 'tizen-xpk', 'signature'), '')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def AppDir(self, app):
+    return os.path.join(self.options.clones_dir, app)
+
+  def Run(self, force=False):
+    """Runs the pipeline of APPS. Returns the result of every stage by
+    (app, stage), and the tools which ran with the app they ran for.
+    """
+    if os.path.exists(self.calls_log):
+      os.remove(self.calls_log)
+    pipeline = webapps_pipeline.Pipeline(
+        os.path.join(self.options.clones_dir, '.pipeline'))
+    tools = webapps_pipeline.Tools(self.options)
+    xpk_batch = webapps_pipeline.XpkBatch(tools, self.options.xpks_dir, 2)
+    for app in APPS:
+      webapps_pipeline.AddAppTasks(pipeline, self.options, tools, app,
+                                   xpk_batch=xpk_batch)
+    try:
+      results = pipeline.Run(4, force)
+    finally:
+      tools.runner.Close()
+    calls = []
+    if os.path.exists(self.calls_log):
+      calls = sorted(tuple(line.split()) for line in open(self.calls_log))
+    return (dict(((task.app, task.stage), result)
+                 for task, result in results.items()), calls)
+
+  def XpkPath(self, app):
+    return os.path.join(self.options.xpks_dir, app + '_1.0.0.xpk')
+
+  def ApkPath(self, app):
+    return os.path.join(self.options.apks_dir, '_' + app + '_1.0.0.apk')
+
+  def AssertResults(self, results, expected):
+    for app in APPS:
+      for stage in ('install', 'grunt', 'apk', 'xpk'):
+        self.assertEqual(results[(app, stage)], expected[app].get(stage),
+                         '%s of %s' % (stage, app))
+
+  def testBuildsAllApps(self):
+    results, calls = self.Run()
+    done = dict(install='done', grunt='done', apk='done', xpk='done')
+    self.AssertResults(results, {'webapps-one': done, 'webapps-two': done})
+    for app in APPS:
+      self.assertEqual(ReadFile(self.ApkPath(app)), app + '\n')
+      self.assertEqual(ReadFile(self.XpkPath(app)), app + '\n')
+    # Both xpks come out of one make_xpk.py run.
+    self.assertEqual(len([call for call in calls if call[0] == 'make_xpk']),
+                     1)
+    self.assertEqual([call for call in calls if call[0] == 'xpk'],
+                     [('xpk', app) for app in APPS])
+
+  def testSkipsUnchangedApps(self):
+    self.Run()
+    results, calls = self.Run()
+    skipped = dict(install='skipped', grunt='skipped', apk='skipped',
+                   xpk='skipped')
+    self.AssertResults(results, {'webapps-one': skipped,
+                                 'webapps-two': skipped})
+    self.assertEqual(calls, [])
+
+  def testRebuildsChangedApp(self):
+    self.Run()
+    WriteFile(os.path.join(self.AppDir('webapps-one'), 'app', 'index.html'),
+              'changed\n')
+    results, calls = self.Run()
+    self.AssertResults(results, {
+        'webapps-one': dict(install='skipped', grunt='done', apk='done',
+                            xpk='done'),
+        'webapps-two': dict(install='skipped', grunt='skipped',
+                            apk='skipped', xpk='skipped')})
+    self.assertEqual([call for call in calls if call[0] == 'xpk'],
+                     [('xpk', 'webapps-one')])
+    self.assertEqual(ReadFile(self.XpkPath('webapps-one')), 'changed\n')
+    self.assertEqual(ReadFile(self.ApkPath('webapps-one')), 'changed\n')
+
+  def testRunsEverythingWhenForced(self):
+    self.Run()
+    results, calls = self.Run(force=True)
+    done = dict(install='done', grunt='done', apk='done', xpk='done')
+    self.AssertResults(results, {'webapps-one': done, 'webapps-two': done})
+    self.assertEqual([call for call in calls if call[0] == 'xpk'],
+                     [('xpk', app) for app in APPS])
+
+  def testFailedXpkOnlyFailsItsApp(self):
+    WriteFile(os.path.join(self.AppDir('webapps-one'), 'fail-xpk'), '')
+    results, _ = self.Run()
+    self.assertEqual(results[('webapps-one', 'xpk')], 'failed')
+    self.assertEqual(results[('webapps-two', 'xpk')], 'done')
+    self.assertFalse(os.path.exists(self.XpkPath('webapps-one')))
+    # Only the failed one is packaged again.
+    os.remove(os.path.join(self.AppDir('webapps-one'), 'fail-xpk'))
+    results, calls = self.Run()
+    self.assertEqual(results[('webapps-one', 'xpk')], 'done')
+    self.assertEqual(results[('webapps-two', 'xpk')], 'skipped')
+    self.assertEqual([call for call in calls if call[0] == 'xpk'],
+                     [('xpk', 'webapps-one')])
+
+  def testFailedStageBlocksItsApp(self):
+    WriteFile(os.path.join(self.AppDir('webapps-one'), 'fail-grunt'), '')
+    results, _ = self.Run()
+    self.AssertResults(results, {
+        'webapps-one': dict(install='done', grunt='failed', apk='blocked',
+                            xpk='blocked'),
+        'webapps-two': dict(install='done', grunt='done', apk='done',
+                            xpk='done')})
+
+
+if __name__ == '__main__':
+  unittest.main()